@@ -12,7 +12,20 @@ from gitTools.gitRepo import *
 from gitTools.commitHistoryToHours import *
 from gitTools.gitCommit import *
 from gitTools.gitCommits import *
+from gitTools.commitStats import *
+from gitTools.compactCommits import *
+from gitTools.pagedCommits import *
+from gitTools.gitLogQuery import *
+from gitTools.gitLogRecords import *
+from gitTools.commitIndex import *
+from gitTools.catFile import *
+from gitTools.objectStore import *
+from gitTools.commitGraph import *
+from gitTools.backends import *
+from gitTools.gitConfig import *
 from gitTools.gitRecursive import *
 from gitTools.change import *
 from gitTools.difference import *
 from gitTools.diff import *
+from gitTools.diffStats import *
+from gitTools.diffLimits import *
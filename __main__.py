@@ -76,7 +76,7 @@ def cmdline(args:typing.Iterable[str])->int:
                 copyOverProjectDefaults(r'')
                 didSomething=True
             elif av[0] in ('--grep','--gitgrep'):
-                for result in gitGrep(av[1],"."):
+                for result in gitGrep(av[1],".",useIndex=True):
                     for k,v in result.items():
                         flat=':'.join((k,str(v).replace('\n',' ')))
                         print(flat)
@@ -0,0 +1,556 @@
+"""
+Pluggable backends that actually perform git operations
+
+Everything goes through a GitBackend, so the engine can be picked
+per deployment (the git command line, libgit2 via pygit2, or a
+recording that can be replayed) and engines can be benchmarked
+against each other on identical workloads.
+
+The typed operations (log, revParse, diff, config, refs, status)
+are all built on top of run() and stream(), so a backend only
+has to provide those two, and can override the typed operations
+when it has a faster way of doing them.
+"""
+import typing
+import os
+import json
+import time
+import base64
+import threading
+import subprocess
+from paths import FilePathCompatible,asFilePath
+from gitTools.exceptions import GitException
+from gitTools.gitLogRecords import LOG_ARGS,iterLogRecords,commitFromLogRecord
+if typing.TYPE_CHECKING:
+    from gitTools.gitCommit import GitCommit
+
+
+# how often a running command checks whether it has been told to stop
+STOP_POLL_SECONDS=0.1
+
+
+class GitResult:
+    """
+    The result of running a git command
+    """
+    def __init__(self,returncode:int,stdout:bytes=b'',stderr:bytes=b''):
+        self.returncode=returncode
+        self.stdout=stdout
+        self.stderr=stderr
+
+    @property
+    def succeeded(self)->bool:
+        """
+        Did the command succeed?
+        """
+        return self.returncode==0
+
+    @property
+    def out(self)->str:
+        """
+        stdout as a string
+        """
+        return self.stdout.decode('utf-8',errors='ignore')
+
+    @property
+    def err(self)->str:
+        """
+        stderr as a string
+        """
+        return self.stderr.decode('utf-8',errors='ignore')
+
+    def check(self)->"GitResult":
+        """
+        Raise a GitException if the command failed
+        """
+        if not self.succeeded:
+            raise GitException(self.err.strip())
+        return self
+
+
+class GitBackend:
+    """
+    Base class for whatever engine performs git operations
+    """
+
+    name='abstract'
+
+    def __init__(self,localRepoPath:FilePathCompatible='.'):
+        """ """
+        self.repoPath=str(asFilePath(localRepoPath))
+
+    def run(self,
+        args:typing.Sequence[str],
+        stdin:typing.Optional[bytes]=None
+        )->GitResult:
+        """
+        Run a git command to completion
+
+        :args: the git arguments (without the "git")
+        """
+        raise NotImplementedError()
+
+    def stream(self,
+        args:typing.Sequence[str],
+        stdin:typing.Optional[bytes]=None,
+        stop:typing.Optional[threading.Event]=None
+        )->typing.Iterator[bytes]:
+        """
+        Run a git command, yielding its stdout in chunks as it is produced
+
+        :stop: when this is set, the command is killed (from any thread)
+        :raises GitException: (at the end) if the command failed
+        """
+        raise NotImplementedError()
+
+    def log(self,
+        params:typing.Iterable[str]=(),
+        stop:typing.Optional[threading.Event]=None
+        )->typing.Iterator["GitCommit"]:
+        """
+        Stream the commit log
+
+        :stop: when this is set, git is killed (see stream())
+        """
+        from gitTools.gitRemotes import githubUrl
+        githubUrlValue=githubUrl(self.repoPath)
+        chunks=self.stream(['log',*LOG_ARGS,*params],stop=stop)
+        for record in iterLogRecords(chunks):
+            yield commitFromLogRecord(record,githubUrlValue,self.repoPath)
+
+    def revParse(self,rev:str)->str:
+        """
+        Resolve a revision to an object hash
+        """
+        return self.run(['rev-parse','--verify',rev]).check().out.strip()
+
+    def diff(self,params:typing.Iterable[str]=())->str:
+        """
+        Get a diff as text
+        """
+        return self.run(['diff',*params]).check().out
+
+    def diffBytes(self,params:typing.Iterable[str]=())->bytes:
+        """
+        Get a diff, undecoded
+        """
+        return self.run(['diff',*params]).check().stdout
+
+    def config(self)->typing.Dict[str,str]:
+        """
+        Get all config values {key:value}
+        (if a key is listed more than once, the last one wins)
+        """
+        result=self.run(['config','--list','-z'])
+        ret:typing.Dict[str,str]={}
+        if not result.succeeded:
+            return ret
+        for entry in result.out.split('\0'):
+            if entry:
+                key,_,value=entry.partition('\n')
+                ret[key]=value
+        return ret
+
+    def refs(self,prefix:str='refs/')->typing.Dict[str,str]:
+        """
+        List refs starting with a prefix {refname:hash}
+        """
+        result=self.run(['for-each-ref','--format=%(objectname) %(refname)',
+            prefix]).check()
+        ret:typing.Dict[str,str]={}
+        for line in result.out.split('\n'):
+            hashRef=line.split(' ',1)
+            if len(hashRef)==2:
+                ret[hashRef[1]]=hashRef[0]
+        return ret
+
+    def status(self)->typing.List[typing.Tuple[str,str]]:
+        """
+        Get the working tree status as [(XY status code,filename)]
+        """
+        result=self.run(['status','--porcelain','-z']).check()
+        ret:typing.List[typing.Tuple[str,str]]=[]
+        entries=iter(result.out.split('\0'))
+        for entry in entries:
+            if len(entry)<4:
+                continue
+            code=entry[:2]
+            ret.append((code,entry[3:]))
+            if code[0] in 'RC':
+                # renames/copies are followed by the original name
+                next(entries,None)
+        return ret
+
+    def close(self)->None:
+        """
+        Release any resources held by this backend
+        """
+
+
+class GitCliBackend(GitBackend):
+    """
+    Performs git operations by running the git command line
+    """
+
+    name='cli'
+
+    def __init__(self,
+        localRepoPath:FilePathCompatible='.',
+        gitExecutable:str='git'):
+        """ """
+        GitBackend.__init__(self,localRepoPath)
+        self.gitExecutable=gitExecutable
+
+    def run(self,
+        args:typing.Sequence[str],
+        stdin:typing.Optional[bytes]=None
+        )->GitResult:
+        po=subprocess.Popen([self.gitExecutable,*args],cwd=self.repoPath,
+            stdin=None if stdin is None else subprocess.PIPE,
+            stdout=subprocess.PIPE,stderr=subprocess.PIPE)
+        out,err=po.communicate(stdin)
+        return GitResult(po.returncode,out,err)
+
+    def stream(self,
+        args:typing.Sequence[str],
+        stdin:typing.Optional[bytes]=None,
+        stop:typing.Optional[threading.Event]=None
+        )->typing.Iterator[bytes]:
+        from gitTools.gitLogRecords import readChunks
+        po=subprocess.Popen([self.gitExecutable,*args],cwd=self.repoPath,
+            stdin=None if stdin is None else subprocess.PIPE,
+            stdout=subprocess.PIPE,stderr=subprocess.PIPE)
+        if stdin is not None:
+            # (written from another thread, so that neither
+            # pipe can fill up and leave both sides waiting)
+            def feed()->None:
+                try:
+                    po.stdin.write(stdin) # type: ignore
+                except (BrokenPipeError,ValueError):
+                    pass
+                finally:
+                    try:
+                        po.stdin.close() # type: ignore
+                    except BrokenPipeError:
+                        pass
+            threading.Thread(target=feed,daemon=True).start()
+        # (stderr is drained from another thread too, since git can
+        # write more to it than a pipe holds before stdout ends)
+        errChunks:typing.List[bytes]=[]
+        def drain()->None:
+            try:
+                errChunks.extend(readChunks(po.stderr)) # type: ignore
+            except (OSError,ValueError):
+                pass
+        drainer=threading.Thread(target=drain,daemon=True)
+        drainer.start()
+        if stop is not None:
+            def watch()->None:
+                while po.poll() is None:
+                    if stop.wait(STOP_POLL_SECONDS):
+                        if po.poll() is None:
+                            po.kill()
+                        return
+            threading.Thread(target=watch,daemon=True).start()
+        try:
+            yield from readChunks(po.stdout) # type: ignore
+            returncode=po.wait()
+            drainer.join()
+            if returncode!=0:
+                err=b''.join(errChunks).strip()
+                raise GitException(err.decode('utf-8',errors='ignore'))
+        finally:
+            if po.poll() is None:
+                po.kill()
+                po.wait()
+            drainer.join()
+            po.stdout.close() # type: ignore
+            po.stderr.close() # type: ignore
+
+
+class Pygit2Backend(GitCliBackend):
+    """
+    Performs git operations in-process with libgit2 (via pygit2)
+    where it can, and with the git command line where it can't
+
+    Raises ImportError if pygit2 is not installed.
+    """
+
+    name='pygit2'
+
+    def __init__(self,
+        localRepoPath:FilePathCompatible='.',
+        gitExecutable:str='git'):
+        """ """
+        import pygit2 # type: ignore
+        GitCliBackend.__init__(self,localRepoPath,gitExecutable)
+        self._pygit2=pygit2
+        self._repo=pygit2.Repository(self.repoPath)
+
+    def revParse(self,rev:str)->str:
+        try:
+            return str(self._repo.revparse_single(rev).id)
+        except (KeyError,ValueError) as e:
+            raise GitException(f'Unknown revision "{rev}"') from e
+
+    def config(self)->typing.Dict[str,str]:
+        ret:typing.Dict[str,str]={}
+        for entry in self._repo.config:
+            ret[entry.name]=entry.value
+        return ret
+
+    def refs(self,prefix:str='refs/')->typing.Dict[str,str]:
+        ret:typing.Dict[str,str]={}
+        for refname in self._repo.references:
+            if refname.startswith(prefix):
+                ref=self._repo.references[refname].resolve()
+                ret[refname]=str(ref.target)
+        return ret
+
+    def status(self)->typing.List[typing.Tuple[str,str]]:
+        pygit2=self._pygit2
+        flags=(
+            (pygit2.GIT_STATUS_INDEX_NEW,'A',0),
+            (pygit2.GIT_STATUS_INDEX_MODIFIED,'M',0),
+            (pygit2.GIT_STATUS_INDEX_DELETED,'D',0),
+            (pygit2.GIT_STATUS_INDEX_RENAMED,'R',0),
+            (pygit2.GIT_STATUS_WT_MODIFIED,'M',1),
+            (pygit2.GIT_STATUS_WT_DELETED,'D',1),
+            (pygit2.GIT_STATUS_WT_RENAMED,'R',1))
+        ret:typing.List[typing.Tuple[str,str]]=[]
+        for filename,status in sorted(self._repo.status().items()):
+            if status&pygit2.GIT_STATUS_IGNORED:
+                continue
+            if status&pygit2.GIT_STATUS_WT_NEW:
+                ret.append(('??',filename))
+                continue
+            code=[' ',' ']
+            for flag,letter,column in flags:
+                if status&flag:
+                    code[column]=letter
+            ret.append((''.join(code),filename))
+        return ret
+
+    def log(self,
+        params:typing.Iterable[str]=(),
+        stop:typing.Optional[threading.Event]=None
+        )->typing.Iterator["GitCommit"]:
+        params=list(params)
+        if params:
+            # anything other than a plain walk of HEAD goes to git
+            yield from GitCliBackend.log(self,params,stop)
+            return
+        from gitTools.gitCommit import GitCommit
+        from gitTools.gitRemotes import githubUrl
+        githubUrlValue=githubUrl(self.repoPath)
+        if self._repo.head_is_unborn:
+            return
+        for c in self._repo.walk(self._repo.head.target,
+            self._pygit2.GIT_SORT_TIME):
+            commit=GitCommit(str(c.id),
+                githubUrl=githubUrlValue,localRepoPath=self.repoPath)
+            commit.parents=[str(p) for p in c.parent_ids]
+            commit.author=c.author.name
+            commit.authorEmail=c.author.email
+            commit.setTime(c.author.time,c.author.offset)
+            commit.description=c.message.strip()
+            yield commit
+
+
+class RecordingBackend(GitBackend):
+    """
+    Passes everything through to another backend, recording the
+    results so that they can be played back with a ReplayBackend
+    """
+
+    name='record'
+
+    def __init__(self,
+        backend:GitBackend,
+        filename:typing.Optional[str]=None):
+        """ """
+        GitBackend.__init__(self,backend.repoPath)
+        self.backend=backend
+        self.filename=filename
+        self.recording:typing.List[typing.Dict[str,typing.Any]]=[]
+        self._lock=threading.Lock()
+
+    def _record(self,
+        args:typing.Sequence[str],
+        stdin:typing.Optional[bytes],
+        result:GitResult
+        )->None:
+        with self._lock:
+            self.recording.append({
+                'args':list(args),
+                'stdin':None if stdin is None else _b64(stdin),
+                'returncode':result.returncode,
+                'stdout':_b64(result.stdout),
+                'stderr':_b64(result.stderr)})
+
+    def run(self,
+        args:typing.Sequence[str],
+        stdin:typing.Optional[bytes]=None
+        )->GitResult:
+        result=self.backend.run(args,stdin)
+        self._record(args,stdin,result)
+        return result
+
+    def stream(self,
+        args:typing.Sequence[str],
+        stdin:typing.Optional[bytes]=None,
+        stop:typing.Optional[threading.Event]=None
+        )->typing.Iterator[bytes]:
+        chunks:typing.List[bytes]=[]
+        try:
+            for chunk in self.backend.stream(args,stdin,stop):
+                chunks.append(chunk)
+                yield chunk
+        except GitException as e:
+            self._record(args,stdin,GitResult(1,b''.join(chunks),
+                str(e).encode('utf-8')))
+            raise
+        self._record(args,stdin,GitResult(0,b''.join(chunks)))
+
+    def save(self,filename:typing.Optional[str]=None)->None:
+        """
+        Save the recording as json
+        """
+        if filename is None:
+            filename=self.filename
+        if filename is None:
+            raise FileNotFoundError('No filename to save the recording to')
+        with self._lock:
+            with open(filename,'w',encoding='utf-8') as f:
+                json.dump(self.recording,f,indent=1)
+
+    def close(self)->None:
+        if self.filename is not None:
+            self.save()
+        self.backend.close()
+
+
+class ReplayBackend(GitBackend):
+    """
+    Plays back the results recorded by a RecordingBackend
+    (without running git at all)
+
+    Identical commands are answered in the order they were recorded,
+    repeating the last answer once they run out.
+    """
+
+    name='replay'
+
+    def __init__(self,
+        recording:typing.Union[str,typing.List[typing.Dict[str,typing.Any]]],
+        localRepoPath:FilePathCompatible='.'):
+        """
+        :recording: a RecordingBackend.recording, or a filename it was saved to
+        """
+        GitBackend.__init__(self,localRepoPath)
+        if isinstance(recording,str):
+            with open(recording,'r',encoding='utf-8') as f:
+                recording=json.load(f)
+        self._answers:typing.Dict[
+            typing.Tuple[typing.Tuple[str,...],typing.Optional[str]],
+            typing.List[GitResult]]={}
+        self._next:typing.Dict[
+            typing.Tuple[typing.Tuple[str,...],typing.Optional[str]],int]={}
+        for entry in recording: # type: ignore
+            key=(tuple(entry['args']),entry['stdin'])
+            self._answers.setdefault(key,[]).append(GitResult(
+                entry['returncode'],
+                base64.b64decode(entry['stdout']),
+                base64.b64decode(entry['stderr'])))
+
+    def _answer(self,
+        args:typing.Sequence[str],
+        stdin:typing.Optional[bytes]
+        )->GitResult:
+        key=(tuple(args),None if stdin is None else _b64(stdin))
+        answers=self._answers.get(key)
+        if not answers:
+            raise GitException(f'No recording for "git {" ".join(args)}"')
+        idx=self._next.get(key,0)
+        self._next[key]=idx+1
+        return answers[min(idx,len(answers)-1)]
+
+    def run(self,
+        args:typing.Sequence[str],
+        stdin:typing.Optional[bytes]=None
+        )->GitResult:
+        return self._answer(args,stdin)
+
+    def stream(self,
+        args:typing.Sequence[str],
+        stdin:typing.Optional[bytes]=None,
+        stop:typing.Optional[threading.Event]=None
+        )->typing.Iterator[bytes]:
+        result=self._answer(args,stdin)
+        if result.stdout:
+            yield result.stdout
+        result.check()
+
+
+def _b64(data:bytes)->str:
+    return base64.b64encode(data).decode('ascii')
+
+
+def benchmarkBackends(
+    backends:typing.Iterable[GitBackend],
+    workload:typing.Callable[[GitBackend],typing.Any],
+    repeat:int=3
+    )->typing.Dict[str,float]:
+    """
+    Run an identical workload against several backends
+
+    :workload: function that does something with a backend
+    :return: {backend name:best time in seconds}
+    """
+    ret:typing.Dict[str,float]={}
+    for backend in backends:
+        best=float('inf')
+        for _ in range(repeat):
+            start=time.perf_counter()
+            workload(backend)
+            best=min(best,time.perf_counter()-start)
+        ret[backend.name]=best
+    return ret
+
+
+_backends:typing.Dict[str,GitBackend]={}
+_backendsLock=threading.Lock()
+
+
+def _backendKey(localRepoPath:FilePathCompatible)->str:
+    from gitTools.commits import findRepoPath
+    localRepoPath=str(asFilePath(localRepoPath))
+    repoPath=findRepoPath(localRepoPath)
+    if repoPath is None:
+        repoPath=os.path.abspath(localRepoPath)
+    return os.path.normcase(repoPath)
+
+
+def getBackend(localRepoPath:FilePathCompatible='.')->GitBackend:
+    """
+    Get the backend that performs git operations for a repo
+    (the git command line unless something else was set)
+    """
+    key=_backendKey(localRepoPath)
+    with _backendsLock:
+        backend=_backends.get(key)
+        if backend is None:
+            backend=GitCliBackend(key)
+            _backends[key]=backend
+    return backend
+
+
+def setBackend(
+    localRepoPath:FilePathCompatible,
+    backend:GitBackend
+    )->None:
+    """
+    Select the backend that performs git operations for a repo
+    """
+    with _backendsLock:
+        _backends[_backendKey(localRepoPath)]=backend
@@ -7,23 +7,26 @@ import subprocess
 from paths import UrlCompatible,FileUrlCompatible,asFileUrl,asUrl
 from k_runner.osrun import osrun
 from k_runner import ApplicationCallbacks
+from gitTools.backends import GitBackend,getBackend
 from gitTools.tagsAndVersions import (
     findRepoPath,GitCommit,Version,gitTagToCommit)
 
 
-def gitAbandonChanges(localRepoPath:FileUrlCompatible)->None:
+def gitAbandonChanges(
+    localRepoPath:FileUrlCompatible,
+    backend:typing.Optional[GitBackend]=None
+    )->None:
     """
     Shortcut to abandon all changes.
 
     WARNING: ability to shoot yourself in the foot is very high, here
+
+    :backend: what runs git (default is the repo's getBackend())
     """
-    localRepoPath=asFileUrl(localRepoPath)
-    cmd=['git','reset','--hard','HEAD']
-    result=osrun(cmd,workingDirectory=localRepoPath)
-    if result.stderr:
-        raise Exception(result.stderr)
-    cmd=['git','pull']
-    _=osrun(cmd,workingDirectory=localRepoPath)
+    if backend is None:
+        backend=getBackend(asFileUrl(localRepoPath))
+    backend.run(['reset','--hard','HEAD']).check()
+    backend.run(['pull'])
 
 
 def revertCommits(commits:typing.Iterable[str],localRepoPath:FileUrlCompatible='.'):
@@ -35,13 +38,12 @@ def revertCommits(commits:typing.Iterable[str],localRepoPath:FileUrlCompatible='
     repoPath=findRepoPath(localRepoPath)
     if repoPath is None:
         raise FileNotFoundError(f'"{localRepoPath}" is not a git repo')
-    cmd=['git','revert','-n','']
+    backend=getBackend(repoPath)
+    cmd=['revert','-n','']
     for commit in commits:
         cmd[-1]=commit
-        print('$>',' '.join(cmd))
-        result=osrun(cmd,workingDirectory=repoPath)
-        if result.stderr:
-            raise Exception(result.stderr)
+        print('$> git',' '.join(cmd))
+        backend.run(cmd).check()
 
 
 def shutdownCodeDependentProcesses()->typing.List[str]:
@@ -0,0 +1,278 @@
+"""
+A long-lived "git cat-file --batch" object reader
+
+Spawning git for every object we want to look at is expensive,
+so instead we keep a single cat-file process per repo running and
+feed it requests over a pipe.
+"""
+import typing
+import os
+import atexit
+import threading
+import subprocess
+from paths import FilePathCompatible,asFilePath
+
+
+# requests up to this many bytes are small enough to always fit in
+# the pipe to git (so can be written without waiting on the replies)
+PIPE_SAFE_SIZE=4096
+
+
+class GitObject:
+    """
+    A single object read from the git object store
+
+    (data is None when only the object info was requested)
+    """
+    def __init__(self,
+        hash:str, # pylint: disable=W0622
+        type:str, # pylint: disable=W0622
+        size:int,
+        data:typing.Optional[bytes]=None):
+        """ """
+        self.hash=hash
+        self.type=type
+        self.size=size
+        self.data=data
+
+    @property
+    def text(self)->str:
+        """
+        The object data as a string
+        """
+        if self.data is None:
+            return ''
+        return self.data.decode('utf-8',errors='ignore')
+
+    def __repr__(self)->str:
+        return f'{self.type} {self.hash} ({self.size} bytes)'
+
+
+def _feedThread(po:subprocess.Popen,request:bytes)->threading.Thread:
+    """
+    A thread that writes a request to a cat-file process
+    (any failure shows up as the replies ending early)
+    """
+    def feed()->None:
+        try:
+            po.stdin.write(request) # type: ignore
+            po.stdin.flush() # type: ignore
+        except (OSError,ValueError):
+            pass
+    return threading.Thread(target=feed,daemon=True)
+
+
+class _CatFileProcess:
+    """
+    A single running "git cat-file" process in either
+    --batch or --batch-check mode
+    """
+
+    def __init__(self,repoPath:str,mode:str):
+        self.repoPath=repoPath
+        self.mode=mode
+        self._po:typing.Optional[subprocess.Popen]=None
+
+    @property
+    def withData(self)->bool:
+        """
+        Does this process return object contents?
+        """
+        return self.mode=='--batch'
+
+    def _start(self)->subprocess.Popen:
+        if self._po is None or self._po.poll() is not None:
+            self.close()
+            self._po=subprocess.Popen(['git','cat-file',self.mode],
+                cwd=self.repoPath,stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,stderr=subprocess.DEVNULL)
+        return self._po
+
+    def close(self)->None:
+        """
+        Shut down the process
+        """
+        po=self._po
+        self._po=None
+        if po is None:
+            return
+        try:
+            po.stdin.close() # type: ignore
+        except OSError:
+            pass
+        if po.poll() is None:
+            try:
+                po.wait(timeout=1)
+            except subprocess.TimeoutExpired:
+                po.kill()
+                po.wait()
+        po.stdout.close() # type: ignore
+
+    def _readReply(self,po:subprocess.Popen)->typing.Optional[GitObject]:
+        header=po.stdout.readline() # type: ignore
+        if not header:
+            raise BrokenPipeError('git cat-file exited unexpectedly')
+        header=header.rstrip(b'\n')
+        if header.endswith((b' missing',b' ambiguous')):
+            # "<name> missing" or "<name> ambiguous"
+            # (where the name can have spaces in it)
+            return None
+        values=header.decode('utf-8',errors='ignore').split(' ')
+        if len(values)!=3:
+            raise ValueError(f'Unexpected git cat-file reply "{header!r}"')
+        data=None
+        size=int(values[2])
+        if self.withData:
+            data=po.stdout.read(size) # type: ignore
+            po.stdout.read(1) # type: ignore
+            if len(data)!=size:
+                raise BrokenPipeError('git cat-file exited unexpectedly')
+        return GitObject(values[0],values[1],size,data)
+
+    def request(self,
+        names:typing.Sequence[str]
+        )->typing.List[typing.Optional[GitObject]]:
+        """
+        Send a batch of object names and collect the replies
+        """
+        for attempt in range(2):
+            po=self._start()
+            request=''.join(f'{name}\n' for name in names).encode('utf-8')
+            try:
+                if len(request)<=PIPE_SAFE_SIZE:
+                    po.stdin.write(request) # type: ignore
+                    po.stdin.flush() # type: ignore
+                else:
+                    # (written from another thread, since git could
+                    # fill the reply pipe before reading all of it)
+                    _feedThread(po,request).start()
+                return [self._readReply(po) for _ in names]
+            except (OSError,ValueError):
+                # process died on us, restart it and try once more
+                self.close()
+                if attempt>0:
+                    raise
+        return []
+
+
+class GitObjectReader:
+    """
+    Reads objects from a repo through long-lived
+    "git cat-file --batch" and "--batch-check" processes
+
+    Thread-safe, and restarts the processes if they fail.
+    """
+
+    # number of requests to send before reading the replies
+    # (bigger requests than PIPE_SAFE_SIZE are written from a thread)
+    BATCH_SIZE=256
+
+    def __init__(self,localRepoPath:FilePathCompatible='.'):
+        """ """
+        self.repoPath=str(asFilePath(localRepoPath))
+        self._lock=threading.Lock()
+        self._batch=_CatFileProcess(self.repoPath,'--batch')
+        self._batchCheck=_CatFileProcess(self.repoPath,'--batch-check')
+
+    def _request(self,
+        process:_CatFileProcess,
+        names:typing.Iterable[str]
+        )->typing.Generator[typing.Optional[GitObject],None,None]:
+        batch:typing.List[str]=[]
+        for name in names:
+            if '\n' in name:
+                raise ValueError(f'Invalid object name "{name}"')
+            batch.append(name)
+            if len(batch)>=self.BATCH_SIZE:
+                with self._lock:
+                    results=process.request(batch)
+                yield from results
+                batch=[]
+        if batch:
+            with self._lock:
+                results=process.request(batch)
+            yield from results
+
+    def read(self,name:str)->typing.Optional[GitObject]:
+        """
+        Read a single object (eg "HEAD", a hash, or "HEAD:README.md")
+
+        :return: None if the object does not exist
+        """
+        return next(self._request(self._batch,(name,)))
+
+    def readMany(self,
+        names:typing.Iterable[str]
+        )->typing.Generator[typing.Optional[GitObject],None,None]:
+        """
+        Read many objects, streaming back the results in order
+
+        (missing objects are returned as None)
+        """
+        return self._request(self._batch,names)
+
+    def info(self,name:str)->typing.Optional[GitObject]:
+        """
+        Get the hash, type, and size of an object without reading it
+
+        :return: None if the object does not exist
+        """
+        return next(self._request(self._batchCheck,(name,)))
+
+    def infoMany(self,
+        names:typing.Iterable[str]
+        )->typing.Generator[typing.Optional[GitObject],None,None]:
+        """
+        Get the hash, type, and size of many objects without reading them
+        """
+        return self._request(self._batchCheck,names)
+
+    def exists(self,name:str)->bool:
+        """
+        Does an object exist?
+        """
+        return self.info(name) is not None
+
+    def close(self)->None:
+        """
+        Shut down the git processes
+        (they will be restarted if needed again)
+        """
+        with self._lock:
+            self._batch.close()
+            self._batchCheck.close()
+
+    def __del__(self):
+        self.close()
+
+
+_objectReaders:typing.Dict[str,GitObjectReader]={}
+_objectReadersLock=threading.Lock()
+
+
+def getObjectReader(localRepoPath:FilePathCompatible='.')->GitObjectReader:
+    """
+    Get the shared object reader for a repo
+    """
+    from gitTools.commits import findRepoPath
+    repoPath=findRepoPath(localRepoPath)
+    if repoPath is None:
+        raise FileNotFoundError(f'"{localRepoPath}" is not a git repo')
+    repoPath=os.path.normcase(repoPath)
+    with _objectReadersLock:
+        reader=_objectReaders.get(repoPath)
+        if reader is None:
+            reader=GitObjectReader(repoPath)
+            _objectReaders[repoPath]=reader
+    return reader
+
+
+@atexit.register
+def closeObjectReaders()->None:
+    """
+    Shut down all shared object readers
+    """
+    with _objectReadersLock:
+        for reader in _objectReaders.values():
+            reader.close()
+        _objectReaders.clear()
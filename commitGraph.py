@@ -0,0 +1,583 @@
+"""
+An in-memory commit DAG for fast ancestry questions
+
+Commits are integer node ids with parent ids and generation numbers
+(the length of the longest path down to a root commit).  A commit
+always has a higher generation than any of its ancestors, which lets
+walks stop as soon as they go below the generation of what they
+are looking for.
+
+Where git has written a commit-graph file (.git/objects/info/commit-graph
+or a commit-graphs chain) it is mmapped and used as-is.  Otherwise, and
+for any commits newer than the file, the parents are read from the
+object store as they are needed.
+
+See also:
+    https://git-scm.com/docs/gitformat-commit-graph
+"""
+import typing
+import os
+import mmap
+import heapq
+import array
+import struct
+import threading
+from paths import FilePathCompatible
+from gitTools.exceptions import GitException
+
+
+COMMIT_GRAPH_MAGIC=b'CGPH'
+GRAPH_PARENT_NONE=0x70000000
+GRAPH_EXTRA_EDGES=0x80000000
+GRAPH_LAST_EDGE=0x80000000
+CHUNK_OIDF=b'OIDF'
+CHUNK_OIDL=b'OIDL'
+CHUNK_CDAT=b'CDAT'
+CHUNK_EDGE=b'EDGE'
+
+# flags used while walking
+_FROM_A=1
+_FROM_B=2
+_STALE=4
+
+
+class _Unsupported(Exception):
+    """
+    A commit-graph file we do not know how to read
+    """
+
+
+class _GraphFile:
+    """
+    A single mmapped commit-graph file
+
+    (node ids in it start at "start", to allow for the layers
+    of a commit-graph chain)
+    """
+
+    def __init__(self,filename:str,start:int=0):
+        self.filename=filename
+        self.start=start
+        with open(filename,'rb') as f:
+            self._data=mmap.mmap(f.fileno(),0,access=mmap.ACCESS_READ)
+        data=self._data
+        if data[0:4]!=COMMIT_GRAPH_MAGIC or data[4]!=1:
+            raise _Unsupported(f'commit-graph "{filename}"')
+        self.hashLen={1:20,2:32}.get(data[5])
+        if self.hashLen is None:
+            raise _Unsupported(f'commit-graph hash version {data[5]}')
+        numChunks=data[6]
+        chunks:typing.Dict[bytes,int]={}
+        for i in range(numChunks):
+            pos=8+i*12
+            chunks[bytes(data[pos:pos+4])]=struct.unpack(
+                '>Q',data[pos+4:pos+12])[0]
+        for chunk in (CHUNK_OIDF,CHUNK_OIDL,CHUNK_CDAT):
+            if chunk not in chunks:
+                raise _Unsupported(f'commit-graph without {chunk!r}')
+        fanoutStart=chunks[CHUNK_OIDF]
+        self._fanout=struct.unpack('>256I',data[fanoutStart:fanoutStart+1024])
+        self.count=self._fanout[255]
+        self._namesStart=chunks[CHUNK_OIDL]
+        self._dataStart=chunks[CHUNK_CDAT]
+        self._dataSize=self.hashLen+16
+        self._edgesStart=chunks.get(CHUNK_EDGE)
+
+    def close(self)->None:
+        """
+        Release the mmap
+        """
+        self._data.close()
+
+    def binsha(self,idx:int)->bytes:
+        """
+        The hash of a node (idx is within this file)
+        """
+        pos=self._namesStart+idx*self.hashLen
+        return self._data[pos:pos+self.hashLen]
+
+    def find(self,binsha:bytes)->typing.Optional[int]:
+        """
+        Find a commit in this file
+
+        :return: its index within this file, or None if it is not here
+        """
+        first=binsha[0]
+        lo=self._fanout[first-1] if first else 0
+        hi=self._fanout[first]
+        while lo<hi:
+            mid=(lo+hi)//2
+            name=self.binsha(mid)
+            if name<binsha:
+                lo=mid+1
+            elif name>binsha:
+                hi=mid
+            else:
+                return mid
+        return None
+
+    def parents(self,idx:int)->typing.List[int]:
+        """
+        The parents of a node, as global node ids
+        """
+        pos=self._dataStart+idx*self._dataSize+self.hashLen
+        parent1,parent2=struct.unpack('>II',self._data[pos:pos+8])
+        ret:typing.List[int]=[]
+        if parent1==GRAPH_PARENT_NONE:
+            return ret
+        ret.append(parent1)
+        if parent2==GRAPH_PARENT_NONE:
+            return ret
+        if not parent2&GRAPH_EXTRA_EDGES:
+            ret.append(parent2)
+            return ret
+        # an octopus merge has the rest of its parents in the edge list
+        if self._edgesStart is None:
+            raise _Unsupported('commit-graph without EDGE chunk')
+        pos=self._edgesStart+(parent2&~GRAPH_EXTRA_EDGES)*4
+        while True:
+            edge=struct.unpack('>I',self._data[pos:pos+4])[0]
+            ret.append(edge&~GRAPH_LAST_EDGE)
+            if edge&GRAPH_LAST_EDGE:
+                return ret
+            pos+=4
+
+    def generation(self,idx:int)->int:
+        """
+        The generation number (topological level) of a node
+        """
+        pos=self._dataStart+idx*self._dataSize+self.hashLen+8
+        return struct.unpack('>I',self._data[pos:pos+4])[0]>>2
+
+
+class CommitGraph:
+    """
+    An in-memory commit DAG for fast ancestry questions
+
+    Anywhere a commit is wanted, a hash or any revision
+    name (eg, "main", "v1.0", "HEAD~3") can be used.
+    """
+
+    def __init__(self,
+        localRepoPath:FilePathCompatible='.',
+        useCommitGraphFile:bool=True):
+        """
+        :useCommitGraphFile: use git's commit-graph file if there is one
+        """
+        from gitTools.commits import findRepoPath,findGitDir
+        repoPath=findRepoPath(localRepoPath)
+        gitDir=findGitDir(localRepoPath)
+        if repoPath is None or gitDir is None:
+            raise FileNotFoundError(f'"{localRepoPath}" is not a git repo')
+        self.repoPath:str=repoPath
+        self._lock=threading.RLock()
+        self._files:typing.List[_GraphFile]=[]
+        self._fileCount=0
+        if useCommitGraphFile:
+            self._openGraphFiles(os.path.join(gitDir,'objects','info'))
+        # commits that are not in a commit-graph file
+        self._hashes:typing.List[bytes]=[]
+        self._ids:typing.Dict[bytes,int]={}
+        self._parents:typing.List[typing.Tuple[int,...]]=[]
+        self._generations=array.array('I')
+
+    @classmethod
+    def fromCommits(cls,
+        localRepoPath:FilePathCompatible,
+        commits:typing.Iterable[typing.Any]
+        )->"CommitGraph":
+        """
+        Build a graph from the parent lists of commits
+        already on hand (eg, a GitCommits) instead of git's
+        commit-graph file
+        """
+        ret=cls(localRepoPath,useCommitGraphFile=False)
+        ret.addParents({commit.hash:commit.parents for commit in commits})
+        return ret
+
+    def _openGraphFiles(self,infoDir:str)->None:
+        """
+        Open either the single commit-graph file,
+        or the layers of a commit-graph chain
+        """
+        single=os.path.join(infoDir,'commit-graph')
+        filenames=[single]
+        if not os.path.isfile(single):
+            chainDir=os.path.join(infoDir,'commit-graphs')
+            try:
+                with open(os.path.join(chainDir,'commit-graph-chain'),
+                    'r',encoding='ascii') as f:
+                    filenames=[os.path.join(chainDir,f'graph-{h}.graph')
+                        for h in f.read().split()]
+            except OSError:
+                return
+        files:typing.List[_GraphFile]=[]
+        start=0
+        try:
+            for filename in filenames:
+                graphFile=_GraphFile(filename,start)
+                files.append(graphFile)
+                start+=graphFile.count
+        except (OSError,ValueError,struct.error,_Unsupported):
+            # unusable, so do without
+            for graphFile in files:
+                graphFile.close()
+            return
+        self._files=files
+        self._fileCount=start
+
+    def close(self)->None:
+        """
+        Release any commit-graph files
+        """
+        with self._lock:
+            for graphFile in self._files:
+                graphFile.close()
+            self._files=[]
+            self._fileCount=0
+            self._hashes=[]
+            self._ids={}
+            self._parents=[]
+            self._generations=array.array('I')
+
+    def __len__(self)->int:
+        """
+        How many commits are known so far
+        """
+        return self._fileCount+len(self._hashes)
+
+    def _file(self,nodeId:int)->typing.Tuple[_GraphFile,int]:
+        for graphFile in reversed(self._files):
+            if nodeId>=graphFile.start:
+                return graphFile,nodeId-graphFile.start
+        raise IndexError(nodeId)
+
+    def hash(self,nodeId:int)->str:
+        """
+        The hash of a node
+        """
+        if nodeId<self._fileCount:
+            graphFile,idx=self._file(nodeId)
+            return graphFile.binsha(idx).hex()
+        return self._hashes[nodeId-self._fileCount].hex()
+
+    def parentIds(self,nodeId:int)->typing.Sequence[int]:
+        """
+        The parents of a node
+        """
+        if nodeId<self._fileCount:
+            graphFile,idx=self._file(nodeId)
+            return graphFile.parents(idx)
+        return self._parents[nodeId-self._fileCount]
+
+    def generation(self,nodeId:int)->int:
+        """
+        The generation number of a node
+        (1 for a root commit, otherwise 1 more than its highest parent)
+        """
+        if nodeId<self._fileCount:
+            graphFile,idx=self._file(nodeId)
+            return graphFile.generation(idx)
+        return self._generations[nodeId-self._fileCount]
+
+    def _find(self,binsha:bytes)->typing.Optional[int]:
+        """
+        Find the node id of an already-known commit
+        """
+        for graphFile in self._files:
+            idx=graphFile.find(binsha)
+            if idx is not None:
+                return graphFile.start+idx
+        return self._ids.get(binsha)
+
+    def _add(self,binsha:bytes,parentIds:typing.Sequence[int])->int:
+        """
+        Add a commit whose parents are all known already
+        """
+        generation=1
+        for parent in parentIds:
+            generation=max(generation,self.generation(parent)+1)
+        nodeId=self._fileCount+len(self._hashes)
+        self._hashes.append(binsha)
+        self._ids[binsha]=nodeId
+        self._parents.append(tuple(parentIds))
+        self._generations.append(generation)
+        return nodeId
+
+    def addParents(self,
+        parents:typing.Dict[str,typing.Iterable[str]]
+        )->None:
+        """
+        Add commits to the graph from {hash:[parentHash]}
+
+        Any parents that are not in the dict, or already in the
+        graph, are read from the repo.
+        """
+        pending={bytes.fromhex(h):[bytes.fromhex(p) for p in ps]
+            for h,ps in parents.items()}
+        with self._lock:
+            for binsha in pending:
+                self._addNode(binsha,pending)
+
+    def _addNode(self,
+        binsha:bytes,
+        pending:typing.Optional[typing.Dict[bytes,typing.List[bytes]]]=None
+        )->typing.Optional[int]:
+        """
+        Make sure a commit and all of its ancestors are in the graph
+        (without recursing, since histories can be very deep)
+
+        :return: the node id, or None if the commit does not exist
+        """
+        nodeId=self._find(binsha)
+        if nodeId is not None:
+            return nodeId
+        store=None
+        # (binsha,parent binshas, or None until looked up)
+        stack:typing.List[typing.Tuple[bytes,typing.Optional[typing.List[bytes]]]]=[(binsha,None)] # noqa: E501 # pylint: disable=line-too-long
+        while stack:
+            current,parentShas=stack[-1]
+            if self._find(current) is not None:
+                stack.pop()
+                continue
+            if parentShas is None:
+                if pending is not None and current in pending:
+                    parentShas=pending[current]
+                else:
+                    if store is None:
+                        from gitTools.objectStore import getObjectStore
+                        store=getObjectStore(self.repoPath)
+                    obj=store.read(current.hex())
+                    if obj is None or obj.type!='commit':
+                        if current==binsha:
+                            return None
+                        # missing parent (eg, a shallow clone)
+                        parentShas=[]
+                    else:
+                        parentShas=_commitParents(obj.data) # type: ignore
+                stack[-1]=(current,parentShas)
+            missing=[p for p in parentShas if self._find(p) is None]
+            if missing:
+                stack.extend((p,None) for p in missing)
+                continue
+            stack.pop()
+            parentIds=[self._find(p) for p in parentShas]
+            self._add(current,parentIds) # type: ignore
+        return self._find(binsha)
+
+    def nodeId(self,rev:str)->int:
+        """
+        Get the node id for a commit, adding it to the graph if need be
+
+        :raises GitException: if there is no such commit
+        """
+        binsha=None
+        if len(rev) in (40,64):
+            try:
+                binsha=bytes.fromhex(rev)
+            except ValueError:
+                pass
+        if binsha is None:
+            from gitTools.objectStore import getObjectStore
+            obj=getObjectStore(self.repoPath).info(f'{rev}^{{commit}}')
+            if obj is None:
+                raise GitException(f'Unknown commit "{rev}"')
+            binsha=bytes.fromhex(obj.hash)
+        with self._lock:
+            nodeId=self._addNode(binsha)
+        if nodeId is None:
+            raise GitException(f'Unknown commit "{rev}"')
+        return nodeId
+
+    def isAncestor(self,ancestor:str,descendant:str)->bool:
+        """
+        Is a commit an ancestor of (or the same as) another one?
+        (like "git merge-base --is-ancestor")
+        """
+        target=self.nodeId(ancestor)
+        start=self.nodeId(descendant)
+        return self._isAncestorId(target,start)
+
+    def _isAncestorId(self,target:int,start:int)->bool:
+        if target==start:
+            return True
+        minGeneration=self.generation(target)
+        seen={start}
+        todo=[start]
+        while todo:
+            nodeId=todo.pop()
+            for parent in self.parentIds(nodeId):
+                if parent==target:
+                    return True
+                if parent not in seen and self.generation(parent)>minGeneration: # noqa: E501 # pylint: disable=line-too-long
+                    seen.add(parent)
+                    todo.append(parent)
+        return False
+
+    def _paintDown(self,
+        a:int,
+        b:int,
+        findBases:bool
+        )->typing.Tuple[typing.Dict[int,int],typing.List[int]]:
+        """
+        Walk down from both a and b in generation order,
+        marking each commit with which of them it is reachable from
+
+        Every commit is visited after all of its descendants that are
+        being visited, so its marks are final when it is taken off the
+        queue, and the walk can stop once nothing on the queue is
+        reachable from only one side.
+
+        :findBases: stop at the best common ancestors,
+            rather than carrying on down past them
+        :return: ({nodeId:flags},[best common ancestors])
+        """
+        flags:typing.Dict[int,int]={a:_FROM_A}
+        flags[b]=flags.get(b,0)|_FROM_B
+        queue=[(-self.generation(n),n) for n in {a,b}]
+        heapq.heapify(queue)
+        # how many queued commits are reachable from only one side
+        oneSided=sum(1 for _,n in queue if flags[n]&3!=3)
+        bases:typing.List[int]=[]
+        done:typing.Set[int]=set()
+        while queue and oneSided:
+            _,nodeId=heapq.heappop(queue)
+            if nodeId in done:
+                continue
+            done.add(nodeId)
+            flag=flags[nodeId]
+            if flag&3!=3:
+                oneSided-=1
+            elif findBases and not flag&_STALE:
+                bases.append(nodeId)
+                flag|=_STALE
+            for parent in self.parentIds(nodeId):
+                old=flags.get(parent,0)
+                new=old|flag
+                if new==old:
+                    continue
+                flags[parent]=new
+                if old==0 or parent in done:
+                    # (nothing can be done already, since it
+                    # has a lower generation than nodeId)
+                    heapq.heappush(queue,(-self.generation(parent),parent))
+                    if new&3!=3:
+                        oneSided+=1
+                elif old&3!=3 and new&3==3:
+                    oneSided-=1
+        if findBases:
+            # anything still queued is also a candidate
+            for _,nodeId in queue:
+                if nodeId not in done and flags[nodeId]&3==3 \
+                    and not flags[nodeId]&_STALE:
+                    bases.append(nodeId)
+                    done.add(nodeId)
+        return flags,bases
+
+    def mergeBases(self,a:str,b:str)->typing.List[str]:
+        """
+        All of the best common ancestors of two commits
+        (like "git merge-base --all")
+        """
+        flags,bases=self._paintDown(self.nodeId(a),self.nodeId(b),True)
+        del flags
+        # a candidate that is an ancestor of another one is not a best one
+        best=[n for n in bases if not any(
+            m!=n and self._isAncestorId(n,m) for m in bases)]
+        best.sort(key=self.generation,reverse=True)
+        return [self.hash(n) for n in best]
+
+    def mergeBase(self,a:str,b:str)->typing.Optional[str]:
+        """
+        The best common ancestor of two commits
+        (like "git merge-base")
+        """
+        bases=self.mergeBases(a,b)
+        return bases[0] if bases else None
+
+    def aheadBehind(self,a:str,b:str)->typing.Tuple[int,int]:
+        """
+        How many commits a has that b does not, and vice versa
+        (like "git rev-list --left-right --count a...b")
+
+        :return: (ahead,behind)
+        """
+        flags,_=self._paintDown(self.nodeId(a),self.nodeId(b),False)
+        ahead=0
+        behind=0
+        for flag in flags.values():
+            flag&=3
+            if flag==_FROM_A:
+                ahead+=1
+            elif flag==_FROM_B:
+                behind+=1
+        return ahead,behind
+
+    def reachableIds(self,
+        tips:typing.Iterable[str],
+        exclude:typing.Iterable[str]=()
+        )->typing.Set[int]:
+        """
+        The node ids of every commit reachable from the tips,
+        but not from anything in exclude
+        """
+        excluded=self._reachFrom([self.nodeId(r) for r in exclude],set())
+        return self._reachFrom([self.nodeId(r) for r in tips],excluded)
+
+    def _reachFrom(self,
+        starts:typing.Iterable[int],
+        excluded:typing.Set[int]
+        )->typing.Set[int]:
+        ret:typing.Set[int]=set()
+        todo=[n for n in starts if n not in excluded]
+        while todo:
+            nodeId=todo.pop()
+            if nodeId in ret:
+                continue
+            ret.add(nodeId)
+            todo.extend(p for p in self.parentIds(nodeId)
+                if p not in ret and p not in excluded)
+        return ret
+
+    def reachable(self,
+        tips:typing.Iterable[str],
+        exclude:typing.Iterable[str]=()
+        )->typing.Set[str]:
+        """
+        The hash of every commit reachable from the tips,
+        but not from anything in exclude
+        (like "git rev-list tips ^exclude")
+        """
+        return {self.hash(n) for n in self.reachableIds(tips,exclude)}
+
+
+def _commitParents(data:bytes)->typing.List[bytes]:
+    """
+    Get the parent hashes out of a raw commit object
+    """
+    ret:typing.List[bytes]=[]
+    for header in data.partition(b'\n\n')[0].split(b'\n'):
+        if header.startswith(b'parent '):
+            ret.append(bytes.fromhex(header[7:].decode('ascii')))
+    return ret
+
+
+_commitGraphs:typing.Dict[str,CommitGraph]={}
+_commitGraphsLock=threading.Lock()
+
+
+def getCommitGraph(localRepoPath:FilePathCompatible='.')->CommitGraph:
+    """
+    Get the shared CommitGraph for a repo
+    """
+    from gitTools.commits import findRepoPath
+    repoPath=findRepoPath(localRepoPath)
+    if repoPath is None:
+        raise FileNotFoundError(f'"{localRepoPath}" is not a git repo')
+    repoPath=os.path.normcase(repoPath)
+    with _commitGraphsLock:
+        graph=_commitGraphs.get(repoPath)
+        if graph is None:
+            graph=CommitGraph(repoPath)
+            _commitGraphs[repoPath]=graph
+    return graph
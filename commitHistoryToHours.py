@@ -6,7 +6,8 @@ and pay rate per file type, come up with a cost estimate.
 import typing
 import datetime
 from paths import Url,UrlCompatible,asUrl
-from commits import gitLog
+from gitTools.gitRemotes import githubUrl
+from gitTools.commitStats import iterCommitStats
 
 
 Money=float
@@ -168,18 +169,21 @@ class CommitHistoryToHours:
         """
         bill=Bill()
         for repoPath in self.gitFolders:
-            commits=gitLog(repoPath)
-            for commit in commits:
-                diff=commit.diff
-                date=diff.date
+            base=githubUrl(repoPath)
+            # (only line counts are needed, not the diffs themselves,
+            # and they all come from one streamed git log)
+            for stats in iterCommitStats(repoPath):
+                date=stats.date
                 if date is None:
                     raise Exception('No date for git commit!')
-                for fileDiff in diff:
-                    numLines=fileDiff.numLines
-                    rate=self.getFileRate(fileDiff.filename)
-                    name=fileDiff.filename
-                    link=fileDiff.githubUrl
-                    bill.append(BillLineItem(name,date,numLines,rate,link))
+                for fileStats in stats:
+                    name=fileStats.filename
+                    rate=self.getFileRate(name)
+                    link=None
+                    if base is not None:
+                        link=Url(f'{base}/blob/{stats.hash}/{name}')
+                    bill.append(BillLineItem(
+                        name,date,fileStats.numLines,rate,link))
         return bill
 
 def cmdline(args:typing.Iterable[str])->int:
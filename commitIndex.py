@@ -0,0 +1,448 @@
+"""
+Persistent on-disk index of commit metadata
+
+Commits are immutable, so once one has been read from git it never
+needs to be read again.  The index lives in sqlite under
+.git/gittools/ and each refresh() only ingests the commits that
+have appeared since the last one (ie, oldTip..newTip).
+
+The parent links are kept in their own table (of commit rowids), so that
+what is reachable from a set of tips is a single recursive query
+inside sqlite, rather than loading the whole history into python.
+
+Commit messages can also be indexed by word, for fast grep()ing.
+"""
+import typing
+import os
+import re
+import sqlite3
+from paths import FilePathCompatible
+from gitTools.gitCommit import GitCommit
+from gitTools.gitCommits import GitCommits
+from gitTools.gitRemotes import githubUrl
+from gitTools.commits import findRepoPath,findGitDir
+from gitTools.backends import GitBackend,getBackend
+from gitTools.exceptions import GitException
+
+
+class CommitIndex:
+    """
+    Persistent on-disk index of commit metadata for a single repo
+
+    Stores hash, parents, author, date, subject and message for every
+    commit that has been ingested, along with the tips that were
+    ingested for each set of revisions (a "scope", eg "HEAD" or "--all").
+    """
+
+    INDEX_DIRECTORY='gittools'
+    INDEX_FILENAME='commits.sqlite'
+    SCHEMA=(
+        """CREATE TABLE IF NOT EXISTS commits (
+            hash TEXT PRIMARY KEY,
+            parents TEXT NOT NULL,
+            author TEXT NOT NULL,
+            authorEmail TEXT NOT NULL,
+            time INTEGER NOT NULL,
+            tzOffset INTEGER NOT NULL,
+            subject TEXT NOT NULL,
+            message TEXT NOT NULL)""",
+        """CREATE TABLE IF NOT EXISTS edges (
+            child INTEGER NOT NULL,
+            parent INTEGER NOT NULL,
+            PRIMARY KEY (child,parent)) WITHOUT ROWID""",
+        """CREATE TABLE IF NOT EXISTS tips (
+            scope TEXT NOT NULL,
+            hash TEXT NOT NULL,
+            PRIMARY KEY (scope,hash))""",
+        """CREATE TABLE IF NOT EXISTS tokens (
+            id INTEGER PRIMARY KEY,
+            token TEXT NOT NULL UNIQUE)""",
+        """CREATE TABLE IF NOT EXISTS postings (
+            tokenId INTEGER NOT NULL,
+            commitId INTEGER NOT NULL,
+            PRIMARY KEY (tokenId,commitId)) WITHOUT ROWID""",
+        """CREATE TABLE IF NOT EXISTS state (
+            name TEXT PRIMARY KEY,
+            value INTEGER NOT NULL)""")
+
+    # message words, as stored in the tokens table
+    TOKEN_RE=re.compile(r'\w+')
+    # anything that makes a git --grep pattern more than a plain string
+    # (these are the special characters of a basic regular expression)
+    GREP_REGEX_CHARS=re.compile(r'[.\[\]*^$\\]')
+    # shorter partial words match too many tokens to be worth looking up
+    MIN_PARTIAL_TOKEN=3
+    # how many commits to ask sqlite for at once
+    QUERY_BATCH_SIZE=500
+
+    def __init__(self,
+        localRepoPath:FilePathCompatible='.',
+        backend:typing.Optional[GitBackend]=None):
+        """
+        :backend: what runs git (default is the repo's getBackend())
+        """
+        repoPath=findRepoPath(localRepoPath)
+        gitDir=findGitDir(localRepoPath)
+        if repoPath is None or gitDir is None:
+            raise FileNotFoundError(f'"{localRepoPath}" is not a git repo')
+        self.repoPath:str=repoPath
+        self.filename:str=os.path.join(
+            gitDir,self.INDEX_DIRECTORY,self.INDEX_FILENAME)
+        self._db:typing.Optional[sqlite3.Connection]=None
+        self._githubUrl:typing.Any=None
+        self._backend=backend
+
+    @property
+    def db(self)->sqlite3.Connection:
+        """
+        The sqlite database (opened and created on demand)
+        """
+        if self._db is None:
+            os.makedirs(os.path.dirname(self.filename),exist_ok=True)
+            self._db=sqlite3.connect(self.filename)
+            with self._db:
+                for statement in self.SCHEMA:
+                    self._db.execute(statement)
+                self._buildEdges()
+        return self._db
+
+    def _buildEdges(self)->None:
+        """
+        Fill in the edges table for an index created
+        before it existed
+        """
+        db=self._db
+        assert db is not None
+        if db.execute(
+            "SELECT 1 FROM state WHERE name='edgesBuilt'").fetchone():
+            return
+        self._addEdges([(h,parent) for h,parents in
+            db.execute('SELECT hash,parents FROM commits')
+            for parent in parents.split()])
+        db.execute("INSERT OR REPLACE INTO state VALUES ('edgesBuilt',1)")
+
+    def _addEdges(self,edges:typing.List[typing.Tuple[str,str]])->None:
+        """
+        Add (child,parent) hash pairs to the edges table
+        (both must already be in the commits table)
+        """
+        db=self._db
+        assert db is not None
+        db.execute("""CREATE TEMP TABLE IF NOT EXISTS newEdges (
+            child TEXT NOT NULL,
+            parent TEXT NOT NULL)""")
+        db.executemany('INSERT INTO temp.newEdges VALUES (?,?)',edges)
+        db.execute("""INSERT OR IGNORE INTO edges
+            SELECT c.rowid,p.rowid FROM temp.newEdges AS e
+                JOIN commits AS c ON c.hash=e.child
+                JOIN commits AS p ON p.hash=e.parent""")
+        db.execute('DELETE FROM temp.newEdges')
+
+    def close(self)->None:
+        """
+        Close the underlying database
+        """
+        if self._db is not None:
+            self._db.close()
+            self._db=None
+
+    @property
+    def backend(self)->GitBackend:
+        """
+        What performs the git operations
+        """
+        if self._backend is None:
+            return getBackend(self.repoPath)
+        return self._backend
+
+    def _git(self,*args:str)->str:
+        """
+        Run a quick git command in the repo and return its stdout
+        """
+        return self.backend.run(args).check().out
+
+    def currentTips(self,revs:typing.Iterable[str]=('HEAD',))->typing.Set[str]:
+        """
+        Resolve revisions (eg "HEAD" or "--all") to the commit
+        hashes they currently point to
+        """
+        try:
+            # (rev-list rather than rev-parse so annotated tags
+            # are peeled down to their commits)
+            return set(self._git('rev-list','--no-walk',*revs).split())
+        except GitException:
+            # eg, HEAD of a brand new repo with no commits yet
+            return set()
+
+    def indexedTips(self,revs:typing.Iterable[str]=('HEAD',))->typing.Set[str]:
+        """
+        The tips that were ingested the last time revs were refreshed
+        """
+        cursor=self.db.execute('SELECT hash FROM tips WHERE scope=?',
+            (' '.join(revs),))
+        return {row[0] for row in cursor}
+
+    def isCurrent(self,revs:typing.Iterable[str]=('HEAD',))->bool:
+        """
+        Is the index up to date for these revisions?
+        """
+        revs=tuple(revs)
+        return self.indexedTips(revs)==self.currentTips(revs)
+
+    def refresh(self,revs:typing.Iterable[str]=('HEAD',))->int:
+        """
+        Bring the index up to date for the given revisions
+
+        Only commits reachable from the new tips, but not from anything
+        that was previously ingested, are read from git.
+
+        :return: the number of new commits ingested
+        """
+        revs=tuple(revs)
+        scope=' '.join(revs)
+        newTips=self.currentTips(revs)
+        if newTips==self.indexedTips(revs):
+            return 0
+        oldTips={row[0] for row in self.db.execute('SELECT hash FROM tips')}
+        count=0
+        with self.db:
+            if newTips:
+                try:
+                    count=self._ingest(list(newTips),list(oldTips))
+                except GitException:
+                    # old tips may have been garbage collected,
+                    # so ingest everything
+                    count=self._ingest(list(newTips),[])
+            self.db.execute('DELETE FROM tips WHERE scope=?',(scope,))
+            self.db.executemany('INSERT INTO tips (scope,hash) VALUES (?,?)',
+                ((scope,tip) for tip in newTips))
+        return count
+
+    def _ingest(self,
+        newTips:typing.List[str],
+        oldTips:typing.List[str]
+        )->int:
+        """
+        Add everything in oldTips..newTips to the index
+
+        (the tips are sent on stdin, since a repo with a great many
+        refs could have too many for a command line)
+        """
+        from gitTools.gitLogRecords import (
+            LOG_ARGS,iterLogRecords,commitFromLogRecord)
+        revs=[f'{tip}\n' for tip in newTips]
+        revs.extend(f'^{tip}\n' for tip in oldTips)
+        chunks=self.backend.stream(['log',*LOG_ARGS,'--stdin'],
+            ''.join(revs).encode('ascii'))
+        count=0
+        edges:typing.List[typing.Tuple[str,str]]=[]
+        def rows()->typing.Iterator[typing.Tuple[typing.Any,...]]:
+            nonlocal count
+            for record in iterLogRecords(chunks):
+                commit=commitFromLogRecord(record,
+                    localRepoPath=self.repoPath)
+                edges.extend((commit.hash,p) for p in commit.parents)
+                date=commit.date
+                if date is None:
+                    time=0
+                    tzOffset=0
+                else:
+                    time=int(date.timestamp())
+                    offset=date.utcoffset()
+                    tzOffset=0 if offset is None else int(offset.total_seconds()//60) # noqa: E501 # pylint: disable=line-too-long
+                count+=1
+                yield (commit.hash,' '.join(commit.parents),
+                    commit.author,commit.authorEmail,time,tzOffset,
+                    commit.description.split('\n',1)[0],commit.description)
+        self.db.executemany(
+            'INSERT OR IGNORE INTO commits VALUES (?,?,?,?,?,?,?,?)',rows())
+        self._addEdges(edges)
+        return count
+
+    def _commitFromRow(self,row:typing.Sequence[typing.Any])->GitCommit:
+        """
+        Create a GitCommit from a database row
+        """
+        hash,parents,author,authorEmail,time,tzOffset,_,message=row # noqa: E501 # pylint: disable=W0622
+        commit=GitCommit(hash,githubUrl=self._githubUrl,
+            localRepoPath=self.repoPath)
+        commit.parents=parents.split()
+        commit.author=author
+        commit.authorEmail=authorEmail
+        commit.setTime(time,tzOffset)
+        commit.description=message
+        return commit
+
+    # everything reachable from the tips in the temp.wantedTips table
+    REACHABLE_SQL="""WITH RECURSIVE reachable(id) AS (
+            SELECT commits.rowid FROM commits
+                JOIN temp.wantedTips ON commits.hash=wantedTips.hash
+            UNION
+            SELECT edges.parent FROM edges
+                JOIN reachable ON edges.child=reachable.id)"""
+
+    def _setWantedTips(self,tips:typing.Iterable[str])->None:
+        """
+        Put the tips to start from into the temp.wantedTips table
+        (so there is no limit on how many there can be)
+        """
+        self.db.execute(
+            'CREATE TEMP TABLE IF NOT EXISTS wantedTips (hash TEXT PRIMARY KEY)') # noqa: E501 # pylint: disable=line-too-long
+        self.db.execute('DELETE FROM temp.wantedTips')
+        self.db.executemany(
+            'INSERT OR IGNORE INTO temp.wantedTips VALUES (?)',
+            ((tip,) for tip in tips))
+
+    def reachable(self,tips:typing.Iterable[str])->typing.Set[str]:
+        """
+        All indexed commit hashes reachable from the given tips
+        """
+        self._setWantedTips(tips)
+        return {row[0] for row in self.db.execute(
+            self.REACHABLE_SQL+""" SELECT commits.hash FROM commits
+                JOIN reachable ON commits.rowid=reachable.id""")}
+
+    def commits(self,revs:typing.Iterable[str]=('HEAD',))->GitCommits:
+        """
+        Get all commits reachable from revs, refreshing the
+        index first if it is not current
+        """
+        revs=tuple(revs)
+        self.refresh(revs)
+        if self._githubUrl is None:
+            self._githubUrl=githubUrl(self.repoPath)
+        self._setWantedTips(self.indexedTips(revs))
+        ret=GitCommits(repoPath=self.repoPath)
+        ret.append(self._commitFromRow(row) for row in self.db.execute(
+            self.REACHABLE_SQL+""" SELECT commits.* FROM commits
+                JOIN reachable ON commits.rowid=reachable.id
+                ORDER BY commits.time"""))
+        return ret
+
+    def indexMessages(self)->int:
+        """
+        Add any commits whose messages have not been
+        indexed yet to the message index
+
+        :return: the number of commits indexed
+        """
+        row=self.db.execute(
+            "SELECT value FROM state WHERE name='messagesIndexed'").fetchone()
+        lastId=0 if row is None else row[0]
+        rows=self.db.execute(
+            'SELECT rowid,message FROM commits WHERE rowid>? ORDER BY rowid',
+            (lastId,)).fetchall()
+        if not rows:
+            return 0
+        tokenIds:typing.Dict[str,int]={}
+        def tokenId(token:str)->int:
+            ret=tokenIds.get(token)
+            if ret is None:
+                self.db.execute(
+                    'INSERT OR IGNORE INTO tokens (token) VALUES (?)',(token,))
+                ret=self.db.execute('SELECT id FROM tokens WHERE token=?',
+                    (token,)).fetchone()[0]
+                tokenIds[token]=ret
+            return ret
+        with self.db:
+            for commitId,message in rows:
+                tokens=set(self.TOKEN_RE.findall(message.lower()))
+                self.db.executemany(
+                    'INSERT OR IGNORE INTO postings VALUES (?,?)',
+                    ((tokenId(token),commitId) for token in tokens))
+            self.db.execute(
+                'INSERT OR REPLACE INTO state VALUES (?,?)',
+                ('messagesIndexed',rows[-1][0]))
+        return len(rows)
+
+    def _tokenIds(self,token:str,start:bool,end:bool)->typing.List[int]:
+        """
+        Ids of all indexed tokens that a word from a search could be
+
+        :start: the word is at the start of the search string,
+            so it may be the tail end of a longer token
+        :end: the word is at the end of the search string,
+            so it may be the beginning of a longer token
+        """
+        if not start and not end:
+            sql,params='SELECT id FROM tokens WHERE token=?',(token,)
+        elif not start:
+            sql,params='SELECT id FROM tokens WHERE token>=? AND token<?',\
+                (token,token+'\U0010ffff')
+        else:
+            sql,params='SELECT id,token FROM tokens WHERE instr(token,?)>0',\
+                (token,)
+        ret=[]
+        for row in self.db.execute(sql,params):
+            if len(row)==1 or end or row[1].endswith(token):
+                ret.append(row[0])
+        return ret
+
+    def _candidates(self,find:str)->typing.Optional[typing.Set[int]]:
+        """
+        The ids of commits whose messages could contain find
+
+        :return: None if the message index can't narrow it down
+        """
+        lowered=find.lower()
+        words=list(self.TOKEN_RE.finditer(lowered))
+        ret:typing.Optional[typing.Set[int]]=None
+        for word in words:
+            token=word.group()
+            start=word.start()==0
+            end=word.end()==len(lowered)
+            if (start or end) and len(token)<self.MIN_PARTIAL_TOKEN:
+                continue
+            ids=self._tokenIds(token,start,end)
+            commitIds:typing.Set[int]=set()
+            for i in range(0,len(ids),self.QUERY_BATCH_SIZE):
+                batch=ids[i:i+self.QUERY_BATCH_SIZE]
+                commitIds.update(row[0] for row in self.db.execute(
+                    'SELECT commitId FROM postings WHERE tokenId IN (%s)'%
+                    ','.join('?'*len(batch)),batch))
+            ret=commitIds if ret is None else ret&commitIds
+            if not ret:
+                break
+        return ret
+
+    def grep(self,
+        find:str,
+        revs:typing.Iterable[str]=('--all',)
+        )->typing.Optional[GitCommits]:
+        """
+        Find commits whose message contains a string, the same as
+            git log --all --grep=find
+        but from the index
+
+        Commits that are no longer reachable (eg, after a rebase) are
+        only forgotten when the index is deleted.
+
+        :return: matching commits, or None if find is a regular
+            expression, which the index can't answer
+        """
+        if not find or '\n' in find or self.GREP_REGEX_CHARS.search(find):
+            return None
+        revs=tuple(revs)
+        self.refresh(revs)
+        self.indexMessages()
+        if self._githubUrl is None:
+            self._githubUrl=githubUrl(self.repoPath)
+        candidates=self._candidates(find)
+        if candidates is None:
+            rows=self.db.execute(
+                'SELECT rowid,* FROM commits WHERE instr(message,?)>0',
+                (find,)).fetchall()
+        else:
+            ids=list(candidates)
+            rows=[]
+            for i in range(0,len(ids),self.QUERY_BATCH_SIZE):
+                batch=ids[i:i+self.QUERY_BATCH_SIZE]
+                rows.extend(self.db.execute(
+                    'SELECT rowid,* FROM commits WHERE rowid IN (%s)'%
+                    ','.join('?'*len(batch)),batch))
+        # commits are ingested newest first, so that breaks any ties
+        rows.sort(key=lambda row:(row[5],-row[0]))
+        ret=GitCommits(repoPath=self.repoPath)
+        ret.append(self._commitFromRow(row[1:]) for row in rows
+            if find in row[8])
+        return ret
@@ -0,0 +1,266 @@
+"""
+Per-commit line counts, without any patch text
+
+Most things that look at what a commit changed only want to know which
+files were touched and how many lines were added/removed.  That is
+exactly what "git log --numstat" reports, which is a tiny fraction of
+the size of the patches themselves.
+"""
+import typing
+import os
+import datetime
+import threading
+import collections
+from paths import FilePathCompatible
+from gitTools.backends import getBackend
+
+
+# like GitCommit.diff, merges are compared to their first parent
+NUMSTAT_ARGS=(
+    '--format=%x1e%H%x00%ad%x00',
+    '--date=raw',
+    '--numstat',
+    '-z',
+    '--diff-merges=first-parent')
+# how many commits worth of stats to keep around
+STATS_CACHE_SIZE=100000
+
+
+class FileStats:
+    """
+    Lines added/removed in one file by one commit
+    """
+    __slots__=('filename','added','removed','binary','oldFilename')
+
+    def __init__(self,
+        filename:str,
+        added:int=0,
+        removed:int=0,
+        binary:bool=False,
+        oldFilename:typing.Optional[str]=None):
+        """
+        :binary: a binary file (so there are no line counts)
+        :oldFilename: where the file was renamed from (if it was)
+        """
+        self.filename=filename
+        self.added=added
+        self.removed=removed
+        self.binary=binary
+        self.oldFilename=oldFilename
+
+    @property
+    def numLines(self)->int:
+        """
+        How many lines were changed (added or removed)
+        """
+        return self.added+self.removed
+
+    def __repr__(self)->str:
+        if self.binary:
+            return f'{self.filename} (binary)'
+        return f'{self.filename} +{self.added} -{self.removed}'
+
+
+class CommitStats:
+    """
+    The files changed by a commit, and how many lines in each
+    """
+    __slots__=('hash','files','time','tz')
+
+    def __init__(self,
+        hash:str, # pylint: disable=W0622
+        files:typing.Optional[typing.List[FileStats]]=None,
+        time:typing.Optional[float]=None,
+        tz:typing.Optional[int]=None):
+        """
+        :time: the (author) date of the commit, as a timestamp
+        :tz: utc offset in minutes
+        """
+        self.hash=hash
+        self.files:typing.List[FileStats]=[] if files is None else files
+        self.time=time
+        self.tz=tz
+
+    @property
+    def date(self)->typing.Optional[datetime.datetime]:
+        """
+        The (author) date of the commit
+        """
+        from gitTools.gitCommit import _timezone
+        if self.time is None:
+            return None
+        return datetime.datetime.fromtimestamp(self.time,_timezone(self.tz))
+
+    @property
+    def added(self)->int:
+        """
+        Total lines added
+        """
+        return sum(f.added for f in self.files)
+
+    @property
+    def removed(self)->int:
+        """
+        Total lines removed
+        """
+        return sum(f.removed for f in self.files)
+
+    @property
+    def numLines(self)->int:
+        """
+        Total lines changed (added or removed)
+        """
+        return sum(f.added+f.removed for f in self.files)
+
+    @property
+    def filenames(self)->typing.List[str]:
+        """
+        The names of all files changed
+        """
+        return [f.filename for f in self.files]
+
+    def __len__(self)->int:
+        return len(self.files)
+
+    def __iter__(self)->typing.Iterator[FileStats]:
+        return iter(self.files)
+
+    def __repr__(self)->str:
+        return f'{self.hash} {len(self.files)} files +{self.added} -{self.removed}' # noqa: E501 # pylint: disable=line-too-long
+
+
+def parseNumstat(
+    record:bytes
+    )->CommitStats:
+    """
+    Parse one record of "git log" output produced with NUMSTAT_ARGS
+    (not including the leading RECORD_START)
+    """
+    from gitTools.gitLogRecords import parseLogTime
+    hashValue,_,rest=record.partition(b'\0')
+    rawDate,_,rest=rest.partition(b'\0')
+    time,tz=parseLogTime(rawDate.decode('ascii',errors='ignore'))
+    stats=CommitStats(hashValue.decode('ascii'),time=time,tz=tz)
+    values=rest.split(b'\0')
+    i=0
+    numValues=len(values)
+    while i<numValues:
+        entry=values[i].lstrip()
+        i+=1
+        if not entry:
+            continue
+        added,_,rest=entry.partition(b'\t')
+        removed,_,filename=rest.partition(b'\t')
+        oldFilename=None
+        if not filename and i+1<numValues:
+            # a rename is "added\tremoved\t\0old\0new"
+            oldFilename=values[i].decode('utf-8',errors='replace')
+            filename=values[i+1]
+            i+=2
+        binary=added==b'-'
+        stats.files.append(FileStats(
+            filename.decode('utf-8',errors='replace'),
+            0 if binary else int(added),
+            0 if binary else int(removed),
+            binary,oldFilename))
+    return stats
+
+
+class _StatsCache:
+    """
+    A least-recently-used cache of CommitStats, keyed by (repoPath,hash)
+
+    Commits never change, so this is shared by everything.
+    """
+
+    def __init__(self,maxSize:int=STATS_CACHE_SIZE):
+        """ """
+        self.maxSize=maxSize
+        self._lock=threading.Lock()
+        self._stats:typing.OrderedDict[typing.Tuple[str,str],CommitStats]=\
+            collections.OrderedDict()
+
+    def get(self,key:typing.Tuple[str,str])->typing.Optional[CommitStats]:
+        with self._lock:
+            stats=self._stats.get(key)
+            if stats is not None:
+                self._stats.move_to_end(key)
+            return stats
+
+    def put(self,key:typing.Tuple[str,str],stats:CommitStats)->None:
+        with self._lock:
+            self._stats[key]=stats
+            self._stats.move_to_end(key)
+            while len(self._stats)>self.maxSize:
+                self._stats.popitem(last=False)
+
+    def clear(self)->None:
+        with self._lock:
+            self._stats.clear()
+
+
+_statsCache=_StatsCache()
+
+
+def clearStatsCache()->None:
+    """
+    Forget all remembered commit stats
+    """
+    _statsCache.clear()
+
+
+def iterCommitStats(
+    localRepoPath:FilePathCompatible,
+    params:typing.Iterable[str]=(),
+    stdin:typing.Optional[bytes]=None
+    )->typing.Generator[CommitStats,None,None]:
+    """
+    Stream the line counts of every commit in a "git log"
+    (a single git run, read as git produces it)
+
+    :params: any other git log parameters (revisions, paths, etc)
+    :stdin: anything to give git log (for --stdin)
+    """
+    from gitTools.gitLogRecords import iterLogRecords
+    backend=getBackend(str(localRepoPath))
+    repoKey=os.path.normcase(backend.repoPath)
+    for record in iterLogRecords(
+        backend.stream(['log',*NUMSTAT_ARGS,*params],stdin)):
+        stats=parseNumstat(record)
+        _statsCache.put((repoKey,stats.hash),stats)
+        yield stats
+
+
+def commitStats(
+    localRepoPath:FilePathCompatible,
+    hashes:typing.Iterable[str]
+    )->typing.Generator[CommitStats,None,None]:
+    """
+    Get the line counts of particular commits (in the order given)
+
+    Anything already known is not asked for again, and the rest is
+    streamed from a single "git log --no-walk=unsorted --stdin".
+    """
+    backend=getBackend(str(localRepoPath))
+    repoKey=os.path.normcase(backend.repoPath)
+    hashes=list(hashes)
+    wanted=list(dict.fromkeys(
+        h for h in hashes if _statsCache.get((repoKey,h)) is None))
+    streamed:typing.Iterator[CommitStats]=iter(())
+    if wanted:
+        streamed=iterCommitStats(localRepoPath,
+            ['--no-walk=unsorted','--stdin'],
+            '\n'.join(wanted).encode('ascii')+b'\n')
+    # (git answers in the order asked, so this only
+    # holds on to anything that was asked for twice)
+    found:typing.Dict[str,CommitStats]={}
+    for h in hashes:
+        stats=found.get(h) or _statsCache.get((repoKey,h))
+        while stats is None:
+            stats=next(streamed,None)
+            if stats is None:
+                stats=CommitStats(h)
+            elif stats.hash!=h:
+                found[stats.hash]=stats
+                stats=None
+        yield stats
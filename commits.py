@@ -3,96 +3,222 @@ Tools for working with git-log and searching for commits
 """
 import typing
 import os
-import datetime
-import subprocess
+import time
+import threading
+import concurrent.futures
 from paths import (
     URL,FileLocation,UrlCompatible,asFilePath,asUrl,FilePathCompatible)
-from k_runner.osrun import osrun
 from gitTools.gitCommit import GitCommit
 from gitTools.gitCommits import GitCommits
-from gitTools.gitRemotes import githubUrl
+from gitTools.backends import GitBackend,getBackend,STOP_POLL_SECONDS
+from gitTools.gitConfig import getConfig
 
 
-def gitLog(localRepoPath:FilePathCompatible,moreparams:str="")->GitCommits:
+def iterGitLog(
+    localRepoPath:FilePathCompatible,
+    moreparams:typing.Union[str,typing.Iterable[str]]="",
+    lazy:bool=False,
+    backend:typing.Optional[GitBackend]=None,
+    stop:typing.Optional[threading.Event]=None
+    )->typing.Generator[GitCommit,None,None]:
     """
-    get a git log and pythonify the results
+    Stream the git log, yielding each GitCommit as soon as git emits it
+
+    The output is read from the pipe incrementally, so memory stays
+    flat no matter how long the history is.
 
-    TODO: some of this is old/redundant and could leverage GitCommits
-    object like the other functions do
+    :moreparams: a single extra git log parameter, or a list of them
+    :lazy: only get the hashes, parents and dates from git, and
+        read the rest from the repo if and when it is used
+        (see GitCommit.lazy)
+    :backend: what runs git (default is the repo's getBackend())
+    :stop: when this is set, git is killed (from any thread)
     """
     if not isinstance(localRepoPath,str):
         localRepoPath=asUrl(localRepoPath).filePath # type: ignore
         if localRepoPath is None:
             raise FileNotFoundError()
-    localRepoPath=str(localRepoPath)
-    ret=GitCommits()
-    githubUrlValue=githubUrl(localRepoPath)
-    current:typing.Optional[GitCommit]=None
-    cmd=['git','log']
-    if moreparams:
-        cmd.append(moreparams)
-    result=osrun(cmd,workingDirectory=localRepoPath)
-    for line in result.stdouterr.split('\n'):
-        if not line:
-            continue
-        if line[0]==' ':
-            line=line.strip()
-            if current is None:
-                continue
-            elif not current.comment:
-                current.comment=line
-            else:
-                current.comment=f'{current.comment}\n{line}'
-            continue
-        tag,value=line.split(' ',1)
-        if tag=='commit':
-            if current is not None:
-                ret.append(current)
-            current=GitCommit(value,githubUrl=githubUrlValue)
-        elif tag=='Author:':
-            if current is not None:
-                current.author=value
-        elif tag=='Date:':
-            if current is not None:
-                current.date=datetime.datetime.strptime(
-                    value.strip(),'%a %b %d %H:%M:%S %Y %z')
-        elif tag=='Merge:':
-            if current is not None:
-                current.merge=value.split()
-        else:
-            print(f'Unknown log tag: "{tag}"')
-    if current is not None:
-        ret.append(current)
-    return ret
+    if isinstance(moreparams,str):
+        params=[moreparams] if moreparams else []
+    else:
+        params=list(moreparams)
+    if backend is None:
+        backend=getBackend(str(localRepoPath))
+    if lazy:
+        from gitTools.gitRemotes import githubUrl
+        from gitTools.gitLogRecords import LAZY_LOG_ARGS,lazyCommitsFromLog
+        yield from lazyCommitsFromLog(
+            backend.stream(['log',*LAZY_LOG_ARGS,*params],stop=stop),
+            githubUrl(backend.repoPath),backend.repoPath)
+        return
+    yield from backend.log(params,stop)
+
+
+def gitLog(
+    localRepoPath:FilePathCompatible,
+    moreparams:typing.Union[str,typing.Iterable[str]]="",
+    useIndex:bool=False,
+    compact:bool=False,
+    lazy:bool=False,
+    backend:typing.Optional[GitBackend]=None
+    )->GitCommits:
+    """
+    get a git log and pythonify the results
+
+    To walk a large history without holding all of it in memory,
+    use iterGitLog() instead.
+
+    :useIndex: when there are no moreparams, load the full history
+        from the on-disk CommitIndex (which only has to read
+        new commits from git)
+        NOTE: this creates/updates the index database in the .git
+        directory, so it is off unless asked for
+    :compact: return a CompactGitCommits, which needs about a
+        quarter of the memory for very long histories
+    :lazy: only load the author and message of each commit when
+        it is used (see GitCommit.lazy)
+    :backend: what runs git (default is the repo's getBackend())
+    """
+    if compact:
+        from gitTools.compactCommits import CompactGitCommits
+        return CompactGitCommits.fromGitLog(
+            localRepoPath,moreparams,backend)
+    if lazy:
+        return GitCommits(
+            iterGitLog(localRepoPath,moreparams,lazy=True,backend=backend),
+            repoPath=str(localRepoPath))
+    if useIndex and not moreparams:
+        import sqlite3
+        from gitTools.commitIndex import CommitIndex
+        try:
+            return CommitIndex(localRepoPath,backend).commits()
+        except (sqlite3.Error,OSError):
+            # unable to use the index (eg, read-only repo)
+            pass
+    return GitCommits(iterGitLog(localRepoPath,moreparams,backend=backend),
+        repoPath=str(localRepoPath))
 
 
 def gitCommitsForFunction(
     localRepoPath:FilePathCompatible,
     repoFilename:FilePathCompatible,
-    functionName:str
+    functionName:str,
+    backend:typing.Optional[GitBackend]=None,
+    stop:typing.Optional[threading.Event]=None
     )->GitCommits:
     """
     get all git commits for a given function in a file
+
+    :stop: when this is set, git is killed (from any thread)
     """
     # See also:
     #   https://git-scm.com/docs/git-log
     localRepoPath=asFilePath(localRepoPath)
     repoFilename=asFilePath(repoFilename).getRelativeTo(localRepoPath)
-    cmd=('git','log',f'-L:{functionName}:{repoFilename}')
-    po=subprocess.Popen(cmd,cwd=str(localRepoPath),
-        stdout=subprocess.PIPE,stderr=subprocess.PIPE)
-    out,err=po.communicate()
-    err=err.strip()
-    if err:
-        raise Exception(err.decode('utf-8'))
-    return GitCommits(gitLogOutput=out.decode('utf-8'))
+    return GitCommits(
+        iterGitLog(localRepoPath,f'-L:{functionName}:{repoFilename}',
+            backend=backend,stop=stop),
+        repoPath=str(localRepoPath))
+
+
+def iterCommitsForFunctions(
+    localRepoPath:FilePathCompatible,
+    repoFilename:FilePathCompatible,
+    functionNames:typing.Iterable[str],
+    workers:typing.Optional[int]=None,
+    cancel:typing.Optional[typing.Callable[[],bool]]=None,
+    backend:typing.Optional[GitBackend]=None
+    )->typing.Generator[typing.Tuple[str,GitCommits],None,None]:
+    """
+    get all git commits for many functions in a file, yielding
+    (functionName,GitCommits) in whatever order they complete
+
+    Each function is a separate "git log -L", run several at a time.
+    (Threads are enough here, since the real work happens in the
+    git processes they are waiting on.)
+
+    :workers: how many git processes to run at once
+        (defaults to the number of cpus, up to 8)
+    :cancel: polled while waiting, and once it returns True nothing
+        more is yielded and any git processes still running are killed
+        (eg, threading.Event().is_set)
+        Stopping iteration early does the same.
+    """
+    if workers is None:
+        workers=min(8,os.cpu_count() or 1)
+    workers=max(1,workers)
+    names=iter(functionNames)
+    pending:typing.Dict[concurrent.futures.Future,str]={}
+    # kills whatever git processes are still running when we are done
+    stop=threading.Event()
+    def cancelled()->bool:
+        return cancel is not None and cancel()
+    pool=concurrent.futures.ThreadPoolExecutor(workers)
+    def submitMore()->None:
+        # only keep "workers" in flight, so that cancelling
+        # does not leave a long queue behind
+        while len(pending)<workers and not cancelled():
+            name=next(names,None)
+            if name is None:
+                return
+            future=pool.submit(gitCommitsForFunction,
+                localRepoPath,repoFilename,name,backend,stop)
+            pending[future]=name
+    try:
+        submitMore()
+        while pending and not cancelled():
+            done,_=concurrent.futures.wait(pending,STOP_POLL_SECONDS,
+                return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                name=pending.pop(future)
+                yield name,future.result()
+                if cancelled():
+                    return
+            submitMore()
+    finally:
+        stop.set()
+        for future in pending:
+            future.cancel()
+        # (the killed processes end their threads soon enough,
+        # so there is no need to wait for them)
+        pool.shutdown(wait=False)
+
+
+def gitCommitsForFunctions(
+    localRepoPath:FilePathCompatible,
+    repoFilename:FilePathCompatible,
+    functionNames:typing.Iterable[str],
+    workers:typing.Optional[int]=None,
+    cancel:typing.Optional[typing.Callable[[],bool]]=None,
+    onResult:typing.Optional[typing.Callable[[str,GitCommits],None]]=None,
+    backend:typing.Optional[GitBackend]=None
+    )->typing.Dict[str,GitCommits]:
+    """
+    get all git commits for many functions in a file at once
+
+    :workers: how many git processes to run at once
+    :cancel: when this returns True, kill any git processes still
+        running and return what we have so far
+    :onResult: called with (functionName,GitCommits) as each one completes
+
+    See also:
+        iterCommitsForFunctions()
+    """
+    ret:typing.Dict[str,GitCommits]={}
+    for name,commits in iterCommitsForFunctions(
+        localRepoPath,repoFilename,functionNames,workers,cancel,backend):
+        ret[name]=commits
+        if onResult is not None:
+            onResult(name,commits)
+    return ret
 
 
 def gitCommitsForLine(
     localRepoPath:FilePathCompatible,
     repoFilename:FilePathCompatible,
     startLine:int,endLine:typing.Optional[int]=None,
-    offset:int=0)->GitCommits:
+    offset:int=0,
+    backend:typing.Optional[GitBackend]=None)->GitCommits:
     """
     get all git commits for a given line(s)
 
@@ -103,27 +229,211 @@ def gitCommitsForLine(
     #   https://git-scm.com/docs/git-log
     localRepoPath=asFilePath(localRepoPath)
     repoFilename=asFilePath(repoFilename).getRelativeTo(localRepoPath)
+    from gitTools.gitLogRecords import LOG_ARGS
     if endLine is not None:
-        cmd=('git','log',f'-L:{startLine},{endLine}:{repoFilename}')
+        cmd=('log',*LOG_ARGS,f'-L{startLine},{endLine}:{repoFilename}')
     elif offset!=0:
         offs=str(offset)
         if offset>0:
             offs='+'+offs
-        cmd=('git','log',f'-L:{startLine},{offs}:{repoFilename}')
+        cmd=('log',*LOG_ARGS,f'-L{startLine},{offs}:{repoFilename}')
     else:
-        cmd=('git','log',f'-L:{startLine}:{repoFilename}')
-    po=subprocess.Popen(cmd,cwd=localRepoPath,
-        stdout=subprocess.PIPE,stderr=subprocess.PIPE)
-    out,err=po.communicate()
-    err=err.strip()
-    if err:
-        raise Exception(err.decode('utf-8'))
-    return GitCommits(gitLogOutput=out.decode('utf-8'))
+        cmd=('log',*LOG_ARGS,f'-L{startLine},{startLine}:{repoFilename}')
+    if backend is None:
+        backend=getBackend(localRepoPath)
+    result=backend.run(cmd).check()
+    return GitCommits(gitLogOutput=result.stdout,repoPath=str(localRepoPath))
 gitCommitsForLines=gitCommitsForLine
 
 
+LineRange=typing.Tuple[FilePathCompatible,int,int]
+# the most line ranges to give a single "git log"
+LINE_LOG_BATCH_SIZE=16
+
+
+def _lineLogFiles(
+    record:bytes
+    )->typing.Tuple[bytes,bytes,typing.List[typing.Tuple[str,bool,bytes]]]:
+    """
+    Split a "git log -L" record up into the patch of each file
+
+    :return: (fields,gap,[(path,created,patch)])
+        where fields are the commit's log fields, gap is whatever comes
+        between them and the first patch, and created means the patch
+        adds the file
+    """
+    from gitTools.gitLogRecords import LOG_FIELDS
+    from gitTools.diff import FILE_DIFF_HEADER,fileDiffName
+    fieldsEnd=0
+    for _ in LOG_FIELDS:
+        fieldsEnd=record.find(b'\0',fieldsEnd)+1
+        if fieldsEnd==0:
+            return record,b'',[]
+    starts=[]
+    if record.startswith(FILE_DIFF_HEADER,fieldsEnd):
+        starts.append(fieldsEnd)
+    separator=b'\n'+FILE_DIFF_HEADER
+    idx=record.find(separator,fieldsEnd)
+    while idx>=0:
+        starts.append(idx+1)
+        idx=record.find(separator,idx+1)
+    files=[]
+    for start,nextStart in zip(starts,[*starts[1:],len(record)]):
+        eol=record.find(b'\n',start,nextStart)
+        if eol<0:
+            eol=nextStart
+        files.append((
+            fileDiffName(record[start+len(FILE_DIFF_HEADER):eol]),
+            record.startswith(b'--- /dev/null\n',eol+1),
+            record[start:nextStart]))
+    gap=record[fieldsEnd:starts[0]] if starts else b''
+    return record[:fieldsEnd],gap,files
+
+
+def _lineLogBatch(
+    localRepoPath:str,
+    lineRanges:typing.Sequence[typing.Tuple[str,str]],
+    rev:str,
+    backend:typing.Optional[GitBackend]=None
+    )->typing.Optional[typing.List[GitCommits]]:
+    """
+    Run a single "git log" for several line ranges, each in a
+    different file, and split its output back up by file
+
+    Each commit is given only the patch of its own file, the same
+    as if its range had had a git log to itself.
+
+    :lineRanges: [(path,"-Lstart,end:path")]
+    :return: a GitCommits for each range, or None if the output can't
+        be split up by filename with certainty (a merge is involved,
+        or a file was renamed or its name was reused), in which case
+        the ranges have to be run one at a time
+    """
+    from gitTools.gitRemotes import githubUrl
+    from gitTools.gitLogRecords import (
+        LOG_ARGS,iterLogRecords,commitFromLogRecord)
+    if backend is None:
+        backend=getBackend(localRepoPath)
+    githubUrlValue=githubUrl(backend.repoPath)
+    found:typing.Dict[str,typing.List[GitCommit]]={
+        path:[] for path,_ in lineRanges}
+    created:typing.Set[str]=set()
+    chunks=backend.stream(
+        ['log',*LOG_ARGS,*(arg for _,arg in lineRanges),rev])
+    try:
+        for record in iterLogRecords(chunks):
+            fields,gap,files=_lineLogFiles(record)
+            if len(fields.split(b'\0',2)[1].split())>1:
+                # (with several ranges, git can follow a merge's
+                # parents differently than it would for each one)
+                return None
+            for path,isCreated,patch in files:
+                commits=found.get(path)
+                if commits is None or path in created:
+                    # a file that was renamed, or a name used twice
+                    return None
+                if isCreated:
+                    created.add(path)
+                commits.append(commitFromLogRecord(fields+gap+patch,
+                    githubUrlValue,backend.repoPath))
+    finally:
+        chunks.close()
+    return [GitCommits(found[path],repoPath=localRepoPath)
+        for path,_ in lineRanges]
+
+
+def gitCommitsForLineRanges(
+    localRepoPath:FilePathCompatible,
+    ranges:typing.Iterable[LineRange],
+    rev:str='HEAD',
+    workers:typing.Optional[int]=None,
+    backend:typing.Optional[GitBackend]=None
+    )->typing.List[GitCommits]:
+    """
+    get all git commits for many line ranges at once
+
+    Ranges in different files are batched up into a single "git log"
+    with several -L arguments (up to LINE_LOG_BATCH_SIZE of them), whose
+    output is split back up by filename.  Ranges in the same file always
+    get a "git log -L" each, since git merges overlapping ranges in the
+    same file into a single hunk, after which there is no telling which
+    range a commit was for.  The same goes for a batch whose output
+    can't be split up by filename with certainty (where a merge, rename
+    or reused filename is involved), which is run again a range at a
+    time.  The git processes are run several at a time.
+
+    :ranges: [(repoFilename,startLine,endLine)] (1-based, inclusive)
+    :rev: where to start looking back from
+    :workers: how many git processes to run at once
+        (defaults to the number of cpus, up to 8)
+    :return: a GitCommits for each range, in the same order
+    """
+    from gitTools.objectStore import getObjectStore
+    localRepoPath=asFilePath(localRepoPath)
+    store=getObjectStore(localRepoPath)
+    found:typing.Set[str]=set()
+    lineRanges:typing.List[typing.Tuple[str,str]]=[]
+    for repoFilename,startLine,endLine in ranges:
+        path=str(asFilePath(repoFilename).getRelativeTo(localRepoPath))
+        path=path.replace(os.sep,'/')
+        if path not in found:
+            if store.read(f'{rev}:{path}') is None:
+                raise FileNotFoundError(f'No "{path}" in {rev}')
+            found.add(path)
+        lineRanges.append((path,f'-L{startLine},{endLine}:{path}'))
+    # the nth range in each file goes in the nth batch
+    batches:typing.List[typing.List[int]]=[]
+    perFile:typing.Dict[str,int]={}
+    for i,(path,_) in enumerate(lineRanges):
+        n=perFile.get(path,0)
+        perFile[path]=n+1
+        if n==len(batches):
+            batches.append([])
+        batches[n].append(i)
+    batches=[batch[start:start+LINE_LOG_BATCH_SIZE] for batch in batches
+        for start in range(0,len(batch),LINE_LOG_BATCH_SIZE)]
+    if workers is None:
+        workers=min(8,os.cpu_count() or 1)
+    def batchLog(batch:typing.List[int])->typing.Optional[typing.List[GitCommits]]: # noqa: E501 # pylint: disable=line-too-long
+        return _lineLogBatch(str(localRepoPath),
+            [lineRanges[i] for i in batch],rev,backend)
+    def lineLog(i:int)->GitCommits:
+        return GitCommits(
+            iterGitLog(localRepoPath,[lineRanges[i][1],rev],backend=backend),
+            repoPath=str(localRepoPath))
+    results:typing.List[typing.Optional[GitCommits]]=[None]*len(lineRanges)
+    with concurrent.futures.ThreadPoolExecutor(max(1,workers)) as pool:
+        batched=[batch for batch in batches if len(batch)>1]
+        for batch,commits in zip(batched,pool.map(batchLog,batched)):
+            if commits is not None:
+                for i,rangeCommits in zip(batch,commits):
+                    results[i]=rangeCommits
+        todo=[i for i,result in enumerate(results) if result is None]
+        for i,rangeCommits in zip(todo,pool.map(lineLog,todo)):
+            results[i]=rangeCommits
+    return results # type: ignore
+
+
+def _grepResult(commit:GitCommit)->typing.Dict[str,typing.Any]:
+    """
+    The dict gitGrep() yields for a commit
+
+    (mirrors the fields of the default "git log" output)
+    """
+    ret:typing.Dict[str,typing.Any]={'commit':commit.hash}
+    if commit.merge:
+        ret['merge']=tuple(commit.merge)
+    ret['author']=f'{commit.author} <{commit.authorEmail}>'
+    date=commit.date
+    if date is not None:
+        ret['date']=f'{date:%a %b} {date.day} {date:%H:%M:%S %Y %z}'
+    ret['comment']=commit.description.strip()
+    return ret
+
+
 def gitGrep(find:str,
     gitCheckouPath:FilePathCompatible,
+    useIndex:bool=False
     )->typing.Generator[typing.Dict[str,typing.Any],None,None]:
     """
     Grep the git log to find some particular thing
@@ -132,40 +442,36 @@ def gitGrep(find:str,
     just as easy to run
         git log --all --grep='xyz'
 
-    TODO: currently not getting any output lines!
+    Results are yielded newest first, as git finds them.
+
+    :useIndex: answer plain-string searches from the message index
+        in the CommitIndex (which only has to read new commits
+        from git), rather than searching the whole log every time
+        NOTE: this creates/updates the index database in the .git
+        directory, so it is off unless asked for
     """
-    info=findRepoInfo(gitCheckouPath)
-    if not info:
+    repoPath=findRepoPath(gitCheckouPath)
+    if repoPath is None:
         raise Exception(f'No repo at "{gitCheckouPath}"')
-    cmd=['git','log','--all',f'--grep="{find}"']
-    #print('in',cwd)
-    #print('$>',' '.join(cmd))
-    result=osrun(cmd,workingDirectory=info['repoPath'])
-    stderr=result.stderr.strip()
-    if stderr:
-        raise Exception(stderr)
-    current:typing.Dict[str,typing.Any]={}
-    currentComment:typing.List[str]=[]
-    for line in result.stdout.strip().split('\n'):
-        if line.startswith('commit '):
-            if current:
-                current['comment']='\n'.join(currentComment).strip()
-                yield current
-            current={'commit':line.split()[-1]}
-            currentComment=[]
-        elif current:
-            if line.startswith('Merge:'):
-                x=line.split()
-                current['merge']=(x[-2],x[-1])
-            elif line.startswith('Author:'):
-                current['author']=line.split(maxsplit=1)[-1]
-            elif line.startswith('Date:'):
-                current['date']=line.split(maxsplit=1)[-1]
-            else:
-                currentComment.append(line.strip())
-    if current:
-        current['comment']='\n'.join(currentComment).strip()
-        yield current
+    if useIndex:
+        import sqlite3
+        from gitTools.commitIndex import CommitIndex
+        found=None
+        try:
+            index=CommitIndex(repoPath)
+            try:
+                found=index.grep(find)
+            finally:
+                index.close()
+        except (sqlite3.Error,OSError):
+            # unable to use the index (eg, read-only repo)
+            pass
+        if found is not None:
+            for idx in range(len(found)-1,-1,-1):
+                yield _grepResult(found[idx])
+            return
+    for commit in iterGitLog(repoPath,['--all',f'--grep={find}']):
+        yield _grepResult(commit)
 
 
 def githubFileReferenceUrl(
@@ -207,11 +513,92 @@ def githubFileReferenceUrl(
     return URL(ret)
 
 
+# how long a remembered repo root is trusted before checking that
+# no .git has since appeared or disappeared along the way
+REPO_ROOT_RECHECK_SECONDS=2.0
+
+# {directory:(repo root or None,directory mtime,when last checked)}
+_repoRoots:typing.Dict[str,typing.Tuple[typing.Optional[str],float,float]]={} # noqa: E501 # pylint: disable=line-too-long
+# {(repo root,common):(.git mtime,git directory)}
+_gitDirs:typing.Dict[typing.Tuple[str,bool],typing.Tuple[float,str]]={}
+
+
+def clearRepoPathCache()->None:
+    """
+    Forget all remembered repo roots and git directories
+    """
+    _repoRoots.clear()
+    _gitDirs.clear()
+
+
+def _mtime(filename:str)->typing.Optional[float]:
+    try:
+        return os.stat(filename).st_mtime
+    except OSError:
+        return None
+
+
+def _cachedRepoRoot(
+    directory:str,
+    now:float
+    )->typing.Tuple[bool,typing.Optional[str]]:
+    """
+    Look up the remembered repo root for a directory
+
+    Anything older than REPO_ROOT_RECHECK_SECONDS is checked by
+    making sure that none of the directories between here and the
+    root have changed (which they would if a .git came or went).
+
+    :return: (found,repo root)
+    """
+    entry=_repoRoots.get(directory)
+    if entry is None:
+        return False,None
+    root,mtime,checked=entry
+    if now-checked<REPO_ROOT_RECHECK_SECONDS:
+        return True,root
+    if _mtime(directory)!=mtime:
+        return False,None
+    if root!=directory:
+        parent=os.path.dirname(directory)
+        if parent!=directory:
+            found,parentRoot=_cachedRepoRoot(parent,now)
+            if not found or parentRoot!=root:
+                return False,None
+    _repoRoots[directory]=(root,mtime,now)
+    return True,root
+
+
+def _findRepoRoot(directory:str,now:float)->typing.Optional[str]:
+    """
+    Find the repo root for a directory, remembering the answer for
+    it and every directory above it that had to be looked at
+    """
+    found,root=_cachedRepoRoot(directory,now)
+    if found:
+        return root
+    mtime=_mtime(directory)
+    if os.path.exists(os.path.join(directory,'.git')):
+        root=directory
+    else:
+        parent=os.path.dirname(directory)
+        root=None if parent==directory else _findRepoRoot(parent,now)
+    if mtime is not None:
+        _repoRoots[directory]=(root,mtime,now)
+    return root
+
+
 def findRepoPath(localRepoPath:FilePathCompatible)->typing.Optional[str]:
     """
-    traverse up the file tree until you find a path with .git directory in it
+    traverse up the file tree until you find a path with .git in it
+    (a directory, or for worktrees and submodules a "gitdir:" file)
 
     if there is one, return it. Otherwise, return None
+
+    Answers are remembered per directory, so all of the files in
+    a directory (and all of the directories below a known one)
+    share the same lookup.  See REPO_ROOT_RECHECK_SECONDS and
+    clearRepoPathCache().
     """
     if not isinstance(localRepoPath,str):
         localRepoPath=asUrl(localRepoPath).filePath # type: ignore
@@ -220,13 +607,51 @@ def findRepoPath(localRepoPath:FilePathCompatible)->typing.Optional[str]:
         localRepoPath=str(localRepoPath)
     else:
         localRepoPath=os.path.abspath(os.path.expandvars(localRepoPath))
-    try:
-        while True:
-            if os.path.exists(f'{localRepoPath}{os.sep}.git'):
-                return localRepoPath
-            localRepoPath=localRepoPath.rsplit(os.sep,1)[-2]
-    except IndexError: # because the rsplit did not work
-        pass
+    now=time.monotonic()
+    found,root=_cachedRepoRoot(localRepoPath,now)
+    if found:
+        return root
+    if not os.path.isdir(localRepoPath):
+        localRepoPath=os.path.dirname(localRepoPath)
+    return _findRepoRoot(localRepoPath,now)
+
+
+def findGitDir(
+    localRepoPath:FilePathCompatible,
+    common:bool=True
+    )->typing.Optional[str]:
+    """
+    Find the actual git directory for a repo
+
+    Usually this is just the .git directory, but for worktrees and
+    submodules .git is a file pointing somewhere else ("gitdir: ...")
+
+    :common: for a linked worktree, return the directory shared by
+        all worktrees (where objects, refs and config live) rather
+        than the per-worktree one
+    """
+    repoPath=findRepoPath(localRepoPath)
+    if repoPath is None:
+        return None
+    gitDir=os.path.join(repoPath,'.git')
+    mtime=_mtime(gitDir)
+    cached=_gitDirs.get((repoPath,common))
+    if cached is not None and mtime is not None and cached[0]==mtime:
+        return cached[1]
+    if os.path.isfile(gitDir):
+        with open(gitDir,'r',encoding='utf-8',errors='ignore') as f:
+            line=f.readline().strip()
+        if line.startswith('gitdir:'):
+            gitDir=os.path.normpath(os.path.join(repoPath,line[7:].strip()))
+    if common:
+        commonDirFile=os.path.join(gitDir,'commondir')
+        if os.path.isfile(commonDirFile):
+            with open(commonDirFile,'r',encoding='utf-8',errors='ignore') as f:
+                commonDir=f.read().strip()
+            gitDir=os.path.normpath(os.path.join(gitDir,commonDir))
+    if mtime is not None:
+        _gitDirs[(repoPath,common)]=(mtime,gitDir)
+    return gitDir
 
 
 def findRepoInfo(localRepoPath:UrlCompatible)->typing.Dict[str,str]:
@@ -238,17 +663,7 @@ def findRepoInfo(localRepoPath:UrlCompatible)->typing.Dict[str,str]:
     if repoPath is None:
         return ret
     ret['repoPath']=repoPath
-    cmd=['git','config','--get-regexp','.*']
-    po=subprocess.Popen(cmd,shell=True,
-        stdout=subprocess.PIPE,stderr=subprocess.PIPE,cwd=repoPath)
-    out,err=po.communicate()
-    err=err.strip()
-    if err:
-        raise Exception(err)
-    for line in out.decode('utf-8',errors="ignore").split('\n'):
-        kv=line.strip().split(maxsplit=1)
-        if len(kv)==2:
-            ret[kv[0]]=kv[1]
+    ret.update(getConfig(repoPath).asDict())
     remoteOrigin=ret['remote.origin.url'].split('/')
     ret['githubUser']=remoteOrigin[3]
     ret['githubProject']=remoteOrigin[-1].split('.',1)[0]
@@ -3,10 +3,87 @@ A set of differences for a git file
 """
 import typing
 import datetime
+import mmap
+import tempfile
 from paths import Url
 from codeTools import FileDifferences,MultiFileDifferences
 if typing.TYPE_CHECKING:
     from gitTools.gitCommit import GitCommit
+    from gitTools.diffLimits import SkippedFile
+
+
+# the start of each file in a diff
+FILE_DIFF_HEADER=b'diff --git '
+# the start of each hunk within a file
+HUNK_HEADER=b'@@ '
+# diffs bigger than this are kept in a temporary file rather than memory
+DIFF_SPOOL_SIZE=16*1024*1024
+
+
+DiffDataCompatible=typing.Union[
+    str,bytes,bytearray,memoryview,
+    typing.BinaryIO,typing.Iterable[bytes]]
+
+
+def decodeDiff(data:typing.Union[bytes,memoryview])->str:
+    """
+    Decode (part of) a diff to text
+
+    (works straight from a memoryview, without copying it to bytes first)
+    """
+    return str(data,'utf-8','replace')
+
+
+def _unquotePath(path:bytes)->bytes:
+    """
+    Undo git's quoting of unusual filenames, eg "a/\\303\\251t\\303\\251"
+    """
+    if not path.startswith(b'"') or not path.endswith(b'"'):
+        return path
+    path=path[1:-1]
+    ret=bytearray()
+    i=0
+    while i<len(path):
+        c=path[i]
+        i+=1
+        if c!=0x5c: # backslash
+            ret.append(c)
+            continue
+        c=path[i]
+        i+=1
+        if 0x30<=c<=0x37: # octal
+            ret.append(int(path[i-1:i+2],8))
+            i+=2
+        else:
+            ret+={b'n':b'\n',b't':b'\t',b'a':b'\a',b'b':b'\b',
+                b'f':b'\f',b'r':b'\r',b'v':b'\v'}.get(bytes([c]),bytes([c]))
+    return bytes(ret)
+
+
+def fileDiffName(header:bytes)->str:
+    """
+    Get the (new) filename out of a "diff --git a/x b/y" header line
+    (without the "diff --git ")
+    """
+    header=header.rstrip(b'\r\n')
+    if header.startswith(b'"') or header.endswith(b'"'):
+        # at least one of the names is quoted
+        if header.endswith(b'"'):
+            newName=header[header.rindex(b' "')+1:]
+        else:
+            newName=header[header.rindex(b' b/')+1:]
+        name=_unquotePath(newName)
+    else:
+        # usually both names are the same, which takes
+        # care of any spaces, including " b/"
+        size=(len(header)-5)//2
+        if len(header)%2==1 and header[2:2+size]==header[size+5:]:
+            name=b'b/'+header[size+5:]
+        else:
+            name=header[header.find(b' b/')+1:]
+    if name.startswith(b'b/'):
+        name=name[2:]
+    return name.decode('utf-8',errors='replace')
 
 
 class GitDifferences(FileDifferences):
@@ -31,22 +108,89 @@ class GitDifferences(FileDifferences):
         if u is None:
             return None
         u=str(u).split('/commit',1)[0]
-        u=f'{u}/blob/{self.commit.hash}/data/{self.filename}'
+        u=f'{u}/blob/{self.commit.hash}/{self.filename}'
         return Url(u)
 
 
+class _FileDiffs(typing.MutableMapping):
+    """
+    The {filename:GitDifferences} of a GitMultiDifferences
+
+    Each GitDifferences is only created when it is asked for
+    (and is not kept, so looping through them all never holds
+    more than one at a time).
+    """
+
+    def __init__(self,diff:"GitMultiDifferences"):
+        self.diff=diff
+
+    def __getitem__(self,filename:str)->GitDifferences:
+        return self.diff.fileDiff(filename)
+
+    def __setitem__(self,filename:str,fileDiff:GitDifferences)->None:
+        self.diff._assigned[filename]=fileDiff # pylint: disable=W0212
+
+    def __delitem__(self,filename:str)->None:
+        diff=self.diff
+        if filename not in self:
+            raise KeyError(filename)
+        diff._assigned.pop(filename,None) # pylint: disable=W0212
+        diff._files.pop(filename,None) # pylint: disable=W0212
+
+    def __iter__(self)->typing.Iterator[str]:
+        return iter(self.diff.filenames)
+
+    def __len__(self)->int:
+        return len(self.diff.filenames)
+
+    def __contains__(self,filename:object)->bool:
+        diff=self.diff
+        return filename in diff._assigned or filename in diff._files # noqa: E501 # pylint: disable=W0212
+
+
 class GitMultiDifferences(MultiFileDifferences):
     """
     A git diff containing multiple files
+
+    Rather than splitting the entire diff up front, only where each
+    file starts and ends is recorded as the diff is read, and
+    the GitDifferences for a file is created when it is asked for.
+
+    The diff can also be streamed in (eg, straight from the git pipe),
+    in which case anything over spoolSize goes to a temporary file
+    instead of memory.
+
+    Either way, the diff is kept as a single buffer (bytes, or the
+    temporary file mmapped) and nothing is decoded until it is asked for.
+    fileBytes(), hunks() and lines() give memoryview slices of that
+    buffer, for anything that wants to look at the diff without paying
+    to copy or decode it.  Giving it bytes rather than str also saves
+    the copy made to encode it.
     """
 
     def __init__(self,
-        data:str='',
+        data:DiffDataCompatible='',
         date:typing.Optional[datetime.datetime]=None,
-        commit:typing.Optional["GitCommit"]=None):
+        commit:typing.Optional["GitCommit"]=None,
+        spoolSize:int=DIFF_SPOOL_SIZE):
         """
+        :data: the diff, either as a whole or a stream/iterable of bytes
+        :spoolSize: a streamed diff bigger than this is kept
+            in a temporary file rather than in memory
         """
         self.commit=commit
+        self.spoolSize=spoolSize
+        self._buffer:typing.Optional[typing.Union[bytes,mmap.mmap]]=None
+        self._spool:typing.Optional[typing.BinaryIO]=None
+        self._size=0
+        # {filename:(start,end)} within the diff
+        self._files:typing.Dict[str,typing.Tuple[int,int]]={}
+        # any file diffs that were set directly
+        self._assigned:typing.Dict[str,GitDifferences]={}
+        # files left out of the diff (see diffLimits)
+        self.skipped:typing.Dict[str,"SkippedFile"]={}
+        # the file whose end has not been found yet
+        self._lastFile:typing.Optional[str]=None
         MultiFileDifferences.__init__(self,data,date)
 
     @property
@@ -58,12 +202,382 @@ class GitMultiDifferences(MultiFileDifferences):
             return None
         return self.commit.githubUrl
 
-    def assign(self,data:str)->None:
+    @property
+    def fileDiffs(self)->typing.MutableMapping[str,GitDifferences]:
+        """
+        {filename:GitDifferences} for every file in the diff
+        """
+        return _FileDiffs(self)
+    @fileDiffs.setter
+    def fileDiffs(self,fileDiffs:typing.Mapping[str,GitDifferences]):
+        self._assigned=dict(fileDiffs)
+
+    @property
+    def filenames(self)->typing.List[str]:
+        """
+        The names of all the files in the diff
+        """
+        ret=list(self._files)
+        ret.extend(f for f in self._assigned if f not in self._files)
+        return ret
+
+    @property
+    def _data(self)->str:
+        """
+        The entire diff as text
+        """
+        return decodeDiff(self.raw)
+    @_data.setter
+    def _data(self,data:DiffDataCompatible):
+        self._load(data)
+
+    def __len__(self)->int:
+        return len(self.filenames)
+
+    def __iter__(self)->typing.Iterator[GitDifferences]:
+        for filename in self.filenames:
+            yield self.fileDiff(filename)
+
+    def fileDiff(self,filename:str)->GitDifferences:
+        """
+        Get the differences for a single file
+        """
+        fileDiff=self._assigned.get(filename)
+        if fileDiff is not None:
+            return fileDiff
+        fileDiff=GitDifferences(
+            decodeDiff(self.fileBytes(filename)),commit=self.commit)
+        setattr(fileDiff,"date",self.date)
+        return fileDiff
+
+    @property
+    def raw(self)->memoryview:
+        """
+        The entire diff, undecoded
+        """
+        return self._view(0,self._size)
+
+    def fileBytes(self,filename:str)->memoryview:
+        """
+        The undecoded diff of a single file
+        (starting with its "diff --git" line)
+
+        NOTE: only covers files that are part of the diff itself,
+        not any that were assigned to fileDiffs directly
+        """
+        start,end=self._files[filename]
+        return self._view(start,end)
+
+    def hunks(self,filename:str)->typing.List[memoryview]:
+        """
+        The undecoded hunks of a single file, each
+        starting with its "@@ -a,b +c,d @@" line
+
+        (a binary file, or one that was only renamed, has no hunks)
+        """
+        start,end=self._files[filename]
+        buffer=self._buffer
+        ret:typing.List[memoryview]=[]
+        if buffer is None:
+            return ret
+        separator=b'\n'+HUNK_HEADER
+        hunkStart=buffer.find(separator,start,end)
+        while hunkStart>=0:
+            nextHunk=buffer.find(separator,hunkStart+1,end)
+            hunkEnd=end if nextHunk<0 else nextHunk+1
+            ret.append(self._view(hunkStart+1,hunkEnd))
+            hunkStart=nextHunk
+        return ret
+
+    def lines(self,
+        filename:typing.Optional[str]=None
+        )->typing.Iterator[memoryview]:
+        """
+        The undecoded lines of a single file
+        (or of the entire diff, if no filename is given),
+        without their line endings
+        """
+        if filename is None:
+            start,end=0,self._size
+        else:
+            start,end=self._files[filename]
+        buffer=self._buffer
+        if buffer is None:
+            return
+        view=self._view(0,self._size)
+        while start<end:
+            eol=buffer.find(b'\n',start,end)
+            if eol<0:
+                eol=end
+            yield view[start:eol]
+            start=eol+1
+
+    def addSkipped(self,skipped:"SkippedFile")->None:
+        """
+        Note a file that was left out of the diff
+
+        It still shows up in fileDiffs, as a stub with only its sizes.
+        """
+        self.skipped[skipped.filename]=skipped
+        fileDiff=GitDifferences(skipped.stub(),commit=self.commit)
+        setattr(fileDiff,"date",self.date)
+        self._assigned[skipped.filename]=fileDiff
+
+    def _view(self,start:int,end:int)->memoryview:
+        """
+        Get part of the diff, without copying it
+        """
+        if self._buffer is None:
+            return memoryview(b'')
+        return memoryview(self._buffer)[start:end]
+
+    def _read(self,start:int,end:int)->bytes:
+        """
+        Get a copy of part of the diff
+        """
+        if self._buffer is None:
+            return b''
+        return bytes(self._buffer[start:end])
+
+    def close(self)->None:
+        """
+        Release the buffer and any temporary file
+
+        (an mmapped diff stays open until any memoryviews
+        of it that are still around are released)
+        """
+        if isinstance(self._buffer,mmap.mmap):
+            try:
+                self._buffer.close()
+            except BufferError:
+                pass
+        self._buffer=None
+        if self._spool is not None:
+            self._spool.close()
+            self._spool=None
+        self._files={}
+        self._size=0
+
+    def _addFile(self,start:int,header:bytes)->None:
+        """
+        Note the start of a new file (which is also the
+        end of the previous one)
+        """
+        self._endFile(start-1)
+        filename=fileDiffName(header)
+        self._files[filename]=(start,start)
+        self._lastFile=filename
+
+    def _endFile(self,end:int)->None:
+        """
+        Note the end of the current file (if there is one)
+        """
+        if self._lastFile is not None:
+            self._files[self._lastFile]=(self._files[self._lastFile][0],end)
+            self._lastFile=None
+
+    def _index(self,data:bytes)->None:
+        """
+        Find where each file is in a complete diff
+        """
+        if data.startswith(FILE_DIFF_HEADER):
+            start=0
+        else:
+            start=data.find(b'\n'+FILE_DIFF_HEADER)
+            if start>=0:
+                start+=1
+        while start>=0:
+            headerStart=start+len(FILE_DIFF_HEADER)
+            eol=data.find(b'\n',headerStart)
+            if eol<0:
+                eol=len(data)
+            self._addFile(start,data[headerStart:eol])
+            start=data.find(b'\n'+FILE_DIFF_HEADER,eol)
+            if start>=0:
+                start+=1
+        self._endFile(len(data))
+
+    def _readStream(self,
+        chunks:typing.Union[typing.BinaryIO,typing.Iterable[bytes]]
+        )->None:
+        """
+        Read a diff as it streams in, noting where each file starts
+        and moving it into the spool as soon as it has been looked at
+        """
+        from gitTools.gitLogRecords import readChunks
+        if hasattr(chunks,'read'):
+            chunks=readChunks(chunks) # type: ignore
+        spool=tempfile.SpooledTemporaryFile(max_size=self.spoolSize) # noqa: E501 # pylint: disable=consider-using-with
+        self._spool=spool # type: ignore
+        separator=b'\n'+FILE_DIFF_HEADER
+        buf=bytearray()
+        # (offset within the whole diff of buf[0])
+        base=0
+        scanFrom=0
+        first=True
+        for chunk in chunks: # type: ignore
+            buf+=chunk
+            if first:
+                if len(buf)<len(FILE_DIFF_HEADER):
+                    continue
+                first=False
+                if buf.startswith(FILE_DIFF_HEADER):
+                    # (pretend there is a newline before it)
+                    buf[0:0]=b'\n'
+                    base=-1
+            waiting=None
+            while True:
+                idx=buf.find(separator,scanFrom)
+                if idx<0:
+                    break
+                headerStart=idx+len(separator)
+                eol=buf.find(b'\n',headerStart)
+                if eol<0:
+                    # wait for the rest of the header line
+                    waiting=idx
+                    break
+                self._addFile(base+idx+1,bytes(buf[headerStart:eol]))
+                scanFrom=eol
+            # keep anything that could still be (part of) a separator
+            cut=len(buf)-len(separator)+1 if waiting is None else waiting
+            cut=max(0,min(cut,len(buf)))
+            if cut:
+                if base<0:
+                    spool.write(buf[1:cut])
+                else:
+                    spool.write(buf[:cut])
+                del buf[:cut]
+                base+=cut
+                scanFrom=max(0,scanFrom-cut)
+        spool.write(buf[1:] if base<0 else buf)
+        self._size=spool.tell()
+        self._endFile(self._size)
+        if self._size>self.spoolSize:
+            # it has gone to disk, so map it rather than reading it back
+            # (fileno() makes sure it really is a file)
+            spool.flush()
+            self._buffer=mmap.mmap(
+                spool.fileno(),0,access=mmap.ACCESS_READ)
+        else:
+            spool.seek(0)
+            self._buffer=spool.read()
+            spool.close()
+            self._spool=None
+
+    def _load(self,data:DiffDataCompatible)->None:
+        """
+        Take on a new diff
+        """
+        self.close()
+        self._assigned={}
+        self.skipped={}
+        self._lastFile=None
+        if isinstance(data,str):
+            data=data.encode('utf-8')
+        if isinstance(data,(bytes,bytearray,memoryview)):
+            # (bytes is immutable, so can be kept as-is)
+            self._buffer=data if isinstance(data,bytes) else bytes(data)
+            self._size=len(self._buffer)
+            self._index(self._buffer)
+        else:
+            self._readStream(data)
+
+    def assign(self,data:DiffDataCompatible)->None: # type: ignore
         """
         assign data to this object
         """
-        self._data=data
-        for f in data.split("\ndiff --git "):
-            fd=GitDifferences("diff --git "+f,commit=self.commit)
-            setattr(fd,"date",self.date)
-            self.fileDiffs[fd.filename]=fd
+        self._load(data)
+
+
+# what the rest of gitTools calls it
+MultifileDiff=GitMultiDifferences
+
+
+class _FileSplitter:
+    """
+    Splits a diff into files as it streams in
+    """
+
+    def __init__(self):
+        self.pending=bytearray()
+        self.scanFrom=0
+
+    def feed(self,chunk:bytes)->typing.List[bytes]:
+        """
+        Add more of the diff
+
+        :return: any files that are now complete
+        """
+        separator=b'\n'+FILE_DIFF_HEADER
+        pending=self.pending
+        pending+=chunk
+        ret=[]
+        while True:
+            idx=pending.find(separator,self.scanFrom)
+            if idx<0:
+                break
+            ret.append(bytes(pending[:idx]))
+            del pending[:idx+1]
+            self.scanFrom=1
+        self.scanFrom=max(1,len(pending)-len(separator)+1)
+        return ret
+
+    def finish(self)->typing.Optional[bytes]:
+        """
+        The last file (once the diff has all been fed in)
+        """
+        data=bytes(self.pending)
+        self.pending=bytearray()
+        self.scanFrom=0
+        return data or None
+
+
+def iterFileDiffs(
+    chunks:typing.Iterable[bytes],
+    date:typing.Optional[datetime.datetime]=None,
+    commit:typing.Optional["GitCommit"]=None
+    )->typing.Generator[GitDifferences,None,None]:
+    """
+    Stream the files of a diff as it comes in (eg, straight from
+    the git pipe), each one as soon as the next one starts
+
+    Only one file is held at a time.
+    """
+    splitter=_FileSplitter()
+    def fileDiff(data:bytes)->GitDifferences:
+        ret=GitDifferences(decodeDiff(data),commit=commit)
+        setattr(ret,"date",date)
+        return ret
+    for chunk in chunks:
+        for data in splitter.feed(chunk):
+            if data.startswith(FILE_DIFF_HEADER):
+                yield fileDiff(data)
+    data=splitter.finish()
+    if data is not None and data.startswith(FILE_DIFF_HEADER):
+        yield fileDiff(data)
+
+
+def notifyFileDiffs(
+    chunks:typing.Iterable[bytes],
+    onFile:typing.Callable[[GitDifferences],typing.Any],
+    date:typing.Optional[datetime.datetime]=None,
+    commit:typing.Optional["GitCommit"]=None
+    )->typing.Generator[bytes,None,None]:
+    """
+    Pass a streaming diff through untouched, calling onFile
+    with each file as soon as it is complete
+
+    (eg, to show the first files while a GitMultiDifferences
+    is still reading the rest)
+    """
+    pending:typing.List[bytes]=[]
+    def passThrough()->typing.Generator[bytes,None,None]:
+        for chunk in chunks:
+            pending.append(chunk)
+            yield chunk
+    for fileDiff in iterFileDiffs(passThrough(),date,commit):
+        for chunk in pending:
+            yield chunk
+        pending.clear()
+        onFile(fileDiff)
+    yield from pending
@@ -0,0 +1,398 @@
+"""
+Diffs that leave out what nobody is going to read
+
+A plain "git diff" includes the full patch of every file, including
+huge generated files, lockfiles and vendored code.  With DiffLimits,
+git is first asked for just a summary of what changed (--raw --numstat,
+which is tiny), anything that is binary, marked as generated in
+.gitattributes, or excluded by a pathspec is left out of the patch
+that is then asked for, and the patch is cut off at a per-file and
+total size as it streams in.
+
+Files that were left out still show up in the diff, as stubs with only
+their sizes (see GitMultiDifferences.skipped).
+"""
+import typing
+import os
+import datetime
+from paths import FilePathCompatible
+from gitTools.backends import GitBackend,getBackend
+from gitTools.diff import (
+    GitMultiDifferences,GitDifferences,FILE_DIFF_HEADER,
+    fileDiffName,notifyFileDiffs)
+if typing.TYPE_CHECKING:
+    from gitTools.gitCommit import GitCommit
+
+
+# the default biggest patch for a single file
+DIFF_MAX_FILE_BYTES=1024*1024
+# gitattributes that mark a file as not worth diffing
+GENERATED_ATTRIBUTES=('linguist-generated','diff')
+# why a file was skipped
+SKIP_BINARY='binary'
+SKIP_GENERATED='generated'
+SKIP_FILE_SIZE='too big'
+SKIP_TOTAL_SIZE='over total size'
+
+
+class DiffLimits:
+    """
+    What to leave out of a diff
+    """
+
+    def __init__(self,
+        maxFileBytes:typing.Optional[int]=DIFF_MAX_FILE_BYTES,
+        maxTotalBytes:typing.Optional[int]=None,
+        include:typing.Iterable[str]=(),
+        exclude:typing.Iterable[str]=(),
+        skipGenerated:bool=True,
+        skipBinary:bool=True):
+        """
+        :maxFileBytes: leave out any file whose patch is bigger than this
+        :maxTotalBytes: once the patch reaches this size,
+            leave out the rest of the files
+        :include: only these files (git pathspecs)
+        :exclude: not these files (git pathspecs)
+        :skipGenerated: leave out files that .gitattributes marks as
+            linguist-generated or -diff (which includes "binary")
+        :skipBinary: leave out binary files
+        """
+        self.maxFileBytes=maxFileBytes
+        self.maxTotalBytes=maxTotalBytes
+        self.include=list(include)
+        self.exclude=list(exclude)
+        self.skipGenerated=skipGenerated
+        self.skipBinary=skipBinary
+
+    def pathspecs(self)->typing.List[str]:
+        """
+        The include/exclude as git pathspecs
+        """
+        ret=list(self.include)
+        ret.extend(f':(exclude){path}' for path in self.exclude)
+        return ret
+
+    def __repr__(self)->str:
+        return f'DiffLimits(maxFileBytes={self.maxFileBytes},maxTotalBytes={self.maxTotalBytes})' # noqa: E501 # pylint: disable=line-too-long
+
+
+class SkippedFile:
+    """
+    A file that was left out of a diff, and how big it was
+    """
+    __slots__=('filename','reason','size','diffSize','added','removed',
+        'oldFilename')
+
+    def __init__(self,
+        filename:str,
+        reason:str,
+        size:typing.Optional[int]=None,
+        diffSize:typing.Optional[int]=None,
+        added:int=0,
+        removed:int=0,
+        oldFilename:typing.Optional[str]=None):
+        """
+        :reason: why it was left out (one of the SKIP_ values)
+        :size: the size of the file itself (if known)
+        :diffSize: the size of its patch (if known)
+        :added: lines added
+        :removed: lines removed
+        :oldFilename: where the file was renamed from (if it was)
+        """
+        self.filename=filename
+        self.reason=reason
+        self.size=size
+        self.diffSize=diffSize
+        self.added=added
+        self.removed=removed
+        self.oldFilename=oldFilename
+
+    def stub(self)->str:
+        """
+        A stand-in for the file's diff
+        """
+        sizes=[]
+        if self.size is not None:
+            sizes.append(f'{self.size} bytes')
+        if self.diffSize is not None:
+            sizes.append(f'{self.diffSize} byte diff')
+        sizes.append(f'+{self.added} -{self.removed}')
+        oldFilename=self.oldFilename or self.filename
+        return f'diff --git a/{oldFilename} b/{self.filename}\n# skipped ({self.reason}): {", ".join(sizes)}\n' # noqa: E501 # pylint: disable=line-too-long
+
+    def __repr__(self)->str:
+        return f'{self.filename} (skipped, {self.reason})'
+
+
+class _ChangedFile:
+    """
+    One file of a diff summary (--raw --numstat)
+    """
+    __slots__=('filename','oldFilename','oldHash','newHash',
+        'added','removed','binary')
+
+    def __init__(self,filename:str):
+        self.filename=filename
+        self.oldFilename:typing.Optional[str]=None
+        self.oldHash=''
+        self.newHash=''
+        self.added=0
+        self.removed=0
+        self.binary=False
+
+
+def _parseSummary(data:bytes)->typing.Dict[str,_ChangedFile]:
+    """
+    Parse the output of a diff with "--raw --numstat -z"
+
+    :return: {filename:_ChangedFile}
+    """
+    def decode(path:bytes)->str:
+        return path.decode('utf-8',errors='replace')
+    files:typing.Dict[str,_ChangedFile]={}
+    values=data.split(b'\0')
+    i=0
+    numValues=len(values)
+    while i<numValues:
+        value=values[i]
+        i+=1
+        if not value:
+            continue
+        oldName=None
+        if value.startswith(b':'):
+            # ":oldMode newMode oldHash newHash status\0path"
+            # (or "\0oldPath\0newPath" for renames/copies)
+            _,_,oldHash,newHash,status=value[1:].split(b' ')[:5]
+            if status[:1] in (b'R',b'C'):
+                oldName=decode(values[i])
+                i+=1
+            changed=_ChangedFile(decode(values[i]))
+            i+=1
+            changed.oldFilename=oldName
+            changed.oldHash=oldHash.decode('ascii')
+            changed.newHash=newHash.decode('ascii')
+            files[changed.filename]=changed
+            continue
+        # "added\tremoved\tpath"
+        # (or "added\tremoved\t\0oldPath\0newPath" for renames)
+        added,_,rest=value.partition(b'\t')
+        removed,_,filename=rest.partition(b'\t')
+        if not filename and i+1<numValues:
+            filename=values[i+1]
+            i+=2
+        changed=files.get(decode(filename)) # type: ignore
+        if changed is None:
+            changed=_ChangedFile(decode(filename))
+            files[changed.filename]=changed
+        changed.binary=added==b'-'
+        if not changed.binary:
+            changed.added=int(added)
+            changed.removed=int(removed)
+    return files
+
+
+def _generatedFiles(
+    backend:typing.Any,
+    filenames:typing.List[str]
+    )->typing.Set[str]:
+    """
+    Which of the files .gitattributes says are generated (or not
+    to be diffed)
+    """
+    if not filenames:
+        return set()
+    result=backend.run(['check-attr','-z','--stdin',*GENERATED_ATTRIBUTES],
+        stdin='\0'.join(filenames).encode('utf-8')+b'\0').check()
+    ret:typing.Set[str]=set()
+    values=result.stdout.split(b'\0')
+    for i in range(0,len(values)-2,3):
+        attribute,value=values[i+1],values[i+2]
+        if (attribute==b'linguist-generated' and value in (b'set',b'true'))\
+            or (attribute==b'diff' and value==b'unset'):
+            ret.add(values[i].decode('utf-8',errors='replace'))
+    return ret
+
+
+def _fileSizes(
+    localRepoPath:str,
+    files:typing.Iterable[_ChangedFile]
+    )->typing.Dict[str,int]:
+    """
+    The sizes of files, from the object store, or from the
+    working tree for anything that is not committed
+
+    :return: {filename:size}
+    """
+    from gitTools.catFile import getObjectReader
+    emptyHash=('','0'*40,'0'*64)
+    ret:typing.Dict[str,int]={}
+    lookup:typing.List[typing.Tuple[str,str]]=[]
+    for changed in files:
+        if changed.newHash not in emptyHash:
+            lookup.append((changed.filename,changed.newHash))
+        elif changed.newHash and os.path.isfile(
+            os.path.join(localRepoPath,changed.filename)):
+            ret[changed.filename]=os.path.getsize(
+                os.path.join(localRepoPath,changed.filename))
+        elif changed.oldHash not in emptyHash:
+            # (deleted)
+            lookup.append((changed.filename,changed.oldHash))
+    infos=getObjectReader(localRepoPath).infoMany(h for _,h in lookup)
+    for (filename,_),info in zip(lookup,infos):
+        if info is not None:
+            ret[filename]=info.size
+    return ret
+
+
+def _capFiles(
+    chunks:typing.Iterable[bytes],
+    maxFileBytes:typing.Optional[int],
+    maxTotalBytes:typing.Optional[int],
+    skip:typing.Callable[[str,str,int],None],
+    seen:typing.Set[str]
+    )->typing.Generator[bytes,None,None]:
+    """
+    Pass a streaming diff through, a file at a time, leaving out any
+    file bigger than maxFileBytes and stopping once maxTotalBytes is
+    reached (which also stops git)
+
+    :skip: called with (filename,reason,diffSize) for each file left out
+    :seen: the names of all the files that were streamed in get added
+    """
+    separator=b'\n'+FILE_DIFF_HEADER
+    # the current file so far (only its tail, once it is being dropped)
+    pending=bytearray()
+    # how many bytes of the current file have been dropped
+    dropped=0
+    dropping=False
+    filename:typing.Optional[str]=None
+    scanFrom=0
+    total=0
+    def finish(end:int)->typing.Optional[bytes]:
+        """
+        The current file ends at pending[end]
+        """
+        nonlocal total
+        if filename is None:
+            return bytes(pending[:end])
+        seen.add(filename)
+        size=dropped+end
+        if dropping or (maxFileBytes is not None and size>maxFileBytes):
+            skip(filename,SKIP_FILE_SIZE,size)
+            return None
+        if maxTotalBytes is not None and total+size>maxTotalBytes:
+            skip(filename,SKIP_TOTAL_SIZE,size)
+            total=maxTotalBytes+1
+            return None
+        total+=size
+        return bytes(pending[:end])
+    try:
+        for chunk in chunks:
+            pending+=chunk
+            while True:
+                if filename is None and pending.startswith(FILE_DIFF_HEADER):
+                    eol=pending.find(b'\n')
+                    if eol<0:
+                        break
+                    filename=fileDiffName(
+                        bytes(pending[len(FILE_DIFF_HEADER):eol]))
+                idx=pending.find(separator,scanFrom)
+                if idx<0:
+                    break
+                data=finish(idx+1)
+                if data:
+                    yield data
+                if maxTotalBytes is not None and total>maxTotalBytes:
+                    return
+                del pending[:idx+1]
+                dropped=0
+                dropping=False
+                filename=None
+                scanFrom=0
+            # keep anything that could still be (part of) a separator
+            scanFrom=max(0,len(pending)-len(separator)+1)
+            if maxFileBytes is not None and filename is not None\
+                and dropped+len(pending)>maxFileBytes:
+                dropping=True
+                dropped+=scanFrom
+                del pending[:scanFrom]
+                scanFrom=0
+        data=finish(len(pending))
+        if data:
+            yield data
+    finally:
+        close=getattr(chunks,'close',None)
+        if close is not None:
+            close()
+
+
+def limitedDiff(
+    localRepoPath:FilePathCompatible,
+    command:typing.Sequence[str],
+    revs:typing.Sequence[str],
+    limits:typing.Optional[DiffLimits]=None,
+    date:typing.Optional[datetime.datetime]=None,
+    commit:typing.Optional["GitCommit"]=None,
+    onFile:typing.Optional[typing.Callable[[GitDifferences],typing.Any]]=None, # noqa: E501 # pylint: disable=line-too-long
+    backend:typing.Optional[GitBackend]=None
+    )->GitMultiDifferences:
+    """
+    Get a diff, leaving out what the limits say to
+
+    :command: the git diff command and its options
+        (eg, ["diff"] or ["diff-tree","-r","--root"])
+    :revs: what to diff
+    :onFile: called with each file's differences as soon as it
+        has come in (the skipped files' stubs come last)
+    :backend: what runs git (default is the repo's getBackend())
+    """
+    if limits is None:
+        limits=DiffLimits()
+    if backend is None:
+        backend=getBackend(str(localRepoPath))
+    pathspecs=limits.pathspecs()
+    summary=backend.run([*command,'--raw','--numstat','-z','--no-abbrev',
+        *revs,'--',*pathspecs]).check()
+    files=_parseSummary(summary.stdout)
+    skipped:typing.Dict[str,str]={}
+    if limits.skipGenerated:
+        # (before binaries, since git also calls -diff files binary)
+        skipped.update((name,SKIP_GENERATED)
+            for name in _generatedFiles(backend,list(files)))
+    if limits.skipBinary:
+        skipped.update((f.filename,SKIP_BINARY) for f in files.values()
+            if f.binary and f.filename not in skipped)
+    for name in skipped:
+        changed=files[name]
+        pathspecs.append(f':(exclude,literal){name}')
+        if changed.oldFilename is not None:
+            pathspecs.append(f':(exclude,literal){changed.oldFilename}')
+    diffSizes:typing.Dict[str,int]={}
+    seen:typing.Set[str]=set()
+    def skip(filename:str,reason:str,diffSize:int)->None:
+        skipped[filename]=reason
+        diffSizes[filename]=diffSize
+    ret=GitMultiDifferences(date=date,commit=commit)
+    if len(skipped)<len(files):
+        chunks=backend.stream([*command,'-p',*revs,'--',*pathspecs])
+        if limits.maxFileBytes is not None \
+            or limits.maxTotalBytes is not None:
+            chunks=_capFiles(chunks,limits.maxFileBytes,
+                limits.maxTotalBytes,skip,seen)
+        if onFile is not None:
+            chunks=notifyFileDiffs(chunks,onFile,date,commit)
+        ret.assign(chunks) # type: ignore
+        if limits.maxTotalBytes is not None:
+            # (anything git did not get to before the total was reached)
+            skipped.update((name,SKIP_TOTAL_SIZE) for name in files
+                if name not in seen and name not in skipped and
+                name not in ret.filenames)
+    sizes=_fileSizes(backend.repoPath,(files[name] for name in skipped))
+    for name,reason in skipped.items():
+        changed=files[name]
+        ret.addSkipped(SkippedFile(name,reason,sizes.get(name),
+            diffSizes.get(name),changed.added,changed.removed,
+            changed.oldFilename))
+        if onFile is not None:
+            onFile(ret.fileDiff(name))
+    return ret
@@ -4,55 +4,362 @@ Information about a particular git commit
 """
 import typing
 import datetime
+import os
+import threading
+import collections
 from paths import URL,UrlCompatible,asUrl
 from k_runner.osrun import osrun
 from .diff import MultifileDiff
+from .objectStore import GitObjectStore,getObjectStore
+if typing.TYPE_CHECKING:
+    from gitTools.commitStats import CommitStats
+    from gitTools.diffLimits import DiffLimits
+
+
+GIT_DATE_FORMAT=r"%a %b %d %H:%M:%S %Y %z"
+# max bytes of commit diffs to keep around
+DIFF_CACHE_SIZE=64*1024*1024
+
+
+def parseDate(date:str)->typing.Optional[datetime.datetime]:
+    """
+    Parse a date as git prints it
+
+    Understands git's default format (eg, "Tue Nov 14 22:13:20 2023 +0000"),
+    --date=raw (eg, "1700000000 +0000") and --date=iso-strict.
+    """
+    date=date.strip()
+    if not date:
+        return None
+    if date[0].isdigit() and date.split()[0].isdigit():
+        from gitTools.gitLogRecords import parseLogDate
+        return parseLogDate(date)
+    try:
+        return datetime.datetime.strptime(date,GIT_DATE_FORMAT)
+    except ValueError:
+        return datetime.datetime.fromisoformat(date)
+
+
+_timezones:typing.Dict[int,datetime.timezone]={}
+
+
+def _timezone(
+    minutes:typing.Optional[int]
+    )->typing.Optional[datetime.timezone]:
+    """
+    Get a (shared) timezone for a utc offset in minutes
+    """
+    if minutes is None:
+        return None
+    tz=_timezones.get(minutes)
+    if tz is None:
+        tz=datetime.timezone(datetime.timedelta(minutes=minutes))
+        _timezones[minutes]=tz
+    return tz
+
+
+class CommitDiffCache:
+    """
+    A least-recently-used cache of commit diffs (undecoded),
+    limited by their total size
+
+    Commits never change, so this is shared between every GitCommit
+    (whichever GitCommits they are in) of every repo.
+    """
+
+    def __init__(self,maxSize:int=DIFF_CACHE_SIZE):
+        """
+        :maxSize: roughly how many bytes of diffs to keep
+        """
+        self.maxSize=maxSize
+        self.size=0
+        self._lock=threading.Lock()
+        self._texts:typing.OrderedDict[typing.Tuple[str,str],bytes]=\
+            collections.OrderedDict()
+
+    def get(self,key:typing.Tuple[str,str])->typing.Optional[bytes]:
+        """
+        Get a cached diff
+
+        :key: (repoPath,commitHash)
+        """
+        with self._lock:
+            text=self._texts.get(key)
+            if text is not None:
+                self._texts.move_to_end(key)
+            return text
+
+    def put(self,key:typing.Tuple[str,str],text:bytes)->None:
+        """
+        Add a diff, pushing out the least recently used ones
+        if there is not room for it
+
+        (a diff bigger than a quarter of the cache is not kept)
+        """
+        size=len(text)
+        with self._lock:
+            if size>self.maxSize//4 or key in self._texts:
+                return
+            self._texts[key]=text
+            self.size+=size
+            while self.size>self.maxSize:
+                _,old=self._texts.popitem(last=False)
+                self.size-=len(old)
+
+    def clear(self)->None:
+        """
+        Empty the cache
+        """
+        with self._lock:
+            self._texts.clear()
+            self.size=0
+
+
+commitDiffCache=CommitDiffCache()
+
+
+class CommitSource:
+    """
+    Where a commit came from (its local repo and github url)
+
+    There is one of these shared between all the commits
+    from the same place, rather than a copy in each commit.
+    """
+    __slots__=('localRepoPath','githubUrl')
+
+    def __init__(self,
+        localRepoPath:str='.',
+        githubUrl:typing.Optional[str]=None):
+        """
+        :githubUrl: the github url of the repo (not of a commit)
+        """
+        self.localRepoPath=localRepoPath
+        self.githubUrl=githubUrl
+
+
+_commitSources:typing.Dict[typing.Tuple[str,typing.Any],CommitSource]={}
+
+
+def commitSource(
+    localRepoPath:typing.Optional[str]=None,
+    githubUrl:typing.Optional[UrlCompatible]=None
+    )->CommitSource:
+    """
+    Get the shared CommitSource for a repo
+    """
+    if localRepoPath is None:
+        localRepoPath='.'
+    key=(localRepoPath,None if githubUrl is None else str(githubUrl))
+    source=_commitSources.get(key)
+    if source is None:
+        base=None
+        if githubUrl is not None:
+            base=str(asUrl(githubUrl)).split('/commit',1)[0]
+        source=CommitSource(localRepoPath,base)
+        _commitSources[key]=source
+    return source
 
 
 class GitCommit:
     """
     Information about a particular git commit
+
+    To keep long histories small, this only holds the hash, parents,
+    date and a shared reference to its repo.  A lazy() commit does not
+    even have the author and message until they are first used, at
+    which point they are read from the repo for its whole batch at once.
     """
+    __slots__=(
+        'hash',
+        '_source',
+        '_parents',
+        '_time',
+        '_tz',
+        '_author',
+        '_authorEmail',
+        '_description',
+        '_log',
+        '_batch')
+
     def __init__(self,
         hash:str, # pylint: disable=W0622
         logEntry:typing.Optional[str]=None,
-        githubUrl:typing.Optional[UrlCompatible]=None):
+        githubUrl:typing.Optional[UrlCompatible]=None,
+        localRepoPath:typing.Optional[str]=None):
         """ """
         self.hash=hash
-        self._githubUrl:typing.Optional[URL]=None
-        if githubUrl is not None:
-            self._githubUrl=URL(githubUrl)
-        self._lines:typing.List[str]=[]
-        self._gatheringLines=False
-        self._gatheringDescription=False
-        self._date:typing.Optional[datetime.datetime]=None
-        self.merge:typing.List[str]=[]
-        self.author:str=''
-        self.authorEmail:str=''
-        self.description:str=''
+        self._source=commitSource(localRepoPath,githubUrl)
+        self._parents:typing.Tuple[str,...]=()
+        # the date, as a timestamp and utc offset in minutes
+        self._time:typing.Optional[float]=None
+        self._tz:typing.Optional[int]=None
+        # (None until loaded, for a lazy commit)
+        self._author:typing.Optional[str]=''
+        self._authorEmail:typing.Optional[str]=''
+        self._description:typing.Optional[str]=''
+        # (source,start,end) of any patch text from the git log
+        self._log:typing.Optional[typing.Tuple[typing.Any,int,int]]=None
+        # lazy commits to load at the same time as this one
+        self._batch:typing.Optional[typing.List[GitCommit]]=None
         if logEntry is not None:
             self.assignFromLog(logEntry)
 
+    @classmethod
+    def lazy(cls,
+        hash:str, # pylint: disable=W0622
+        parents:typing.Iterable[str],
+        time:float,
+        tz:typing.Optional[int],
+        source:CommitSource,
+        batch:typing.Optional[typing.List["GitCommit"]]=None
+        )->"GitCommit":
+        """
+        Create a commit where only the hash, parents and date are known,
+        and everything else is read from the repo when first needed
+
+        :time: the date, as a timestamp
+        :tz: the utc offset of the date, in minutes
+        :batch: a list of lazy commits (this one is added to it) which
+            are all loaded together when any one of them is
+        """
+        ret=cls.__new__(cls)
+        ret.hash=hash
+        ret._source=source
+        ret._parents=tuple(parents)
+        ret._time=time
+        ret._tz=tz
+        ret._author=None
+        ret._authorEmail=None
+        ret._description=None
+        ret._log=None
+        ret._batch=batch
+        if batch is not None:
+            batch.append(ret)
+        return ret
+
+    @property
+    def loaded(self)->bool:
+        """
+        Whether the author and message are here yet
+        (always true, except for a lazy() commit)
+        """
+        return self._author is not None
+
+    def _load(self)->None:
+        """
+        Read the details of this lazy commit, along with
+        the rest of its batch, from the object store
+        """
+        batch=self._batch if self._batch is not None else [self]
+        commits=[commit for commit in batch if commit._author is None]
+        for commit in batch:
+            commit._batch=None
+        try:
+            objects=list(self.objectReader.readMany(
+                commit.hash for commit in commits))
+        except FileNotFoundError:
+            objects=[None]*len(commits)
+        for commit,obj in zip(commits,objects):
+            if obj is not None and obj.type=='commit':
+                commit.assignFromObject(obj.data) # type: ignore
+            else:
+                commit._author=''
+                commit._authorEmail=''
+                commit._description=''
+
+    @property
+    def author(self)->str:
+        """
+        Name of the author
+        """
+        if self._author is None:
+            self._load()
+        return self._author # type: ignore
+    @author.setter
+    def author(self,author:str):
+        self._author=author
+
+    @property
+    def authorEmail(self)->str:
+        """
+        Email address of the author
+        """
+        if self._authorEmail is None:
+            self._load()
+        return self._authorEmail # type: ignore
+    @authorEmail.setter
+    def authorEmail(self,authorEmail:str):
+        self._authorEmail=authorEmail
+
+    @property
+    def description(self)->str:
+        """
+        The full commit message
+        """
+        if self._description is None:
+            self._load()
+        return self._description # type: ignore
+    @description.setter
+    def description(self,description:str):
+        self._description=description
+
+    @property
+    def parents(self)->typing.List[str]:
+        """
+        Hashes of the parent commits
+        """
+        return list(self._parents)
+    @parents.setter
+    def parents(self,parents:typing.Iterable[str]):
+        self._parents=tuple(parents)
+
+    @property
+    def merge(self)->typing.List[str]:
+        """
+        The parents of a merge commit (empty if it is not one)
+        """
+        if len(self._parents)>1:
+            return list(self._parents)
+        return []
+    @merge.setter
+    def merge(self,merge:typing.Iterable[str]):
+        merge=tuple(merge)
+        if merge:
+            self._parents=merge
+
     @property
     def githubUrl(self)->typing.Optional[URL]:
         """
         Remote github link to this commit
         """
-        return self._githubUrl
+        base=self._source.githubUrl
+        if base is None:
+            return None
+        return URL(f"{base}/commit/{self.hash}")
     @githubUrl.setter
     def githubUrl(self,githubUrl:UrlCompatible):
-        sp=str(asUrl(githubUrl)).split('/commit',1)[0]
-        githubUrl=f"{sp}/commit/{self.hash}"
-        self._githubUrl=URL(githubUrl)
+        self._source=commitSource(self._source.localRepoPath,githubUrl)
 
     @property
     def localRepoPath(self)->str:
         """
         Where the repo is found
         """
-        # TODO: probably have member pointing back to a GitRepo
-        # and get it from that
-        return '.'
+        return self._source.localRepoPath
+    @localRepoPath.setter
+    def localRepoPath(self,localRepoPath:str):
+        source=self._source
+        self._source=commitSource(localRepoPath,source.githubUrl)
+
+    @property
+    def objectReader(self)->GitObjectStore:
+        """
+        The shared object reader for the repo this commit lives in
+
+        (reads the object store directly, falling back
+        to "git cat-file" when it has to)
+        """
+        return getObjectStore(self.localRepoPath)
 
     def clear(self):
         """
@@ -78,50 +385,233 @@ class GitCommit:
             elif line.startswith('Date: '):
                 self.date=line.split(' ',1)[1].strip()
 
+    def assignFromObject(self,data:bytes)->None:
+        """
+        Assign from a raw commit object (as read by "git cat-file")
+        """
+        headers,_,message=data.partition(b'\n\n')
+        parents:typing.List[str]=[]
+        for header in headers.split(b'\n'):
+            key,_,value=header.partition(b' ')
+            if key==b'parent':
+                parents.append(value.decode('ascii'))
+            elif key==b'author':
+                authorStr=value.decode('utf-8',errors='replace')
+                name,_,rest=authorStr.partition('<')
+                email,_,when=rest.partition('>')
+                self._author=name.rstrip()
+                self._authorEmail=email.strip()
+                when=when.split()
+                if when:
+                    offset=0
+                    if len(when)>1:
+                        offset=int(when[1][1:3])*60+int(when[1][3:5])
+                        if when[1][0]=='-':
+                            offset=-offset
+                    self._time=float(int(when[0]))
+                    self._tz=offset
+        self._parents=tuple(parents)
+        self._description=message.decode('utf-8',errors='replace').strip()
+
+    def loadFromRepo(self)->None:
+        """
+        Fill in the details of this commit from the object store
+        (useful when all we started with was a hash)
+        """
+        obj=self.objectReader.read(self.hash)
+        if obj is None or obj.type!='commit':
+            raise KeyError(f'No commit "{self.hash}" in "{self.localRepoPath}"') # noqa: E501 # pylint: disable=line-too-long
+        self.hash=obj.hash
+        self.assignFromObject(obj.data) # type: ignore
+
+    def setLogPatch(self,
+        source:typing.Union[str,bytes],
+        start:int,
+        end:int
+        )->None:
+        """
+        Remember where the patch text for this commit is in
+        a git log output buffer (without copying it)
+        """
+        self._log=(source,start,end)
+
+    @property
+    def logPatch(self)->str:
+        """
+        Any patch text that came along with this commit in
+        the git log output (eg, from "git log -p" or "-L")
+        """
+        if self._log is None:
+            return ''
+        source,start,end=self._log
+        if isinstance(source,str):
+            return source[start:end]
+        return str(memoryview(source)[start:end],'utf-8','replace')
+
+    def fileContents(self,
+        repoFilename:str,
+        parent:bool=False
+        )->typing.Optional[bytes]:
+        """
+        Get the contents of a file as of this commit
+
+        :parent: get the contents from before this commit instead
+        :return: None if the file did not exist
+        """
+        rev=f'{self.hash}^' if parent else self.hash
+        obj=self.objectReader.read(f'{rev}:{repoFilename}')
+        if obj is None or obj.type!='blob':
+            return None
+        return obj.data
+
+    def _treeEntries(self,
+        treeHash:typing.Optional[str]
+        )->typing.Dict[str,typing.Tuple[str,str]]:
+        """
+        Get {name:(mode,hash)} for a tree object
+        """
+        ret:typing.Dict[str,typing.Tuple[str,str]]={}
+        if treeHash is None:
+            return ret
+        obj=self.objectReader.read(treeHash)
+        if obj is None or obj.data is None:
+            return ret
+        hashLen=len(treeHash)//2
+        data=obj.data
+        pos=0
+        while pos<len(data):
+            nul=data.index(b'\0',pos)
+            mode,name=data[pos:nul].split(b' ',1)
+            pos=nul+1+hashLen
+            ret[name.decode('utf-8',errors='replace')]=(
+                mode.decode('ascii'),data[nul+1:pos].hex())
+        return ret
+
+    def changedFiles(self)->typing.List[
+        typing.Tuple[str,typing.Optional[str],typing.Optional[str]]]:
+        """
+        Determine which files this commit changed compared
+        to its first parent, by walking the trees
+
+        :return: [(repoFilename,oldBlobHash,newBlobHash)]
+            where a hash is None if the file did not exist
+        """
+        ret:typing.List[
+            typing.Tuple[str,typing.Optional[str],typing.Optional[str]]]=[]
+        def treeOf(rev:str)->typing.Optional[str]:
+            obj=self.objectReader.info(f'{rev}^{{tree}}')
+            return None if obj is None else obj.hash
+        def compare(path:str,oldTree:typing.Optional[str],
+            newTree:typing.Optional[str]):
+            if oldTree==newTree:
+                return
+            oldEntries=self._treeEntries(oldTree)
+            newEntries=self._treeEntries(newTree)
+            for name in sorted(set(oldEntries)|set(newEntries)):
+                oldMode,oldHash=oldEntries.get(name,('',None))
+                newMode,newHash=newEntries.get(name,('',None))
+                if oldHash==newHash:
+                    continue
+                filename=f'{path}{name}'
+                oldIsTree=oldMode=='40000'
+                newIsTree=newMode=='40000'
+                if oldIsTree or newIsTree:
+                    compare(f'{filename}/',
+                        oldHash if oldIsTree else None,
+                        newHash if newIsTree else None)
+                if not (oldIsTree and newIsTree):
+                    ret.append((filename,
+                        None if oldIsTree else oldHash,
+                        None if newIsTree else newHash))
+        # (a root commit has no parent, so its tree is None)
+        compare('',treeOf(f'{self.hash}^'),treeOf(self.hash))
+        return ret
+
+    def _code(self,
+        blobHashes:typing.Iterable[typing.Optional[str]]
+        )->str:
+        """
+        Concatenate the contents of a set of blobs
+        """
+        names=[h for h in blobHashes if h is not None]
+        return '\n'.join(obj.text
+            for obj in self.objectReader.readMany(names) if obj is not None)
+
+    @property
+    def oldCode(self)->str:
+        """
+        The code in all files changed by this commit, before the change
+        """
+        return self._code(old for _,old,_ in self.changedFiles())
+
+    @property
+    def newCode(self)->str:
+        """
+        The code in all files changed by this commit, after the change
+        """
+        return self._code(new for _,_,new in self.changedFiles())
+
     @property
     def date(self)->typing.Optional[datetime.datetime]:
         """
         The full date of this commit
         """
-        return self._date
+        if self._time is None:
+            return None
+        return datetime.datetime.fromtimestamp(self._time,_timezone(self._tz))
     @date.setter
     def date(self,d:typing.Union[None,datetime.datetime,str]):
         if isinstance(d,str):
-            d=datetime.datetime.strptime(d,r"%a %b %-d %-H:%M:%S %Y %z")
-        self._date=d
+            d=parseDate(d)
+        if d is None:
+            self._time=None
+            self._tz=None
+            return
+        self._time=d.timestamp()
+        offset=d.utcoffset()
+        self._tz=None if offset is None else int(offset.total_seconds())//60
+
+    def setTime(self,time:float,tz:typing.Optional[int]=None)->None:
+        """
+        Set the date as a timestamp, without going through a datetime
+
+        :tz: utc offset in minutes
+        """
+        self._time=float(time)
+        self._tz=tz
 
     @property
     def timestamp(self)->float:
         """
         Timestamp of this commit
         """
-        if self._date is None:
+        if self._time is None:
             return 0
-        return self._date.timestamp()
+        return self._time
 
     # can compare against other GitCommitInfo or a datetime
     def __eq__(self, # type: ignore
         other:typing.Union["GitCommit",datetime.datetime] # type: ignore
         )->bool:
         if isinstance(other,datetime.datetime):
-            return other==self._date
+            return other==self.date
         return other.hash==self.hash
     def __lt__(self,other:typing.Union["GitCommit",datetime.datetime])->bool:
         if isinstance(other,datetime.datetime):
-            return self._date<other # type: ignore
-        return self._date<other._date # type: ignore
+            return self.date<other # type: ignore
+        return self._time<other._time # type: ignore
     def __gt__(self,other:typing.Union["GitCommit",datetime.datetime])->bool:
         if isinstance(other,datetime.datetime):
-            return self._date>other # type: ignore
-        return self._date>other._date # type: ignore
+            return self.date>other # type: ignore
+        return self._time>other._time # type: ignore
     def __le__(self,other:typing.Union["GitCommit",datetime.datetime])->bool:
         if isinstance(other,datetime.datetime):
-            return self._date<=other # type: ignore
-        return self._date<other._date or self.hash==other.hash # type: ignore
+            return self.date<=other # type: ignore
+        return self._time<other._time or self.hash==other.hash # type: ignore
     def __ge__(self,other:typing.Union["GitCommit",datetime.datetime])->bool:
         if isinstance(other,datetime.datetime):
-            return self._date>=other # type: ignore
-        return self._date>other._date or self.hash==other.hash # type: ignore
+            return self.date>=other # type: ignore
+        return self._time>other._time or self.hash==other.hash # type: ignore
 
     @property
     def comment(self)->str:
@@ -154,21 +644,70 @@ class GitCommit:
         """
         return self.title
 
+    @property
+    def diffBytes(self)->bytes:
+        """
+        Return the undecoded diff of what this commit did
+        (compared to its first parent)
+
+        Since a commit never changes, this is cached (see commitDiffCache)
+        """
+        from gitTools.backends import getBackend
+        backend=getBackend(self.localRepoPath)
+        key=(os.path.normcase(backend.repoPath),self.hash)
+        text=commitDiffCache.get(key)
+        if text is None:
+            # (--root so that the first commit shows everything as added)
+            text=backend.run(['diff-tree','-p','--no-commit-id','--root',
+                '--diff-merges=first-parent',self.hash]).check().stdout
+            commitDiffCache.put(key,text)
+        return text
+
     @property
     def diffText(self)->str:
         """
         Return a diff text string describing what this commit did
+        (compared to its first parent)
+        """
+        return self.diffBytes.decode('utf-8',errors='replace')
+
+    @property
+    def stats(self)->"CommitStats":
+        """
+        Which files this commit changed, and how many lines were
+        added/removed in each (compared to its first parent)
+
+        This is much cheaper than looking at the diff.
+        (To get these for many commits, use GitCommits.stats())
         """
-        return self.diff._data # pylint: disable=W0212
+        from gitTools.commitStats import commitStats
+        return next(commitStats(self.localRepoPath,[self.hash]))
 
     @property
     def diff(self)->MultifileDiff:
         """
         Return a diff describing what this commit did
+        (compared to its first parent)
+        """
+        return MultifileDiff(self.diffBytes,self.date,commit=self)
+
+    def limitedDiff(self,
+        limits:typing.Optional["DiffLimits"]=None
+        )->MultifileDiff:
+        """
+        Return a diff describing what this commit did
+        (compared to its first parent), leaving out files that
+        are binary, generated, too big, etc
+
+        (they show up as stubs with only their sizes)
+
+        NOTE: generated files are found with the current .gitattributes
         """
-        cmd=f'git diff {self.hash}'
-        result=osrun(cmd,workingDirectory=self.localRepoPath)
-        return MultifileDiff(result.stdout,self.date,commit=self)
+        from gitTools.diffLimits import limitedDiff
+        return limitedDiff(self.localRepoPath,
+            ['diff-tree','-r','--no-commit-id','--root',
+                '--diff-merges=first-parent'],
+            [self.hash],limits,self.date,self)
 
     @property
     def oneLineSummary(self)->str:
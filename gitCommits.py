@@ -5,6 +5,8 @@ A series of git commits
 NOTE: always in chronological order, newst->oldest
 """
 import typing
+import bisect
+import heapq
 import datetime
 try:
     import regex as re # type: ignore
@@ -12,6 +14,56 @@ except ImportError:
     import re
 from gitRemotes import githubUrl
 from gitTools.gitCommit import GitCommit
+from gitTools.gitLogRecords import (
+    RECORD_START,commitsFromLogBuffer,commitsFromLogText)
+if typing.TYPE_CHECKING:
+    from gitTools.commitStats import CommitStats
+
+
+def _decode(data:typing.Optional[bytes])->str:
+    """
+    Decode file contents for searching (missing file=empty string)
+    """
+    if data is None:
+        return ''
+    return data.decode('utf-8',errors='ignore')
+
+
+class _ListSlice(typing.Sequence):
+    """
+    A read-only window onto part of a list, without copying it
+    """
+    __slots__=('items','start','stop')
+
+    def __init__(self,items:typing.Sequence,start:int,stop:int):
+        if isinstance(items,_ListSlice):
+            start+=items.start
+            stop+=items.start
+            items=items.items
+        self.items=items
+        self.start=start
+        self.stop=max(start,stop)
+
+    def __len__(self)->int:
+        return self.stop-self.start
+
+    def __getitem__(self,idx): # type: ignore
+        if isinstance(idx,slice):
+            start,stop,step=idx.indices(len(self))
+            if step==1:
+                return _ListSlice(self,start,stop)
+            return [self.items[self.start+i] for i in range(start,stop,step)]
+        if idx<0:
+            idx+=len(self)
+        if idx<0 or idx>=len(self):
+            raise IndexError('index out of range')
+        return self.items[self.start+idx]
+
+    def __iter__(self)->typing.Iterator:
+        # (indexing, since islice() would step over the first start items)
+        items=self.items
+        for i in range(self.start,self.stop):
+            yield items[i]
 
 
 GitCommitsCompatible=typing.Union[
@@ -30,13 +82,21 @@ class GitCommits:
 
     def __init__(self,
         commits:typing.Optional[GitCommitsCompatible]=None,
-        gitLogOutput:typing.Union[None,str,typing.List[str]]=None,
+        gitLogOutput:typing.Union[None,str,bytes,typing.List[str]]=None,
         repoPath:typing.Optional[str]=None
         ):
         """ """
         self.repoPath=repoPath
         self._githubRemote:typing.Optional[str]=None
-        self._commits:typing.List[GitCommit]=[]
+        # (a _ListSlice rather than a list, for a view onto another one)
+        self._commits:typing.Sequence[GitCommit]
+        # sort keys (timestamps) for self._commits, for bisecting
+        self._keys:typing.Sequence[float]
+        # (None for a view, until it is needed)
+        self._hashes:typing.Optional[typing.Set[str]]
+        # are there views onto our lists?
+        self._shared:bool
+        self.clear()
         if gitLogOutput is not None:
             self.parseGitLogOutput(gitLogOutput)
         if commits is not None:
@@ -66,42 +126,131 @@ class GitCommits:
         return self._commits[idx]
     def __iter__(self)->typing.Iterator[GitCommit]:
         return iter(self._commits)
+    def _assignSorted(self,commits:typing.List[GitCommit])->None:
+        """
+        Replace the contents with a list that is already in order
+        and has no duplicates
+        """
+        self._commits=commits
+        self._keys=[commit.timestamp for commit in commits]
+        self._hashes={commit.hash for commit in commits}
+        self._shared=False
+
+    def _ownStorage(self)->None:
+        """
+        Make sure that we can change our lists without
+        affecting any other GitCommits (copy on write)
+        """
+        if self._shared or not isinstance(self._commits,list):
+            self._commits=list(self._commits)
+            self._keys=list(self._keys)
+            self._shared=False
+        if self._hashes is None:
+            self._hashes={commit.hash for commit in self._commits}
+
+    def _slice(self,start:int,end:int)->"GitCommits":
+        """
+        A new GitCommits holding a range of this one
+
+        This is a view onto the same lists, without copying them.
+        (Whichever one is changed first takes a copy.)
+        """
+        ret=GitCommits(repoPath=self.repoPath)
+        ret._githubRemote=self._githubRemote
+        ret._commits=_ListSlice(self._commits,start,end)
+        ret._keys=_ListSlice(self._keys,start,end)
+        ret._hashes=None
+        self._shared=True
+        return ret
+
+    def _runs(self,
+        commits:GitCommitsCompatible,
+        runs:typing.List[typing.Sequence[GitCommit]],
+        loose:typing.List[GitCommit],
+        seen:typing.Set[str]
+        )->None:
+        """
+        Flatten commits into runs that are already in order (from
+        other GitCommits) and loose commits that still need sorting,
+        skipping anything seen before
+        """
+        if isinstance(commits,GitCommit):
+            if commits.hash not in seen:
+                seen.add(commits.hash)
+                loose.append(commits)
+        elif isinstance(commits,GitCommits):
+            run=[commit for commit in commits._commits
+                if commit.hash not in seen]
+            seen.update(commit.hash for commit in run)
+            runs.append(run)
+        else:
+            for commit in commits: # type:ignore
+                self._runs(commit,runs,loose,seen)
+
     def append(self,commits:GitCommitsCompatible)->None:
         """
         Add new commit(s) to the list
+
+        A single commit is inserted in place.  Anything bigger is
+        sorted once and merged in, rather than inserted one by one.
+        (Commits already in the list, by hash, are ignored.)
         """
+        self._ownStorage()
         if isinstance(commits,GitCommit):
-            for i,commit in enumerate(self._commits):
-                if commit>commits:
-                    self._commits.insert(i,commits)
-                    return
-                elif commit.hash==commits.hash: #already in the list
-                    return
-            self._commits.append(commits)
+            if commits.hash in self._hashes: # type: ignore
+                return
+            key=commits.timestamp
+            idx=bisect.bisect_right(self._keys,key)
+            self._commits.insert(idx,commits) # type: ignore
+            self._keys.insert(idx,key) # type: ignore
+            self._hashes.add(commits.hash) # type: ignore
+            return
+        if type(commits) is GitCommits and not self._commits: # noqa: E501 # pylint: disable=unidiomatic-typecheck
+            self._commits=list(commits._commits)
+            self._keys=list(commits._keys)
+            self._hashes={commit.hash for commit in self._commits}
+            return
+        runs:typing.List[typing.Sequence[GitCommit]]=[]
+        loose:typing.List[GitCommit]=[]
+        self._runs(commits,runs,loose,set(self._hashes)) # type: ignore
+        if loose:
+            # (sorted() is stable, so equal dates keep their order)
+            runs.append(sorted(loose,key=lambda commit:commit.timestamp))
+        runs=[run for run in runs if run]
+        if not runs:
+            return
+        if self._commits:
+            runs.insert(0,self._commits)
+        if len(runs)==1:
+            merged=list(runs[0])
         else:
-            for commit in commits:  # type:ignore
-                self.append(commit)
+            merged=list(heapq.merge(*runs,key=lambda commit:commit.timestamp))
+        self._assignSorted(merged)
     add=append
     extend=append
 
     def clone(self)->"GitCommits":
         """
         Create a copy of this object
+
+        (cheap, since the lists are only copied if either one changes)
         """
-        return GitCommits(self)
+        return self._slice(0,len(self._commits))
     copy=clone
 
     def union(self,commits:GitCommitsCompatible)->"GitCommits":
         """
         Combine two set of commits
         """
-        return GitCommits([self,commits])
+        ret=self.clone()
+        ret.append(commits)
+        return ret
 
     def clear(self)->None:
         """
         Reset this object
         """
-        self._commits=[]
+        self._assignSorted([])
 
     def assign(self,commits:GitCommitsCompatible)->None:
         """
@@ -110,36 +259,45 @@ class GitCommits:
         self.clear()
         self.append(commits)
 
+    def _bisect(self,
+        date:datetime.datetime,
+        bisector:typing.Callable[...,int]
+        )->int:
+        """
+        Find where a date falls in the list
+        (using bisect.bisect_left or bisect.bisect_right)
+        """
+        keys=self._keys
+        if isinstance(keys,_ListSlice):
+            return bisector(keys.items,date.timestamp(),
+                keys.start,keys.stop)-keys.start
+        return bisector(keys,date.timestamp())
+
     def between(self,
         startDate:datetime.datetime,
         endDate:datetime.datetime
         )->"GitCommits":
         """
         Get commits between two dates
+
+        (like all slices of a GitCommits, this is a view
+        that does not copy anything)
         """
-        gc=GitCommits()
-        for commit in self._commits:
-            if commit>startDate and commit<endDate:
-                gc.append(commit)
-        return gc
+        return self._slice(
+            self._bisect(startDate,bisect.bisect_right),
+            self._bisect(endDate,bisect.bisect_left))
     def before(self,endDate:datetime.datetime)->"GitCommits":
         """
         Get commits before a certain date
         """
-        gc=GitCommits()
-        for commit in self._commits:
-            if commit<endDate:
-                gc.append(commit)
-        return gc
+        return self._slice(0,self._bisect(endDate,bisect.bisect_left))
     def after(self,startDate:datetime.datetime)->"GitCommits":
         """
         Get commits after a certain date
         """
-        gc=GitCommits()
-        for commit in self._commits:
-            if commit>startDate:
-                gc.append(commit)
-        return gc
+        return self._slice(
+            self._bisect(startDate,bisect.bisect_right),
+            len(self._commits))
     since=after
 
     def findDefect(self,testFn:typing.Callable[[GitCommit],bool]
@@ -177,73 +335,102 @@ class GitCommits:
         return bracketSearch(0,count-1)
 
     def findWhenAdded(self,
-        findRe:typing.Union[str,typing.Pattern]
+        findRe:typing.Union[str,typing.Pattern],
+        repoFilename:typing.Optional[str]=None
         )->typing.Optional[GitCommit]:
         """
         find the commit when matching regex was added
+
+        :repoFilename: only look in this file, rather than
+            all of the files each commit changed
         """
         if isinstance(findRe,str):
             findRe=re.compile(findRe,re.DOTALL)
         def test(commit:GitCommit)->bool:
-            inOld=findRe.search(commit.oldCode) # type:ignore
-            inNew=findRe.search(commit.newCode) # type:ignore
+            if repoFilename is None:
+                oldCode=commit.oldCode
+                newCode=commit.newCode
+            else:
+                oldCode=_decode(commit.fileContents(repoFilename,parent=True))
+                newCode=_decode(commit.fileContents(repoFilename))
+            inOld=findRe.search(oldCode) # type:ignore
+            inNew=findRe.search(newCode) # type:ignore
             return (inOld is None) and (inNew is not None)
         return self.findDefect(test)
 
     def findWhenRemoved(self,
-        findRe:typing.Union[str,typing.Pattern]
+        findRe:typing.Union[str,typing.Pattern],
+        repoFilename:typing.Optional[str]=None
         )->typing.Optional[GitCommit]:
         """
         find the commit when matching regex was removed
+
+        :repoFilename: only look in this file, rather than
+            all of the files each commit changed
         """
         if isinstance(findRe,str):
             findRe=re.compile(findRe,re.DOTALL)
         def test(commit:GitCommit)->bool:
-            inOld=findRe.search(commit.oldCode) # type:ignore
-            inNew=findRe.search(commit.newCode) # type:ignore
+            if repoFilename is None:
+                oldCode=commit.oldCode
+                newCode=commit.newCode
+            else:
+                oldCode=_decode(commit.fileContents(repoFilename,parent=True))
+                newCode=_decode(commit.fileContents(repoFilename))
+            inOld=findRe.search(oldCode) # type:ignore
+            inNew=findRe.search(newCode) # type:ignore
             return (inOld is not None) and (inNew is None)
         return self.findDefect(test)
 
     def parseGitLogOutput(self,
-        gitLogOutput:typing.Union[str,typing.Iterable[str]]
+        gitLogOutput:typing.Union[str,bytes,typing.Iterable[str]]
         )->None:
         """
         Parse the output from a "git log" command line command
+
+        Either the ordinary human-readable output (as str or lines), or
+        the far faster NUL-separated bytes produced with LOG_ARGS.  In
+        both cases any patch text is not split into lines, only where
+        it is in the output is kept (see GitCommit.logPatch).
+        """
+        if isinstance(gitLogOutput,(bytes,bytearray,memoryview)):
+            data=bytes(gitLogOutput)
+            if data.lstrip()[0:1]==RECORD_START:
+                commits=list(commitsFromLogBuffer(
+                    data,self.githubUrl,self.repoPath))
+            else:
+                commits=list(commitsFromLogText(
+                    data.decode('utf-8',errors='replace'),
+                    self.githubUrl,self.repoPath))
+        else:
+            if not isinstance(gitLogOutput,str):
+                gitLogOutput='\n'.join(gitLogOutput)
+            if '\r' in gitLogOutput:
+                gitLogOutput=gitLogOutput.replace('\r\n','\n')
+            commits=list(commitsFromLogText(
+                gitLogOutput,self.githubUrl,self.repoPath))
+        self.clear()
+        self.append(commits)
+
+    def stats(self)->typing.Dict[str,"CommitStats"]:
+        """
+        Get which files each commit changed, and how many
+        lines were added/removed in each
+
+        This is a single streamed "git log --numstat" per repo,
+        and never looks at any patch text.
+
+        :return: {commitHash:CommitStats}
         """
-        if isinstance(gitLogOutput,str):
-            gitLogOutput=gitLogOutput.split('\n')
-        self._commits=[]
-        descriptionLines:typing.List[str]=[]
-        currentCommit=None
-        for line in gitLogOutput:
-            if len(line)==47 and line.startswith('commit '):
-                # starting new commit
-                if currentCommit is not None:
-                    self._commits.append(currentCommit)
-                currentCommit=GitCommit(
-                    line[7:],githubUrl=self.githubUrl)
-            elif currentCommit is not None:
-                if currentCommit._gatheringLines: # noqa: E501 # pylint: disable=W0212
-                    currentCommit._lines.append(line) # noqa: E501 # pylint: disable=W0212
-                elif currentCommit._gatheringDescription: # noqa: E501 # pylint: disable=W0212
-                    if line and line[0] not in (' ','\t'):
-                        # switch to gathering code
-                        currentCommit._gatheringDescription=False # noqa: E501 # pylint: disable=W0212
-                        currentCommit._gatheringLines=True # noqa: E501 # pylint: disable=W0212
-                        currentCommit.description= \
-                            '\n'.join(descriptionLines).strip()
-                    else:
-                        descriptionLines.append(line.strip())
-                elif not line.strip():
-                    # switch to gathering description
-                    currentCommit._gatheringDescription=True # noqa: E501 # pylint: disable=W0212
-                    descriptionLines=[]
-                elif line.startswith('Date:'):
-                    currentCommit.date=' '.join(line.split()[1:])
-                elif line.startswith('Author:'):
-                    currentCommit.author=' '.join(line.split()[1:])
-        if currentCommit is not None:
-            self._commits.append(currentCommit)
+        from gitTools.commitStats import commitStats
+        byRepo:typing.Dict[str,typing.List[str]]={}
+        for commit in self._commits:
+            byRepo.setdefault(commit.localRepoPath,[]).append(commit.hash)
+        ret:typing.Dict[str,"CommitStats"]={}
+        for localRepoPath,hashes in byRepo.items():
+            for stats in commitStats(localRepoPath,hashes):
+                ret[stats.hash]=stats
+        return ret
 
     def __repr__(self)->str:
         return '\n'.join(repr(c) for c in self._commits)
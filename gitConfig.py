@@ -0,0 +1,425 @@
+"""
+Read git configuration directly from the config files
+
+Rather than asking "git config" every time we want to know something
+(eg, where origin points), the config files are parsed in python
+(including [include] and [includeIf] sections) and the result is
+kept until one of the files involved changes.
+"""
+import typing
+import os
+import re
+import threading
+from paths import FilePathCompatible
+
+
+# git will not follow includes deeper than this
+MAX_INCLUDE_DEPTH=10
+
+
+def _configKey(section:str,subsection:typing.Optional[str],name:str)->str:
+    """
+    Build a key the way "git config --list" shows it
+    (section and name are case-insensitive, subsection is not)
+    """
+    if subsection is None:
+        return f'{section.lower()}.{name.lower()}'
+    return f'{section.lower()}.{subsection}.{name.lower()}'
+
+
+def normalizeConfigKey(key:str)->str:
+    """
+    Normalize a key such as "Remote.origin.URL" to "remote.origin.url"
+    """
+    section,_,rest=key.partition('.')
+    subsection,_,name=rest.rpartition('.')
+    if not subsection:
+        return _configKey(section,None,name)
+    return _configKey(section,subsection,name)
+
+
+def _parseValue(text:str,pos:int)->typing.Tuple[str,int]:
+    """
+    Parse a value starting at pos, handling quoting, escapes,
+    comments, and line continuations
+
+    :return: (value,position of the end of the line)
+    """
+    ret:typing.List[str]=[]
+    pending=''  # unquoted whitespace, only kept if more follows
+    quoted=False
+    escapes={'n':'\n','t':'\t','b':'\b','\\':'\\','"':'"'}
+    while pos<len(text):
+        c=text[pos]
+        pos+=1
+        if c=='\n' and not quoted:
+            break
+        if c=='\\':
+            if pos>=len(text):
+                break
+            c=text[pos]
+            pos+=1
+            if c=='\n':
+                continue
+            if c=='\r' and text[pos:pos+1]=='\n':
+                pos+=1
+                continue
+            ret.append(pending+escapes.get(c,c))
+            pending=''
+        elif c=='"':
+            quoted=not quoted
+        elif not quoted and c in '#;':
+            pos=text.find('\n',pos)
+            if pos<0:
+                pos=len(text)
+            break
+        elif not quoted and c.isspace():
+            # (git turns each of these into a plain space)
+            if ret:
+                pending+=' '
+        else:
+            ret.append(pending+c)
+            pending=''
+    return ''.join(ret),pos
+
+
+def parseConfig(
+    text:str
+    )->typing.Generator[typing.Tuple[str,typing.Optional[str]],None,None]:
+    """
+    Parse the text of a git config file
+
+    :return: (key,value) pairs in the order they appear, where value is
+        None for a bare key (which git treats as boolean true)
+    """
+    section=''
+    subsection:typing.Optional[str]=None
+    pos=0
+    header=re.compile(
+        r'\[\s*([-.\w]+)\s*(?:"((?:[^"\\\n]|\\.)*)")?\s*\]')
+    variable=re.compile(r'([A-Za-z][-A-Za-z0-9]*)[ \t]*(=?)')
+    while pos<len(text):
+        lineEnd=text.find('\n',pos)
+        if lineEnd<0:
+            lineEnd=len(text)
+        line=text[pos:lineEnd]
+        stripped=line.lstrip()
+        pos+=len(line)-len(stripped)
+        if not stripped.strip() or stripped[0] in '#;':
+            pos=lineEnd+1
+            continue
+        if stripped[0]=='[':
+            m=header.match(text,pos)
+            if m is None:
+                raise ValueError(f'Bad config section "{stripped.strip()}"')
+            section=m.group(1)
+            subsection=m.group(2)
+            if subsection is not None:
+                subsection=re.sub(r'\\(.)',r'\1',subsection)
+            elif '.' in section:
+                # deprecated [section.subsection] syntax
+                section,subsection=section.split('.',1)
+                subsection=subsection.lower()
+            pos=m.end()
+            # anything else on the line should be a comment
+            # (or another variable, which git also allows)
+            rest=text[pos:lineEnd].strip()
+            if not rest or rest[0] in '#;':
+                pos=lineEnd+1
+            continue
+        m=variable.match(text,pos)
+        if m is None or not section:
+            raise ValueError(f'Bad config line "{stripped.strip()}"')
+        key=_configKey(section,subsection,m.group(1))
+        if m.group(2):
+            value,pos=_parseValue(text,m.end())
+            yield key,value
+        else:
+            yield key,None
+            pos=lineEnd+1
+
+
+def _globToRegex(pattern:str,ignoreCase:bool=False)->typing.Pattern:
+    """
+    Convert a wildmatch pattern, like git uses for includeIf,
+    to a regular expression
+    """
+    ret=[]
+    i=0
+    while i<len(pattern):
+        c=pattern[i]
+        if pattern.startswith('**/',i):
+            ret.append('(?:.*/)?')
+            i+=3
+            continue
+        if pattern.startswith('**',i):
+            ret.append('.*')
+            i+=2
+            continue
+        if c=='*':
+            ret.append('[^/]*')
+        elif c=='?':
+            ret.append('[^/]')
+        elif c=='[':
+            end=pattern.find(']',i+2)
+            if end<0:
+                ret.append(re.escape(c))
+            else:
+                body=pattern[i+1:end]
+                if body[:1]=='!':
+                    body='^'+body[1:]
+                ret.append(f'[{body}]')
+                i=end
+        else:
+            ret.append(re.escape(c))
+        i+=1
+    return re.compile(''.join(ret)+r'\Z',re.IGNORECASE if ignoreCase else 0)
+
+
+class GitConfig:
+    """
+    All config values that apply to a repo, read straight from
+    the system, global, local and worktree config files
+
+    Values are re-read automatically whenever any of the files
+    they came from (or that might now exist) changes.
+    """
+
+    def __init__(self,localRepoPath:FilePathCompatible='.'):
+        """ """
+        from gitTools.commits import findRepoPath,findGitDir
+        repoPath=findRepoPath(localRepoPath)
+        gitDir=findGitDir(localRepoPath,common=False)
+        if repoPath is None or gitDir is None:
+            raise FileNotFoundError(f'"{localRepoPath}" is not a git repo')
+        self.repoPath:str=repoPath
+        self.gitDir:str=gitDir
+        self.commonDir:str=findGitDir(localRepoPath) or gitDir
+        self._lock=threading.Lock()
+        self._entries:typing.List[typing.Tuple[str,typing.Optional[str]]]=[]
+        self._values:typing.Dict[str,typing.Optional[str]]={}
+        self._mtimes:typing.Dict[str,typing.Optional[float]]={}
+
+    def configFiles(self)->typing.List[str]:
+        """
+        The config files that apply to this repo,
+        lowest priority first (they don't all have to exist)
+        """
+        ret=[]
+        if not os.environ.get('GIT_CONFIG_NOSYSTEM'):
+            ret.append(os.environ.get('GIT_CONFIG_SYSTEM','/etc/gitconfig'))
+        if 'GIT_CONFIG_GLOBAL' in os.environ:
+            ret.append(os.environ['GIT_CONFIG_GLOBAL'])
+        else:
+            xdg=os.environ.get('XDG_CONFIG_HOME') or \
+                os.path.join(os.path.expanduser('~'),'.config')
+            ret.append(os.path.join(xdg,'git','config'))
+            ret.append(os.path.join(os.path.expanduser('~'),'.gitconfig'))
+        ret.append(os.path.join(self.commonDir,'config'))
+        ret.append(os.path.join(self.gitDir,'config.worktree'))
+        return ret
+
+    @staticmethod
+    def _mtime(filename:str)->typing.Optional[float]:
+        try:
+            return os.stat(filename).st_mtime
+        except OSError:
+            return None
+
+    def isCurrent(self)->bool:
+        """
+        Is what we have loaded still up to date with the files?
+        """
+        if not self._mtimes:
+            return False
+        for filename,mtime in self._mtimes.items():
+            if self._mtime(filename)!=mtime:
+                return False
+        return True
+
+    def _currentBranch(self)->typing.Optional[str]:
+        """
+        The checked out branch (for includeIf onbranch:)
+        """
+        filename=os.path.join(self.gitDir,'HEAD')
+        self._mtimes[filename]=self._mtime(filename)
+        try:
+            with open(filename,'r',encoding='utf-8') as f:
+                head=f.read().strip()
+        except OSError:
+            return None
+        if head.startswith('ref: refs/heads/'):
+            return head[16:]
+        return None
+
+    def _includeApplies(self,condition:str,filename:str)->bool:
+        """
+        Does an [includeIf "condition"] apply to this repo?
+        """
+        kind,_,pattern=condition.partition(':')
+        if kind in ('gitdir','gitdir/i'):
+            if pattern.startswith('~/'):
+                pattern=os.path.expanduser(pattern)
+            elif pattern.startswith('./'):
+                pattern=os.path.join(os.path.dirname(filename),pattern[2:])
+            pattern=pattern.replace(os.sep,'/')
+            if not re.match(r'/|\*\*/|[A-Za-z]:/',pattern):
+                pattern='**/'+pattern
+            if pattern.endswith('/'):
+                pattern+='**'
+            regex=_globToRegex(pattern,kind=='gitdir/i')
+            for gitDir in {self.gitDir,os.path.realpath(self.gitDir)}:
+                if regex.match(gitDir.replace(os.sep,'/')):
+                    return True
+            return False
+        if kind=='onbranch':
+            branch=self._currentBranch()
+            if branch is None:
+                return False
+            if pattern.endswith('/'):
+                pattern+='**'
+            return _globToRegex(pattern).match(branch) is not None
+        # eg, hasconfig:remote.*.url: which we don't support
+        return False
+
+    def _readFile(self,
+        filename:str,
+        entries:typing.List[typing.Tuple[str,typing.Optional[str]]],
+        depth:int=0
+        )->None:
+        """
+        Read a config file, and any files it includes, into entries
+        """
+        filename=os.path.abspath(os.path.expanduser(filename))
+        mtime=self._mtime(filename)
+        self._mtimes[filename]=mtime
+        if mtime is None or depth>MAX_INCLUDE_DEPTH:
+            return
+        try:
+            with open(filename,'r',encoding='utf-8',errors='replace') as f:
+                text=f.read()
+        except OSError:
+            return
+        for key,value in parseConfig(text):
+            entries.append((key,value))
+            if value is None or not key.endswith('.path'):
+                continue
+            include=False
+            if key=='include.path':
+                include=True
+            elif key.startswith('includeif.'):
+                include=self._includeApplies(key[10:-5],filename)
+            if include:
+                path=os.path.expanduser(value)
+                if not os.path.isabs(path):
+                    path=os.path.join(os.path.dirname(filename),path)
+                self._readFile(path,entries,depth+1)
+
+    def reload(self)->None:
+        """
+        Re-read all of the config files
+        """
+        with self._lock:
+            self._mtimes={}
+            entries:typing.List[typing.Tuple[str,typing.Optional[str]]]=[]
+            for filename in self.configFiles():
+                self._readFile(filename,entries)
+            self._entries=entries
+            self._values=dict(entries)
+
+    def _current(self)->None:
+        if not self.isCurrent():
+            self.reload()
+
+    @property
+    def entries(self)->typing.List[typing.Tuple[str,typing.Optional[str]]]:
+        """
+        Every (key,value) in every config file, in the order git reads them
+        """
+        self._current()
+        return self._entries
+
+    def get(self,key:str,default:typing.Any=None)->typing.Any:
+        """
+        Get a config value (the last one, if it is set more than once)
+
+        A key that is present without any value (boolean true)
+        is returned as ''
+        """
+        self._current()
+        key=normalizeConfigKey(key)
+        if key not in self._values:
+            return default
+        value=self._values[key]
+        return '' if value is None else value
+
+    def getAll(self,key:str)->typing.List[str]:
+        """
+        Get every value of a multi-valued key
+        """
+        key=normalizeConfigKey(key)
+        return ['' if v is None else v for k,v in self.entries if k==key]
+
+    def asDict(self)->typing.Dict[str,str]:
+        """
+        All config values {key:value}, the same as "git config --list"
+        (if a key is listed more than once, the last one wins)
+        """
+        self._current()
+        return {k:'' if v is None else v for k,v in self._values.items()}
+
+    def subsections(self,section:str)->typing.List[str]:
+        """
+        All subsection names for a section
+        (eg, the names of all remotes for "remote")
+        """
+        prefix=section.lower()+'.'
+        ret:typing.List[str]=[]
+        for key,_ in self.entries:
+            if key.startswith(prefix):
+                subsection=key[len(prefix):].rpartition('.')[0]
+                if subsection and subsection not in ret:
+                    ret.append(subsection)
+        return ret
+
+    def rewriteUrl(self,url:str,push:bool=False)->str:
+        """
+        Apply any url.<base>.insteadOf (or pushInsteadOf) rules to a url
+        """
+        best=''
+        bestBase=None
+        kinds=('pushinsteadof','insteadof') if push else ('insteadof',)
+        for kind in kinds:
+            for key,value in self.entries:
+                if not value or not key.startswith('url.'):
+                    continue
+                if key.endswith('.'+kind) and url.startswith(value) \
+                    and len(value)>len(best):
+                    best=value
+                    bestBase=key[4:-len(kind)-1]
+            if bestBase is not None:
+                break
+        if bestBase is None:
+            return url
+        return bestBase+url[len(best):]
+
+
+_configs:typing.Dict[str,GitConfig]={}
+_configsLock=threading.Lock()
+
+
+def getConfig(localRepoPath:FilePathCompatible='.')->GitConfig:
+    """
+    Get the shared config for a repo
+    """
+    from gitTools.commits import findRepoPath
+    repoPath=findRepoPath(localRepoPath)
+    if repoPath is None:
+        raise FileNotFoundError(f'"{localRepoPath}" is not a git repo')
+    repoPath=os.path.normcase(repoPath)
+    with _configsLock:
+        config=_configs.get(repoPath)
+        if config is None:
+            config=GitConfig(repoPath)
+            _configs[repoPath]=config
+    return config
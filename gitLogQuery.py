@@ -0,0 +1,340 @@
+"""
+Lazy, chainable queries against the git log
+
+Rather than loading the entire history and then filtering it in python,
+a GitLogQuery collects the filters and hands them all to git as a
+single "git log" command line, eg:
+
+    repo.commits().since('2 weeks ago').author('bob').path('src').limit(10)
+
+Nothing is run until the query is iterated (or one of the methods
+that needs results is called), and every chained call returns a new
+query, so a partially-built query can be safely reused.
+"""
+import typing
+import datetime
+from paths import FilePathCompatible
+from gitTools.gitCommit import GitCommit
+from gitTools.gitCommits import GitCommits
+if typing.TYPE_CHECKING:
+    from gitTools.backends import GitBackend
+    from gitTools.pagedCommits import PagedGitCommits
+
+
+DateCompatible=typing.Union[str,datetime.datetime,datetime.date,int,float]
+
+
+def _dateArg(date:DateCompatible)->str:
+    """
+    Convert a date into something git's date parser will accept
+
+    Strings (eg, "2 weeks ago") are passed through untouched,
+    numbers are treated as unix timestamps.
+    """
+    if isinstance(date,datetime.datetime):
+        return date.isoformat()
+    if isinstance(date,datetime.date):
+        return date.isoformat()
+    if isinstance(date,(int,float)):
+        return f'@{int(date)}'
+    return str(date)
+
+
+class GitLogQuery:
+    """
+    A lazily-evaluated "git log" query
+
+    Each filter method returns a new query with that filter added.
+    Where the same filter is given more than once:
+        since/until/limit/skip - the last one wins
+        author/committer/grep - a commit matching any of them is included
+            (unless allMatch() is used for grep)
+        path/revs - accumulate
+    """
+
+    def __init__(self,
+        localRepoPath:FilePathCompatible='.',
+        revs:typing.Iterable[str]=(),
+        backend:typing.Optional["GitBackend"]=None):
+        """
+        :backend: what runs git (default is the repo's getBackend())
+        """
+        self.localRepoPath=localRepoPath
+        self.backend=backend
+        self._revs:typing.Tuple[str,...]=tuple(revs)
+        self._paths:typing.Tuple[str,...]=()
+        self._since:typing.Optional[str]=None
+        self._until:typing.Optional[str]=None
+        self._authors:typing.Tuple[str,...]=()
+        self._committers:typing.Tuple[str,...]=()
+        self._greps:typing.Tuple[str,...]=()
+        self._allMatch=False
+        self._ignoreCase=False
+        self._fixedStrings=False
+        self._limit:typing.Optional[int]=None
+        self._skip:typing.Optional[int]=None
+        self._merges:typing.Optional[bool]=None
+        self._firstParent=False
+        self._reverse=False
+
+    def _with(self,**changes)->"GitLogQuery":
+        """
+        Return a copy of this query with some fields changed
+        """
+        query=GitLogQuery.__new__(GitLogQuery)
+        query.__dict__.update(self.__dict__)
+        for name,value in changes.items():
+            setattr(query,'_'+name,value)
+        return query
+
+    def revs(self,*revs:str)->"GitLogQuery":
+        """
+        Walk the history from these revisions (default is HEAD)
+
+        Accepts anything git log does, eg "main", "v1.0..v2.0", "^old"
+        """
+        return self._with(revs=self._revs+revs)
+    rev=revs
+
+    def all(self)->"GitLogQuery":
+        """
+        Walk the history of all refs
+        """
+        return self.revs('--all')
+
+    def path(self,*paths:FilePathCompatible)->"GitLogQuery":
+        """
+        Only commits that touch these paths (git pathspecs)
+        """
+        return self._with(paths=self._paths+tuple(str(p) for p in paths))
+    paths=path
+
+    def since(self,date:DateCompatible)->"GitLogQuery":
+        """
+        Only commits more recent than the given date
+        """
+        return self._with(since=_dateArg(date))
+    after=since
+
+    def until(self,date:DateCompatible)->"GitLogQuery":
+        """
+        Only commits older than the given date
+        """
+        return self._with(until=_dateArg(date))
+    before=until
+
+    def between(self,
+        start:DateCompatible,
+        end:DateCompatible
+        )->"GitLogQuery":
+        """
+        Only commits within the given dates
+        """
+        return self.since(start).until(end)
+
+    def author(self,*patterns:str)->"GitLogQuery":
+        """
+        Only commits where the author name/email matches a pattern
+        """
+        return self._with(authors=self._authors+patterns)
+
+    def committer(self,*patterns:str)->"GitLogQuery":
+        """
+        Only commits where the committer name/email matches a pattern
+        """
+        return self._with(committers=self._committers+patterns)
+
+    def grep(self,*patterns:str)->"GitLogQuery":
+        """
+        Only commits where the message matches a pattern
+        """
+        return self._with(greps=self._greps+patterns)
+
+    def allMatch(self,allMatch:bool=True)->"GitLogQuery":
+        """
+        Require the message to match all grep patterns, not just one
+        """
+        return self._with(allMatch=allMatch)
+
+    def ignoreCase(self,ignoreCase:bool=True)->"GitLogQuery":
+        """
+        Make the author/committer/grep matching case insensitive
+        """
+        return self._with(ignoreCase=ignoreCase)
+
+    def fixedStrings(self,fixedStrings:bool=True)->"GitLogQuery":
+        """
+        Treat the author/committer/grep patterns as plain text,
+        not regular expressions
+        """
+        return self._with(fixedStrings=fixedStrings)
+
+    def limit(self,count:typing.Optional[int])->"GitLogQuery":
+        """
+        Return at most this many commits
+
+        NOTE: like git, this is applied before reverse(), so
+        .reverse().limit(10) is the newest 10 commits, oldest first
+        """
+        return self._with(limit=count)
+
+    def skip(self,count:typing.Optional[int])->"GitLogQuery":
+        """
+        Skip this many commits before returning any
+        (newest first, the same as limit())
+        """
+        return self._with(skip=count)
+
+    def noMerges(self)->"GitLogQuery":
+        """
+        Leave out merge commits
+        """
+        return self._with(merges=False)
+
+    def merges(self)->"GitLogQuery":
+        """
+        Only merge commits
+        """
+        return self._with(merges=True)
+
+    def firstParent(self)->"GitLogQuery":
+        """
+        Only follow the first parent of merges
+        """
+        return self._with(firstParent=True)
+
+    def reverse(self,reverse:bool=True)->"GitLogQuery":
+        """
+        Return the oldest commits first
+
+        (see limit() for how the two go together)
+        """
+        return self._with(reverse=reverse)
+
+    def _filterArgs(self)->typing.List[str]:
+        """
+        The commit limiting arguments, which both
+        "git log" and "git rev-list" understand
+        """
+        args:typing.List[str]=[]
+        if self._since is not None:
+            args.append(f'--since={self._since}')
+        if self._until is not None:
+            args.append(f'--until={self._until}')
+        args.extend(f'--author={a}' for a in self._authors)
+        args.extend(f'--committer={c}' for c in self._committers)
+        args.extend(f'--grep={g}' for g in self._greps)
+        if self._allMatch and self._greps:
+            args.append('--all-match')
+        if self._ignoreCase:
+            args.append('--regexp-ignore-case')
+        if self._fixedStrings:
+            args.append('--fixed-strings')
+        if self._merges is True:
+            args.append('--merges')
+        elif self._merges is False:
+            args.append('--no-merges')
+        if self._firstParent:
+            args.append('--first-parent')
+        return args
+
+    def _revArgs(self)->typing.List[str]:
+        """
+        The revisions and pathspecs, which always go last
+        """
+        args=list(self._revs)
+        if self._paths:
+            args.append('--')
+            args.extend(self._paths)
+        return args
+
+    def args(self)->typing.List[str]:
+        """
+        The "git log" parameters this query compiles to
+        """
+        args=self._filterArgs()
+        if self._skip:
+            args.append(f'--skip={self._skip}')
+        if self._limit is not None:
+            args.append(f'--max-count={self._limit}')
+        if self._reverse:
+            args.append('--reverse')
+        args.extend(self._revArgs())
+        return args
+
+    def __iter__(self)->typing.Iterator[GitCommit]:
+        """
+        Run the query, streaming each commit as git produces it
+        """
+        from gitTools.commits import iterGitLog
+        if self._limit is not None and self._limit<=0:
+            return iter(())
+        return iterGitLog(self.localRepoPath,self.args(),
+            backend=self.backend)
+
+    def first(self)->typing.Optional[GitCommit]:
+        """
+        The first commit the query gives (if any)
+
+        (for a reverse() query, that is the oldest one, which
+        git still has to walk the whole history to find)
+        """
+        query=self
+        if not self._reverse:
+            # (--max-count is applied before --reverse,
+            # so this can only be done going forward)
+            query=self.limit(1 if self._limit is None else min(1,self._limit))
+        for commit in query:
+            return commit
+        return None
+
+    def count(self)->int:
+        """
+        How many commits match (without loading any of them)
+        """
+        from gitTools.backends import getBackend
+        if self._limit is not None and self._limit<=0:
+            return 0
+        args=['rev-list','--count',*self._filterArgs()]
+        if self._skip:
+            args.append(f'--skip={self._skip}')
+        if self._limit is not None:
+            args.append(f'--max-count={self._limit}')
+        revs=self._revArgs()
+        if not self._revs:
+            revs.insert(0,'HEAD')
+        args.extend(revs)
+        backend=self.backend
+        if backend is None:
+            backend=getBackend(str(self.localRepoPath))
+        result=backend.run(args).check()
+        return int(result.out.strip() or 0)
+
+    def gitCommits(self,compact:bool=False)->GitCommits:
+        """
+        Run the query and collect the results into a GitCommits
+
+        :compact: return a CompactGitCommits, which needs about a
+            quarter of the memory for very large results
+        """
+        if compact:
+            from gitTools.compactCommits import CompactGitCommits
+            return CompactGitCommits.fromGitLog(
+                self.localRepoPath,self.args(),self.backend)
+        return GitCommits(self,repoPath=str(self.localRepoPath))
+    toGitCommits=gitCommits
+
+    def paged(self,pageSize:typing.Optional[int]=None)->"PagedGitCommits":
+        """
+        The results as a PagedGitCommits, which is only
+        fetched from git a page at a time
+
+        (limit/skip/reverse are left out, since paging does its own)
+        """
+        from gitTools.pagedCommits import PagedGitCommits,DEFAULT_PAGE_SIZE
+        return PagedGitCommits(self.localRepoPath,self._revs,
+            self._filterArgs(),self._paths,pageSize or DEFAULT_PAGE_SIZE,
+            backend=self.backend)
+
+    def __repr__(self)->str:
+        return f'GitLogQuery({str(self.localRepoPath)!r},{self.args()!r})'
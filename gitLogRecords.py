@@ -0,0 +1,351 @@
+"""
+Machine-readable git log records
+
+Rather than scraping the human-readable "git log" output, we ask git
+for a NUL-delimited --format and pick it apart as it streams in.
+
+Every record starts with an ASCII record separator (0x1e), followed
+by the LOG_FIELDS separated by NULs.  Anything after the last field
+(patch text, numstat, etc) is handed back untouched.
+
+Since a commit message or patch can itself contain 0x1e, one only counts
+as the start of a record when it is followed by a full commit hash and
+a NUL (which git never puts in a message or a text patch).
+
+The older human-readable output can also be read, for
+whatever has it lying around.
+"""
+import typing
+import datetime
+try:
+    import regex as re # type: ignore
+except ImportError:
+    import re
+from gitTools.gitCommit import GitCommit,commitSource
+
+
+RECORD_START=b'\x1e'
+# a RECORD_START that really starts a record (sha1 or sha256)
+RECORD_START_RE=re.compile(rb'\x1e(?:[0-9a-f]{64}|[0-9a-f]{40})\0')
+# the most that RECORD_START_RE can need to see
+RECORD_HEADER_SIZE=1+64+1
+LOG_FIELDS=(
+    'hash',
+    'parents',
+    'author',
+    'authorEmail',
+    'date',
+    'description')
+LOG_FORMAT='--format=%x1e%H%x00%P%x00%an%x00%ae%x00%ad%x00%B%x00'
+LOG_DATE_FORMAT='--date=raw'
+LOG_ARGS=(LOG_FORMAT,LOG_DATE_FORMAT)
+# just enough for a GitCommit.lazy()
+LAZY_LOG_FORMAT='--format=%x1e%H%x00%P%x00%ad%x00'
+LAZY_LOG_ARGS=(LAZY_LOG_FORMAT,LOG_DATE_FORMAT)
+# how many lazy commits get loaded at once
+LAZY_BATCH_SIZE=256
+READ_CHUNK_SIZE=64*1024
+# the first line of each commit in human-readable git log output
+# (sha1 or sha256, maybe followed by decorations or "(from ...)")
+TEXT_COMMIT_RE=re.compile(
+    r'^commit ([0-9a-f]{64}|[0-9a-f]{40})(?![0-9a-f])[^\n]*$',re.MULTILINE)
+# how git indents message lines in human-readable git log output
+MESSAGE_INDENT='    '
+
+
+def readChunks(
+    stream:typing.BinaryIO,
+    chunkSize:int=READ_CHUNK_SIZE
+    )->typing.Generator[bytes,None,None]:
+    """
+    Read a binary stream in chunks, handing back whatever
+    is available rather than waiting for a full chunk
+    """
+    read=getattr(stream,'read1',stream.read)
+    while True:
+        chunk=read(chunkSize)
+        if not chunk:
+            break
+        yield chunk
+
+
+def iterLogRecords(
+    chunks:typing.Union[typing.BinaryIO,typing.Iterable[bytes]]
+    )->typing.Generator[bytes,None,None]:
+    """
+    Split git log output into individual records
+
+    Each record is yielded as soon as the start of the next one arrives
+    (or the output ends), so only one record plus one read chunk is
+    ever held in memory.
+
+    A RECORD_START inside a message or patch is left in the record
+    (see RECORD_START_RE).
+
+    :chunks: a binary stream, or an iterable of bytes chunks
+    """
+    if hasattr(chunks,'read'):
+        chunks=readChunks(chunks) # type: ignore
+    buf=bytearray()
+    searchFrom=1
+    for chunk in chunks: # type: ignore
+        buf+=chunk
+        while True:
+            idx=buf.find(RECORD_START,searchFrom)
+            if idx<0:
+                searchFrom=max(1,len(buf))
+                break
+            if RECORD_START_RE.match(buf,idx) is None:
+                if len(buf)-idx<RECORD_HEADER_SIZE:
+                    # wait for more to tell
+                    searchFrom=idx
+                    break
+                searchFrom=idx+1
+                continue
+            if buf[0:1]==RECORD_START:
+                yield bytes(buf[1:idx])
+            del buf[:idx]
+            searchFrom=1
+    if buf[0:1]==RECORD_START:
+        yield bytes(buf[1:])
+
+
+def parseLogTime(
+    rawDate:str
+    )->typing.Tuple[typing.Optional[float],typing.Optional[int]]:
+    """
+    Parse a --date=raw value, eg "1700000000 +0100"
+
+    :return: (timestamp,utc offset in minutes)
+    """
+    epochTz=rawDate.split()
+    if not epochTz:
+        return None,None
+    offset=0
+    if len(epochTz)>1:
+        tz=epochTz[1]
+        offset=int(tz[1:3])*60+int(tz[3:5])
+        if tz[0]=='-':
+            offset=-offset
+    return float(int(epochTz[0])),offset
+
+
+def parseLogDate(rawDate:str)->typing.Optional[datetime.datetime]:
+    """
+    Parse a --date=raw value, eg "1700000000 +0100"
+    """
+    time,offset=parseLogTime(rawDate)
+    if time is None:
+        return None
+    return datetime.datetime.fromtimestamp(time,
+        datetime.timezone(datetime.timedelta(minutes=offset or 0)))
+
+
+def splitLogRecord(
+    record:bytes
+    )->typing.Tuple[typing.List[str],bytes]:
+    """
+    Split a record into its decoded LOG_FIELDS and whatever
+    trailing data git appended after them
+    """
+    values=record.split(b'\0',len(LOG_FIELDS))
+    if len(values)<=len(LOG_FIELDS):
+        values.extend([b'']*(len(LOG_FIELDS)+1-len(values)))
+    fields=[v.decode('utf-8',errors='replace') for v in values[:-1]]
+    return fields,values[-1]
+
+
+def iterRecordSpans(
+    data:bytes,
+    start:int=0,
+    end:typing.Optional[int]=None
+    )->typing.Generator[typing.Tuple[int,int],None,None]:
+    """
+    Find the records in a complete buffer of git log output,
+    without copying any of them
+
+    :return: (start,end) of each record, not including
+        the RECORD_START that begins it
+    """
+    if end is None:
+        end=len(data)
+    idx=_findRecordStart(data,start,end)
+    while idx>=0:
+        nextIdx=_findRecordStart(data,idx+1,end)
+        yield (idx+1,end if nextIdx<0 else nextIdx)
+        idx=nextIdx
+
+
+def _findRecordStart(data:bytes,start:int,end:int)->int:
+    """
+    Find the next RECORD_START in data[start:end] that really
+    starts a record (see RECORD_START_RE)
+
+    :return: its index, or -1
+    """
+    idx=data.find(RECORD_START,start,end)
+    while idx>=0 and RECORD_START_RE.match(data,idx,end) is None:
+        idx=data.find(RECORD_START,idx+1,end)
+    return idx
+
+
+def commitFromLogSpan(
+    data:bytes,
+    start:int,
+    end:int,
+    githubUrl:typing.Any=None,
+    localRepoPath:typing.Optional[str]=None
+    )->GitCommit:
+    """
+    Create a GitCommit from the record at data[start:end]
+
+    Any patch text after the fields is not copied, only its location
+    in data is remembered (see GitCommit.logPatch).
+    """
+    fields:typing.List[str]=[]
+    pos=start
+    for _ in LOG_FIELDS:
+        nul=data.find(b'\0',pos,end)
+        if nul<0:
+            nul=end
+        fields.append(data[pos:nul].decode('utf-8',errors='replace'))
+        pos=min(nul+1,end)
+    hash,parents,author,authorEmail,date,description=fields # noqa: E501 # pylint: disable=W0622
+    commit=GitCommit(hash,githubUrl=githubUrl,localRepoPath=localRepoPath)
+    commit.parents=parents.split()
+    commit.author=author
+    commit.authorEmail=authorEmail
+    time,offset=parseLogTime(date)
+    if time is not None:
+        commit.setTime(time,offset)
+    commit.description=description.strip()
+    if data[pos:end].strip():
+        commit.setLogPatch(data,pos,end)
+    return commit
+
+
+def commitFromLogRecord(
+    record:bytes,
+    githubUrl:typing.Any=None,
+    localRepoPath:typing.Optional[str]=None
+    )->GitCommit:
+    """
+    Create a GitCommit from a single record
+    """
+    return commitFromLogSpan(record,0,len(record),githubUrl,localRepoPath)
+
+
+def commitsFromLogBuffer(
+    data:bytes,
+    githubUrl:typing.Any=None,
+    localRepoPath:typing.Optional[str]=None
+    )->typing.Generator[GitCommit,None,None]:
+    """
+    Create GitCommits from a complete buffer of git log output
+    (as produced with LOG_ARGS)
+    """
+    for start,end in iterRecordSpans(data):
+        yield commitFromLogSpan(data,start,end,githubUrl,localRepoPath)
+
+
+def lazyCommitsFromLog(
+    chunks:typing.Union[typing.BinaryIO,typing.Iterable[bytes]],
+    githubUrl:typing.Any=None,
+    localRepoPath:typing.Optional[str]=None,
+    batchSize:int=LAZY_BATCH_SIZE
+    )->typing.Generator[GitCommit,None,None]:
+    """
+    Create lazy GitCommits from git log output (as produced
+    with LAZY_LOG_ARGS) as it streams in
+
+    The commits are grouped into batches of batchSize, which are
+    each read from the repo in one go when first needed.
+    """
+    source=commitSource(localRepoPath,githubUrl)
+    # parent hashes not seen as a commit yet, so that
+    # the same string is used for both
+    parentNames:typing.Dict[str,str]={}
+    batch:typing.List[GitCommit]=[]
+    for record in iterLogRecords(chunks):
+        hash,parents,date=[ # pylint: disable=W0622
+            value.decode('ascii',errors='replace')
+            for value in record.split(b'\0',3)[:3]]
+        hash=parentNames.pop(hash,hash)
+        time,offset=parseLogTime(date)
+        if len(batch)>=batchSize:
+            batch=[]
+        yield GitCommit.lazy(hash,
+            [parentNames.setdefault(p,p) for p in parents.split()],
+            time or 0.0,offset,source,batch)
+
+
+def _textHeader(
+    commit:GitCommit,
+    line:str
+    )->None:
+    """
+    Apply one header line of human-readable git log output
+    """
+    key,_,value=line.partition(':')
+    value=value.strip()
+    if key in ('Author','AuthorDate'):
+        if key=='Author':
+            name,_,email=value.partition('<')
+            commit.author=name.rstrip()
+            commit.authorEmail=email.split('>',1)[0].strip()
+        else:
+            commit.date=value
+    elif key=='Date' and commit.date is None:
+        commit.date=value
+    elif key=='Merge':
+        commit.merge=value.split()
+
+
+def commitsFromLogText(
+    text:str,
+    githubUrl:typing.Any=None,
+    localRepoPath:typing.Optional[str]=None
+    )->typing.Generator[GitCommit,None,None]:
+    """
+    Create GitCommits from ordinary human-readable "git log" output
+    (with or without --decorate, patches, sha256 hashes, etc)
+
+    Only the header and message lines are looked at individually.
+    Patch text is not split up, only its location in text is remembered
+    (see GitCommit.logPatch).
+    """
+    matches=list(TEXT_COMMIT_RE.finditer(text))
+    for i,match in enumerate(matches):
+        end=matches[i+1].start() if i+1<len(matches) else len(text)
+        commit=GitCommit(match.group(1),
+            githubUrl=githubUrl,localRepoPath=localRepoPath)
+        pos=match.end()+1
+        # headers, up to the first blank line
+        while pos<end:
+            eol=text.find('\n',pos,end)
+            if eol<0:
+                eol=end
+            line=text[pos:eol]
+            pos=eol+1
+            if not line.strip():
+                break
+            _textHeader(commit,line)
+        # indented message lines (anything else starts the patch/stat)
+        descriptionLines:typing.List[str]=[]
+        patchStart=min(pos,end)
+        while pos<end:
+            eol=text.find('\n',pos,end)
+            if eol<0:
+                eol=end
+            line=text[pos:eol]
+            if line.startswith(MESSAGE_INDENT):
+                line=line[len(MESSAGE_INDENT):]
+            elif line.strip():
+                break
+            descriptionLines.append(line.rstrip())
+            pos=eol+1
+            patchStart=min(pos,end)
+        commit.description='\n'.join(descriptionLines).strip()
+        if text[patchStart:end].strip():
+            commit.setLogPatch(text,patchStart,end)
+        yield commit
@@ -4,8 +4,8 @@ information is fetched.  Anything that has code, but no
 git information is reported.
 """
 import typing
-import subprocess
 from paths import FilePath, FilePathCompatible,asFilePath
+from gitTools.backends import getBackend
 
 
 codeExtensions=(
@@ -46,14 +46,11 @@ def gitRecursive(
     def r(location:FilePath):
         if (location/'.git').is_dir():
             # this is a git project
+            backend=getBackend(location)
             fetchOk=False
             if fetch or sync:
                 # run git fetch
-                cmd=['git','fetch']
-                po=subprocess.Popen(cmd,cwd=str(location),
-                    stderr=subprocess.PIPE)
-                _,errB=po.communicate()
-                errB=errB.strip()
+                errB=backend.run(['fetch']).stderr.strip()
                 if errB:
                     print(f'ERR: fetching "{location}"')
                     print(errB.decode('utf-8',errors='ignore'))
@@ -64,11 +61,9 @@ def gitRecursive(
             else:
                 skip_fetch.append(location)
             # check the git status to see if it needs checkin
-            cmd=['git','status','-s']
-            po=subprocess.Popen(cmd,cwd=str(location),
-                stdout=subprocess.PIPE,stderr=subprocess.PIPE)
-            outB,errB=po.communicate()
-            errB=errB.strip()
+            result=backend.run(['status','-s'])
+            outB=result.stdout
+            errB=result.stderr.strip()
             if errB:
                 print(f'ERR: checking git status for "{location}"')
                 print(errB.decode('utf-8',errors='ignore'))
@@ -83,11 +78,7 @@ def gitRecursive(
             pullOk=False
             if sync and fetchOk:
                 # run git pull
-                cmd=['git','pull']
-                po=subprocess.Popen(cmd,cwd=str(location),
-                    stderr=subprocess.PIPE)
-                _,errB=po.communicate()
-                errB=errB.strip()
+                errB=backend.run(['pull']).stderr.strip()
                 if errB:
                     print(f'ERR: pulling "{location}"')
                     print(errB.decode('utf-8',errors='ignore'))
@@ -96,11 +87,7 @@ def gitRecursive(
                     pullOk=True
             if sync and pullOk:
                 # run git push
-                cmd=['git','push']
-                po=subprocess.Popen(cmd,cwd=str(location),
-                    stderr=subprocess.PIPE)
-                _,errB=po.communicate()
-                errB=errB.strip()
+                errB=backend.run(['push']).stderr.strip()
                 if errB:
                     print(f'ERR: pushing "{location}"')
                     print(errB.decode('utf-8',errors='ignore'))
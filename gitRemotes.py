@@ -4,8 +4,8 @@ Manage remotes for a repo
 import typing
 from paths import (
     URL,FilePathCompatible,UrlCompatible,asFilePath,asUrl)
-from k_runner.osrun import osrun
-from gitTools.exceptions import GitException
+from gitTools.backends import GitBackend,getBackend
+from gitTools.gitConfig import getConfig
 
 
 class GitRemote:
@@ -23,33 +23,37 @@ def listGitRemotes(
     )->typing.Iterable[GitRemote]:
     """
     List all remotes for a local repo
+
+    (the same as "git remote -v", but read straight from the config)
     """
     ret=[]
-    cmd=['git','remote','-v']
-    result=osrun(cmd,workingDirectory=asFilePath(localRepoPath))
-    for line in result:
-        abc=line.split()
-        if len(abc)==3:
-            ret.append(GitRemote(
-                abc[0],
-                abc[1],
-                abc[2].replace('(','').replace(')','')
-                ))
+    config=getConfig(asFilePath(localRepoPath))
+    for name in sorted(config.subsections('remote')):
+        urls=config.getAll(f'remote.{name}.url')
+        if not urls:
+            continue
+        ret.append(GitRemote(name,config.rewriteUrl(urls[0]),'fetch'))
+        pushUrls=config.getAll(f'remote.{name}.pushurl')
+        if not pushUrls:
+            pushUrls=[config.rewriteUrl(url,push=True) for url in urls]
+        for url in pushUrls:
+            ret.append(GitRemote(name,url,'push'))
     return ret
 
 
 def addGitRemote(
     localRepoPath:FilePathCompatible,
     name:str,
-    url:UrlCompatible):
+    url:UrlCompatible,
+    backend:typing.Optional[GitBackend]=None):
     """
     Add a new git remote
+
+    :backend: what runs git (default is the repo's getBackend())
     """
-    cmd=['git','remote','add',name,str(asUrl(url))]
-    result=osrun(cmd,workingDirectory=asFilePath(localRepoPath))
-    out=result.stdOutErr
-    if out.find('\nfatal: ')>=0:
-        raise GitException(out)
+    if backend is None:
+        backend=getBackend(asFilePath(localRepoPath))
+    backend.run(['remote','add',name,str(asUrl(url))]).check()
 
 
 def githubRemote(
@@ -74,14 +78,8 @@ def githubUrl(
     but it seems like it would be, so people will probably
     look here to find it.
     """
-    import subprocess
-    cmd=['git','config','--get-regexp','remote.origin.url.*']
-    po=subprocess.Popen(cmd,cwd=asFilePath(localRepoPath),stdout=subprocess.PIPE)
-    out,_=po.communicate()
-    result=out.strip().decode('utf-8',errors='ignore')
-    #result=osrun(cmd,workingDirectory=asFilePath(localRepoPath))
-    resultArray=str(result).strip().split(' ',1)
-    if len(resultArray)>1:
-        result=resultArray[1].rsplit('.git',1)[0]
-        return URL(result)
+    result=getConfig(asFilePath(localRepoPath)).get(
+        'remote.origin.url','').strip()
+    if result:
+        return URL(result.rsplit('.git',1)[0])
     return None
@@ -7,12 +7,23 @@ from paths import (
     UrlCompatible,URL,FileUrlCompatible,FileUrl)
 from gitTools.branches import gitAbandonChanges
 from gitTools.commits import (
-    findRepoInfo,gitLog,gitCommitsForFunction,gitCommitsForLine)
+    findRepoInfo,gitLog,iterGitLog,gitCommitsForFunction,gitCommitsForLine,
+    gitCommitsForLineRanges,LineRange,gitCommitsForFunctions)
+from gitTools.gitCommit import GitCommit
+from gitTools.commitIndex import CommitIndex
+from gitTools.catFile import GitObjectReader,getObjectReader
+from gitTools.objectStore import GitObjectStore,getObjectStore
+from gitTools.backends import GitBackend,getBackend
+from gitTools.commitGraph import CommitGraph,getCommitGraph
 from gitTools.gitCommits import GitCommits
+from gitTools.gitLogQuery import GitLogQuery
+from gitTools.pagedCommits import PagedGitCommits,DEFAULT_PAGE_SIZE
+from gitTools.diffLimits import DiffLimits,limitedDiff
 from pullRequests import getPRs
 from tagsAndVersions import gitLatestReleaseVersion,gitTags,gitVersionTags
 from gitRemotes import addGitRemote, listGitRemotes,GitRemote,githubUrl
-from .diff import MultifileDiff
+from .diff import (
+    MultifileDiff,GitDifferences,iterFileDiffs,notifyFileDiffs)
 from .exceptions import GitException
 
 
@@ -26,8 +37,14 @@ class GitRepo:
 
     def __init__(self,
         localRepoPath:FileUrlCompatible='.',
-        url:typing.Optional[UrlCompatible]=None):
-        """ """
+        url:typing.Optional[UrlCompatible]=None,
+        backend:typing.Optional[GitBackend]=None):
+        """
+        :backend: what performs the git operations for this repo
+            (default is the repo's shared getBackend(), normally the
+            git command line)
+        """
+        self._backend=backend
         if url is None:
             url=githubUrl(localRepoPath)
             if url is None:
@@ -42,6 +59,7 @@ class GitRepo:
             raise FileNotFoundError(msg)
         self._remotes:typing.Optional[
             typing.List[GitRemote]]=None
+        self._commitIndex:typing.Optional[CommitIndex]=None
 
     @property
     def localRepoPath(self)->FileUrl:
@@ -172,7 +190,7 @@ class GitRepo:
         """
         Add a new git remote
         """
-        addGitRemote(self.localRepoPath,name,url)
+        addGitRemote(self.localRepoPath,name,url,self._backend)
         self._remotes=None # must be reloaded
     addRemote=addGitRemote
 
@@ -180,15 +198,112 @@ class GitRepo:
         """
         get the history log
         """
-        return gitLog(self.localRepoPath,moreparams)
+        return gitLog(self.localRepoPath,moreparams,backend=self._backend)
     history=gitLog
 
+    def iterHistory(self,
+        moreparams:typing.Union[str,typing.Iterable[str]]=""
+        )->typing.Iterator[GitCommit]:
+        """
+        Stream the history log one commit at a time, without
+        ever loading the whole thing
+        """
+        return iterGitLog(self.localRepoPath,moreparams,backend=self._backend)
+
+    def commits(self,*revs:str)->GitLogQuery:
+        """
+        Start a lazy query against the history log, eg:
+            repo.commits().since('1 month ago').author('bob').limit(10)
+
+        The filters are all handed to a single "git log", which
+        is only run when the query is iterated.
+
+        :revs: where to walk the history from (default is HEAD)
+        """
+        return GitLogQuery(self.localRepoPath,revs,self._backend)
+
+    @property
+    def objectReader(self)->GitObjectReader:
+        """
+        The long-lived "git cat-file" object reader for this repo
+        """
+        return getObjectReader(self.localRepoPath)
+
+    @property
+    def backend(self)->GitBackend:
+        """
+        What performs the git operations for this repo
+
+        (Setting it only affects this GitRepo, see also setBackend())
+        """
+        if self._backend is None:
+            return getBackend(self.localRepoPath)
+        return self._backend
+    @backend.setter
+    def backend(self,backend:GitBackend):
+        self._backend=backend
+        if self._commitIndex is not None:
+            self._commitIndex.close()
+            self._commitIndex=None
+
+    @property
+    def objectStore(self)->GitObjectStore:
+        """
+        The native (no subprocess) object store reader for this repo
+        """
+        return getObjectStore(self.localRepoPath)
+
+    @property
+    def commitGraph(self)->CommitGraph:
+        """
+        The commit DAG for this repo, for fast ancestry questions
+        (isAncestor, mergeBase, aheadBehind, reachable)
+        """
+        return getCommitGraph(self.localRepoPath)
+
+    def close(self)->None:
+        """
+        Close what this GitRepo opened itself (its commitIndex)
+
+        The objectReader, objectStore, commitGraph and default backend
+        are shared by everything using the same repo, so are left open
+        for the others (see closeObjectReaders() for shutting down the
+        long-lived git processes).  A backend passed in is left for
+        whoever created it to close.
+        """
+        if self._commitIndex is not None:
+            self._commitIndex.close()
+            self._commitIndex=None
+
+    @property
+    def commitIndex(self)->CommitIndex:
+        """
+        The persistent on-disk commit index for this repo
+        """
+        if self._commitIndex is None:
+            self._commitIndex=CommitIndex(self.localRepoPath,self._backend)
+        return self._commitIndex
+
     @property
     def allCommits(self)->GitCommits:
         """
         Return a list of all connits for this project
+
+        (this uses, and so creates/updates, the on-disk commitIndex)
         """
-        return self.gitLog()
+        return self.commitIndex.commits()
+
+    def pagedCommits(self,
+        revs:typing.Iterable[str]=('HEAD',),
+        pageSize:int=DEFAULT_PAGE_SIZE
+        )->PagedGitCommits:
+        """
+        All commits for this project, but only fetched from
+        git a page at a time as they are looked at
+        (for showing a screenful of history at once)
+        """
+        return PagedGitCommits(self.localRepoPath,revs,pageSize=pageSize,
+            backend=self._backend)
 
     @property
     def differencesFromMaster(self):
@@ -207,37 +322,76 @@ class GitRepo:
         return self.differencesFromBranch(self.UPSTREAM_BRANCH_NAME)
 
     def differencesFromBranch(self,
-        branchName:str
+        branchName:str,
+        limits:typing.Optional[DiffLimits]=None,
+        onFile:typing.Optional[typing.Callable[[GitDifferences],typing.Any]]=None # noqa: E501 # pylint: disable=line-too-long
         )->MultifileDiff:
         """
         Return all commits of the current branch
         that are not in a selected branch.
 
         To get these sorted by file, you can use getFileDiffs().
-        """
-        #from k_runner import osrun
-        import subprocess
-        cmd=['git','diff',branchName]
-        #result=osrun(cmd,workingDirectory=self.localRepoPath,shell=True)
-        out,_=subprocess.Popen(cmd,shell=True,cwd=str(self.localRepoPath),
-            stdout=subprocess.PIPE,stderr=subprocess.STDOUT).communicate()
-        result=out.decode('utf-8',errors='ignore')
-        if result.find('\nfatal: ')>=0:
-            # I'm no doctor, but...
-            # anything fatal is not good for your health
-            if branchName==self.UPSTREAM_BRANCH_NAME\
-                and (result.find("fatal: 'upstream' does not appear to be a git repository")>=0
-                     or result.find("unknown revision or path not in the working tree")):
-                msg="""upstream repositry is not set.  Either:
-                    a) in python gitRepo.upstream="https://github.com/REPO_MAINTAINER/REPO.git"
-                    b) or run:
-                        git remote add upstream https://github.com/REPO_MAINTAINER/REPO.git
-                        git fetch upstream
-                    """
-                raise GitException(msg)
-            raise GitException(result)
+
+        :limits: leave out files that are binary, generated, too big,
+            etc (they show up as stubs with only their sizes)
+        :onFile: called with each file's differences as soon as git
+            has produced it (while the rest of the diff is still coming)
+        """
+        try:
+            if limits is not None:
+                return limitedDiff(self.repoPath,['diff'],[branchName],
+                    limits,onFile=onFile,backend=self._backend)
+            if onFile is not None:
+                return MultifileDiff(notifyFileDiffs(
+                    self.backend.stream(['diff',branchName]),onFile))
+            result=self.backend.diffBytes([branchName])
+        except GitException as e:
+            err=self._branchDiffError(branchName,e)
+            if err is e:
+                raise
+            raise err from e
         return MultifileDiff(result)
 
+    def iterDifferencesFromBranch(self,
+        branchName:str
+        )->typing.Iterator[GitDifferences]:
+        """
+        Stream the differences of the current branch from a selected
+        branch, a file at a time, as git produces them
+
+        Only one file is held at a time, so this is the way to go
+        for showing the first files of a very big diff straight away.
+        """
+        try:
+            yield from iterFileDiffs(self.backend.stream(['diff',branchName]))
+        except GitException as e:
+            err=self._branchDiffError(branchName,e)
+            if err is e:
+                raise
+            raise err from e
+
+    def _branchDiffError(self,
+        branchName:str,
+        e:GitException
+        )->GitException:
+        """
+        Explain a failed diff against a branch
+        """
+        # I'm no doctor, but...
+        # anything fatal is not good for your health
+        err=str(e)
+        if branchName==self.UPSTREAM_BRANCH_NAME\
+            and (err.find("fatal: 'upstream' does not appear to be a git repository")>=0
+                 or err.find("unknown revision or path not in the working tree")>=0):
+            msg="""upstream repositry is not set.  Either:
+                a) in python gitRepo.upstream="https://github.com/REPO_MAINTAINER/REPO.git"
+                b) or run:
+                    git remote add upstream https://github.com/REPO_MAINTAINER/REPO.git
+                    git fetch upstream
+                """
+            return GitException(msg)
+        return e
+
     def commitsForLine(self,
         repoFilename:FileUrlCompatible,
         startLine:int,
@@ -247,10 +401,30 @@ class GitRepo:
         """
         Get all commits that affect a particular line
         """
-        return gitCommitsForLine(
-            self.localRepoPath,repoFilename,startLine,endLine,offset)
+        return gitCommitsForLine(self.localRepoPath,
+            repoFilename,startLine,endLine,offset,self._backend)
     gitCommitsForLine=commitsForLine
 
+    def commitsForLines(self,
+        ranges:typing.Iterable[LineRange],
+        rev:str='HEAD',
+        workers:typing.Optional[int]=None
+        )->typing.List[GitCommits]:
+        """
+        Get all commits that affect each of many line ranges
+        (several git processes at a time)
+
+        Ranges in different files share a "git log", while ranges in
+        the same file get one each.  See gitCommitsForLineRanges().
+
+        :ranges: [(repoFilename,startLine,endLine)]
+        :workers: how many git processes to run at once
+        :return: a GitCommits for each range, in the same order
+        """
+        return gitCommitsForLineRanges(
+            self.localRepoPath,ranges,rev,workers,self._backend)
+    gitCommitsForLines=commitsForLines
+
     def commitsForFunction(self,
         repoFilename:FileUrlCompatible,functionName:str
         )->GitCommits:
@@ -258,9 +432,26 @@ class GitRepo:
         Get all commits that affect a particular function
         """
         return gitCommitsForFunction(
-            self.localRepoPath,repoFilename,functionName)
+            self.localRepoPath,repoFilename,functionName,self._backend)
     gitCommitsForFunction=commitsForFunction
 
+    def commitsForFunctions(self,
+        repoFilename:FileUrlCompatible,
+        functionNames:typing.Iterable[str],
+        workers:typing.Optional[int]=None,
+        cancel:typing.Optional[typing.Callable[[],bool]]=None,
+        onResult:typing.Optional[typing.Callable[[str,GitCommits],None]]=None
+        )->typing.Dict[str,GitCommits]:
+        """
+        Get all commits that affect each of several functions,
+        running the lookups in parallel
+
+        :return: {functionName:GitCommits}
+        """
+        return gitCommitsForFunctions(self.localRepoPath,repoFilename,
+            functionNames,workers,cancel,onResult,self._backend)
+    gitCommitsForFunctions=commitsForFunctions
+
     def getPRs(self,
         author:typing.Optional[str]=None,
         limit:int=30,
@@ -281,7 +472,7 @@ class GitRepo:
         """
         Abandon all current changes
         """
-        gitAbandonChanges(self.localRepoPath)
+        gitAbandonChanges(self.localRepoPath,self._backend)
     abandonChanges=gitAbandonChanges
 
     def gitTags(self)->typing.List[str]:
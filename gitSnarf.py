@@ -23,7 +23,7 @@ class GitSnarf:
         """ """
         self.testFn:typing.Callable[[],bool]=testFn
         self.localRepoPath=localRepoPath
-        self._gitCommits:GitCommits=GitCommits()
+        self._gitCommits:typing.Optional[GitCommits]=None
 
     @property
     def gitCommits(self)->GitCommits:
@@ -0,0 +1,710 @@
+"""
+Pure-python reader for the git object store
+
+Reads loose objects and packfiles directly, without running git at
+all.  Pack indexes and packs are mmapped, objects are located by a
+binary search of the index fan-out table, and OFS/REF deltas are
+resolved with the help of a small cache of delta bases.
+
+Anything it cannot handle (short hashes, exotic revision syntax,
+reftable repos, etc) falls back to "git cat-file".
+"""
+import typing
+import os
+import re
+import mmap
+import zlib
+import heapq
+import struct
+import threading
+import collections
+from paths import FilePathCompatible
+from gitTools.catFile import GitObject,GitObjectReader,getObjectReader
+if typing.TYPE_CHECKING:
+    from gitTools.gitCommit import GitCommit
+
+
+OBJECT_TYPES={1:'commit',2:'tree',3:'blob',4:'tag'}
+OFS_DELTA=6
+REF_DELTA=7
+PACK_IDX_V2_MAGIC=b'\xfftOc'
+
+
+class _Unsupported(NotImplementedError):
+    """
+    Something the native reader does not handle
+    (means "ask git instead")
+    """
+
+
+def applyDelta(base:bytes,delta:bytes)->bytes:
+    """
+    Apply a git packfile delta to its base object
+    """
+    pos=0
+    def varint()->int:
+        nonlocal pos
+        value=0
+        shift=0
+        while True:
+            c=delta[pos]
+            pos+=1
+            value|=(c&0x7f)<<shift
+            shift+=7
+            if not c&0x80:
+                return value
+    if varint()!=len(base):
+        raise ValueError('Delta does not match its base object')
+    size=varint()
+    out=bytearray()
+    while pos<len(delta):
+        op=delta[pos]
+        pos+=1
+        if op&0x80:
+            # copy from base
+            copyOffset=0
+            copySize=0
+            for i in range(4):
+                if op&(1<<i):
+                    copyOffset|=delta[pos]<<(8*i)
+                    pos+=1
+            for i in range(3):
+                if op&(0x10<<i):
+                    copySize|=delta[pos]<<(8*i)
+                    pos+=1
+            if copySize==0:
+                copySize=0x10000
+            out+=base[copyOffset:copyOffset+copySize]
+        elif op:
+            # insert new data
+            out+=delta[pos:pos+op]
+            pos+=op
+        else:
+            raise ValueError('Invalid delta opcode 0')
+    if len(out)!=size:
+        raise ValueError('Delta produced the wrong size object')
+    return bytes(out)
+
+
+class _PackFile:
+    """
+    A single mmapped .idx/.pack pair
+    """
+
+    def __init__(self,idxFilename:str,hashLen:int=20):
+        self.idxFilename=idxFilename
+        self.packFilename=idxFilename[:-4]+'.pack'
+        self.hashLen=hashLen
+        with open(idxFilename,'rb') as f:
+            self._idx=mmap.mmap(f.fileno(),0,access=mmap.ACCESS_READ)
+        with open(self.packFilename,'rb') as f:
+            self._pack=mmap.mmap(f.fileno(),0,access=mmap.ACCESS_READ)
+        if self._idx[0:4]==PACK_IDX_V2_MAGIC:
+            self.version=struct.unpack('>I',self._idx[4:8])[0]
+            if self.version!=2:
+                raise _Unsupported(f'pack index version {self.version}')
+            fanoutStart=8
+        else:
+            self.version=1
+            fanoutStart=0
+        self._fanout=struct.unpack('>256I',
+            self._idx[fanoutStart:fanoutStart+1024])
+        self.count=self._fanout[255]
+        self._namesStart=fanoutStart+1024
+        self._offsetsStart=self._namesStart+self.count*(hashLen+4)
+        self._largeOffsetsStart=self._offsetsStart+self.count*4
+
+    def close(self)->None:
+        """
+        Release the mmaps
+        """
+        self._idx.close()
+        self._pack.close()
+
+    def _name(self,i:int)->bytes:
+        if self.version==1:
+            start=self._namesStart+i*(self.hashLen+4)+4
+        else:
+            start=self._namesStart+i*self.hashLen
+        return self._idx[start:start+self.hashLen]
+
+    def _offset(self,i:int)->int:
+        if self.version==1:
+            start=self._namesStart+i*(self.hashLen+4)
+            return struct.unpack('>I',self._idx[start:start+4])[0]
+        start=self._offsetsStart+i*4
+        offset=struct.unpack('>I',self._idx[start:start+4])[0]
+        if offset&0x80000000:
+            start=self._largeOffsetsStart+(offset&0x7fffffff)*8
+            offset=struct.unpack('>Q',self._idx[start:start+8])[0]
+        return offset
+
+    def find(self,binsha:bytes)->typing.Optional[int]:
+        """
+        Find where an object lives in the pack
+
+        :return: offset into the pack, or None if it is not here
+        """
+        first=binsha[0]
+        lo=self._fanout[first-1] if first else 0
+        hi=self._fanout[first]
+        while lo<hi:
+            mid=(lo+hi)//2
+            name=self._name(mid)
+            if name<binsha:
+                lo=mid+1
+            elif name>binsha:
+                hi=mid
+            else:
+                return self._offset(mid)
+        return None
+
+    def header(self,
+        offset:int
+        )->typing.Tuple[int,int,int,typing.Union[None,int,bytes]]:
+        """
+        Read the header of the object at an offset
+
+        :return: (type,size,dataOffset,base)
+            where base is the base offset for an OFS_DELTA,
+            the base hash for a REF_DELTA, otherwise None
+        """
+        pack=self._pack
+        c=pack[offset]
+        pos=offset+1
+        objType=(c>>4)&7
+        size=c&0x0f
+        shift=4
+        while c&0x80:
+            c=pack[pos]
+            pos+=1
+            size|=(c&0x7f)<<shift
+            shift+=7
+        base:typing.Union[None,int,bytes]=None
+        if objType==OFS_DELTA:
+            c=pack[pos]
+            pos+=1
+            baseOffset=c&0x7f
+            while c&0x80:
+                c=pack[pos]
+                pos+=1
+                baseOffset=((baseOffset+1)<<7)|(c&0x7f)
+            base=offset-baseOffset
+        elif objType==REF_DELTA:
+            base=pack[pos:pos+self.hashLen]
+            pos+=self.hashLen
+        return objType,size,pos,base
+
+    def inflate(self,pos:int,size:int)->bytes:
+        """
+        Inflate zlib data starting at pos
+        """
+        decompressor=zlib.decompressobj()
+        chunkSize=max(4096,size+64)
+        out=[]
+        while not decompressor.eof:
+            chunk=self._pack[pos:pos+chunkSize]
+            if not chunk:
+                raise ValueError(f'Truncated pack "{self.packFilename}"')
+            out.append(decompressor.decompress(chunk))
+            pos+=chunkSize
+        data=b''.join(out)
+        if len(data)!=size:
+            raise ValueError(f'Corrupt object in "{self.packFilename}"')
+        return data
+
+
+class GitObjectStore:
+    """
+    Reads objects straight out of a repo's .git directory
+
+    Has the same read/readMany/info/infoMany interface as
+    GitObjectReader, which it falls back on when needed.
+    """
+
+    # max bytes of resolved delta bases to keep around
+    DELTA_CACHE_SIZE=32*1024*1024
+
+    _REV_RE=re.compile(
+        r'^(?P<base>[^:^~]+)(?P<suffix>(\^\{\w*\}|\^\d*|~\d*)*)(:(?P<path>.*))?$') # noqa: E501 # pylint: disable=line-too-long
+    _SUFFIX_RE=re.compile(r'\^\{(\w*)\}|\^(\d*)|~(\d*)')
+
+    def __init__(self,localRepoPath:FilePathCompatible='.'):
+        """ """
+        from gitTools.commits import findRepoPath,findGitDir
+        repoPath=findRepoPath(localRepoPath)
+        gitDir=findGitDir(localRepoPath)
+        worktreeGitDir=findGitDir(localRepoPath,common=False)
+        if repoPath is None or gitDir is None or worktreeGitDir is None:
+            raise FileNotFoundError(f'"{localRepoPath}" is not a git repo')
+        self.repoPath:str=repoPath
+        self.gitDir:str=gitDir
+        self.worktreeGitDir:str=worktreeGitDir
+        self.objectsDirs:typing.List[str]=[os.path.join(gitDir,'objects')]
+        self._readAlternates(self.objectsDirs[0])
+        self.hashLen=32 if self._objectFormat()=='sha256' else 20
+        self._lock=threading.RLock()
+        self._packs:typing.Dict[str,_PackFile]={}
+        self._packDirMtimes:typing.Dict[str,float]={}
+        self._deltaCache:typing.OrderedDict[
+            typing.Tuple[str,int],typing.Tuple[str,bytes]
+            ]=collections.OrderedDict()
+        self._deltaCacheSize=0
+        self._packedRefs:typing.Dict[str,str]={}
+        self._packedRefsMtime:typing.Optional[float]=None
+        self._fallback:typing.Optional[GitObjectReader]=None
+
+    def _readAlternates(self,objectsDir:str)->None:
+        """
+        Add any alternate object directories
+        """
+        filename=os.path.join(objectsDir,'info','alternates')
+        if not os.path.isfile(filename):
+            return
+        with open(filename,'r',encoding='utf-8',errors='ignore') as f:
+            for line in f:
+                line=line.strip()
+                if not line or line[0]=='#':
+                    continue
+                alternate=os.path.normpath(os.path.join(objectsDir,line))
+                if alternate not in self.objectsDirs:
+                    self.objectsDirs.append(alternate)
+                    self._readAlternates(alternate)
+
+    def _objectFormat(self)->str:
+        """
+        Determine the hash algorithm used by this repo
+        """
+        from gitTools.gitConfig import getConfig
+        return getConfig(self.repoPath).get(
+            'extensions.objectformat','sha1').lower()
+
+    @property
+    def fallback(self)->GitObjectReader:
+        """
+        The "git cat-file" reader used for whatever we can't do natively
+        """
+        if self._fallback is None:
+            self._fallback=getObjectReader(self.repoPath)
+        return self._fallback
+
+    def close(self)->None:
+        """
+        Release all mmapped packs
+        """
+        with self._lock:
+            for pack in self._packs.values():
+                pack.close()
+            self._packs={}
+            self._packDirMtimes={}
+            self._deltaCache.clear()
+            self._deltaCacheSize=0
+
+    def _scanPacks(self)->bool:
+        """
+        Pick up any packs that have appeared since last time
+
+        :return: whether anything changed
+        """
+        changed=False
+        for objectsDir in self.objectsDirs:
+            packDir=os.path.join(objectsDir,'pack')
+            try:
+                mtime=os.stat(packDir).st_mtime
+            except OSError:
+                continue
+            if self._packDirMtimes.get(packDir)==mtime:
+                continue
+            self._packDirMtimes[packDir]=mtime
+            for filename in os.listdir(packDir):
+                if not filename.endswith('.idx'):
+                    continue
+                filename=os.path.join(packDir,filename)
+                if filename in self._packs:
+                    continue
+                try:
+                    self._packs[filename]=_PackFile(filename,self.hashLen)
+                    changed=True
+                except (OSError,ValueError,_Unsupported):
+                    pass
+        return changed
+
+    def _cacheGet(self,
+        key:typing.Tuple[str,int]
+        )->typing.Optional[typing.Tuple[str,bytes]]:
+        value=self._deltaCache.get(key)
+        if value is not None:
+            self._deltaCache.move_to_end(key)
+        return value
+
+    def _cachePut(self,
+        key:typing.Tuple[str,int],
+        value:typing.Tuple[str,bytes]
+        )->None:
+        size=len(value[1])
+        if size>self.DELTA_CACHE_SIZE//4 or key in self._deltaCache:
+            return
+        self._deltaCache[key]=value
+        self._deltaCacheSize+=size
+        while self._deltaCacheSize>self.DELTA_CACHE_SIZE:
+            _,old=self._deltaCache.popitem(last=False)
+            self._deltaCacheSize-=len(old[1])
+
+    def _readPacked(self,
+        pack:_PackFile,
+        offset:int
+        )->typing.Tuple[str,bytes]:
+        """
+        Read an object out of a pack, resolving any delta chain
+        """
+        chain:typing.List[typing.Tuple[_PackFile,int,int,int]]=[]
+        while True:
+            cached=self._cacheGet((pack.packFilename,offset))
+            if cached is not None:
+                base=cached
+                break
+            objType,size,pos,baseRef=pack.header(offset)
+            if objType==OFS_DELTA:
+                chain.append((pack,offset,pos,size))
+                offset=baseRef # type: ignore
+                continue
+            if objType==REF_DELTA:
+                chain.append((pack,offset,pos,size))
+                found=self._readRaw(baseRef) # type: ignore
+                if found is None:
+                    raise KeyError(f'Missing delta base {baseRef.hex()}') # type: ignore # noqa: E501 # pylint: disable=line-too-long
+                base=found
+                break
+            if objType not in OBJECT_TYPES:
+                raise ValueError(f'Unknown object type {objType}')
+            base=(OBJECT_TYPES[objType],pack.inflate(pos,size))
+            if chain:
+                self._cachePut((pack.packFilename,offset),base)
+            break
+        for deltaPack,deltaOffset,pos,size in reversed(chain):
+            base=(base[0],applyDelta(base[1],deltaPack.inflate(pos,size)))
+            self._cachePut((deltaPack.packFilename,deltaOffset),base)
+        return base
+
+    def _readLoose(self,hexsha:str)->typing.Optional[typing.Tuple[str,bytes]]:
+        for objectsDir in self.objectsDirs:
+            filename=os.path.join(objectsDir,hexsha[:2],hexsha[2:])
+            try:
+                with open(filename,'rb') as f:
+                    raw=zlib.decompress(f.read())
+            except FileNotFoundError:
+                continue
+            header,_,data=raw.partition(b'\0')
+            objType=header.split(b' ',1)[0].decode('ascii')
+            return objType,data
+        return None
+
+    def _readRaw(self,binsha:bytes)->typing.Optional[typing.Tuple[str,bytes]]:
+        """
+        Read an object by binary hash
+
+        :return: (type,data) or None if it does not exist
+        """
+        with self._lock:
+            for attempt in range(2):
+                if attempt==0:
+                    self._scanPacks()
+                elif not self._scanPacks():
+                    break
+                for pack in self._packs.values():
+                    offset=pack.find(binsha)
+                    if offset is not None:
+                        return self._readPacked(pack,offset)
+                found=self._readLoose(binsha.hex())
+                if found is not None:
+                    return found
+        return None
+
+    @property
+    def packedRefs(self)->typing.Dict[str,str]:
+        """
+        The contents of the packed-refs file {refname:hash}
+        """
+        filename=os.path.join(self.gitDir,'packed-refs')
+        try:
+            mtime=os.stat(filename).st_mtime
+        except OSError:
+            self._packedRefs={}
+            self._packedRefsMtime=None
+            return self._packedRefs
+        if mtime!=self._packedRefsMtime:
+            packedRefs:typing.Dict[str,str]={}
+            with open(filename,'r',encoding='utf-8',errors='ignore') as f:
+                for line in f:
+                    if line[0] in '#^':
+                        continue
+                    hashRef=line.split()
+                    if len(hashRef)==2:
+                        packedRefs[hashRef[1]]=hashRef[0]
+            self._packedRefs=packedRefs
+            self._packedRefsMtime=mtime
+        return self._packedRefs
+
+    def _readRef(self,refname:str,depth:int=0)->typing.Optional[str]:
+        """
+        Read a single fully-qualified ref, following symbolic refs
+        """
+        if os.path.exists(os.path.join(self.gitDir,'reftable')):
+            raise _Unsupported('reftable')
+        if refname.startswith('refs/') and not refname.startswith(
+            ('refs/bisect/','refs/worktree/','refs/rewritten/')):
+            gitDir=self.gitDir
+        else:
+            gitDir=self.worktreeGitDir
+        try:
+            with open(os.path.join(gitDir,*refname.split('/')),'r',
+                encoding='utf-8',errors='ignore') as f:
+                content=f.readline().strip()
+        except (FileNotFoundError,IsADirectoryError,NotADirectoryError):
+            content=self.packedRefs.get(refname,'')
+        if not content:
+            return None
+        if content.startswith('ref:'):
+            if depth>=5:
+                raise _Unsupported(f'Symbolic ref loop at "{refname}"')
+            return self._readRef(content[4:].strip(),depth+1)
+        return content.split()[0]
+
+    def resolveRef(self,name:str)->typing.Optional[str]:
+        """
+        Resolve a ref name (eg "HEAD", "master", "v1.0", "origin/master")
+        the same way git does
+
+        :return: a hash or None if there is no such ref
+        """
+        candidates=[]
+        if name.startswith('refs/') or re.match(r'^[A-Z_]+$',name):
+            candidates.append(name)
+        candidates.extend((
+            f'refs/{name}',
+            f'refs/tags/{name}',
+            f'refs/heads/{name}',
+            f'refs/remotes/{name}',
+            f'refs/remotes/{name}/HEAD'))
+        for refname in candidates:
+            value=self._readRef(refname)
+            if value is not None:
+                return value
+        return None
+
+    def listRefs(self,prefix:str='refs/')->typing.Dict[str,str]:
+        """
+        List all refs starting with a prefix {refname:hash}
+        """
+        if os.path.exists(os.path.join(self.gitDir,'reftable')):
+            raise _Unsupported('reftable')
+        ret={refname:value
+            for refname,value in self.packedRefs.items()
+            if refname.startswith(prefix)}
+        refsDir=os.path.join(self.gitDir,*prefix.rstrip('/').split('/'))
+        for path,_,filenames in os.walk(refsDir):
+            for filename in filenames:
+                refname='/'.join(os.path.relpath(
+                    os.path.join(path,filename),self.gitDir).split(os.sep))
+                value=self._readRef(refname)
+                if value is not None:
+                    ret[refname]=value
+        return ret
+
+    def _readHex(self,hexsha:str)->typing.Tuple[str,bytes]:
+        found=self._readRaw(bytes.fromhex(hexsha))
+        if found is None:
+            raise _Unsupported(f'Object {hexsha} not found')
+        return found
+
+    def _peel(self,hexsha:str,toType:typing.Optional[str])->str:
+        """
+        Peel tags (and commits to trees) until we get
+        an object of a given type
+
+        :toType: if None, peel until it is no longer a tag
+        """
+        while True:
+            objType,data=self._readHex(hexsha)
+            if objType==toType or (toType is None and objType!='tag'):
+                return hexsha
+            if objType=='tag' or (objType=='commit' and toType=='tree'):
+                hexsha=data.split(b'\n',1)[0].split(b' ',1)[1].decode('ascii') # noqa: E501 # pylint: disable=line-too-long
+            else:
+                raise _Unsupported(f'Cannot peel {objType} to {toType}')
+
+    def _parents(self,hexsha:str)->typing.List[str]:
+        _,data=self._readHex(self._peel(hexsha,'commit'))
+        headers=data.split(b'\n\n',1)[0]
+        return [line[7:].decode('ascii')
+            for line in headers.split(b'\n') if line.startswith(b'parent ')]
+
+    def resolve(self,name:str)->str:
+        """
+        Natively resolve a subset of the git revision syntax, eg
+            HEAD, a full hash, a ref name, any of those followed by
+            ^ ^n ~n ^{} ^{tree} ^{commit}, and optionally :path
+
+        :return: the object hash
+        :raises _Unsupported: if git itself needs to be asked
+        """
+        match=self._REV_RE.match(name)
+        if match is None:
+            raise _Unsupported(name)
+        base=match.group('base')
+        if len(base)==self.hashLen*2 and re.match(r'^[0-9a-fA-F]+$',base):
+            hexsha=base.lower()
+        else:
+            found=self.resolveRef(base)
+            if found is None:
+                raise _Unsupported(name)
+            hexsha=found
+        for suffix in self._SUFFIX_RE.finditer(match.group('suffix')):
+            hexsha=self._applySuffix(hexsha,suffix.group(0))
+        path=match.group('path')
+        if path is not None:
+            hexsha=self._peel(hexsha,'tree')
+            for part in path.strip('/').split('/'):
+                if not part:
+                    continue
+                entries=self.treeEntries(hexsha)
+                if part not in entries:
+                    raise _Unsupported(name)
+                hexsha=entries[part][1]
+        return hexsha
+
+    def _applySuffix(self,hexsha:str,suffix:str)->str:
+        """
+        Apply a single ^ ^n ~n or ^{type} revision suffix
+        """
+        if suffix.startswith('^{'):
+            peelTo=suffix[2:-1]
+            if peelTo and peelTo not in ('commit','tree','blob','tag'):
+                raise _Unsupported(suffix)
+            return self._peel(hexsha,peelTo or None)
+        if suffix[0]=='^':
+            parentNum=int(suffix[1:] or 1)
+            if parentNum==0:
+                return self._peel(hexsha,'commit')
+            parents=self._parents(hexsha)
+            if parentNum>len(parents):
+                raise _Unsupported(suffix)
+            return parents[parentNum-1]
+        for _ in range(int(suffix[1:] or 1)):
+            parents=self._parents(hexsha)
+            if not parents:
+                raise _Unsupported(suffix)
+            hexsha=parents[0]
+        return hexsha
+
+    def treeEntries(self,treeHash:str)->typing.Dict[str,typing.Tuple[str,str]]:
+        """
+        Get {name:(mode,hash)} for a tree object
+        """
+        objType,data=self._readHex(treeHash)
+        if objType!='tree':
+            raise _Unsupported(f'{treeHash} is not a tree')
+        ret:typing.Dict[str,typing.Tuple[str,str]]={}
+        pos=0
+        while pos<len(data):
+            nul=data.index(b'\0',pos)
+            mode,filename=data[pos:nul].split(b' ',1)
+            pos=nul+1+self.hashLen
+            ret[filename.decode('utf-8',errors='replace')]=(
+                mode.decode('ascii'),data[nul+1:pos].hex())
+        return ret
+
+    def read(self,name:str)->typing.Optional[GitObject]:
+        """
+        Read a single object (eg "HEAD", a hash, or "HEAD:README.md")
+
+        :return: None if the object does not exist
+        """
+        try:
+            hexsha=self.resolve(name)
+            objType,data=self._readHex(hexsha)
+            return GitObject(hexsha,objType,len(data),data)
+        except (_Unsupported,ValueError,KeyError,IndexError,OSError,zlib.error): # noqa: E501 # pylint: disable=line-too-long
+            return self.fallback.read(name)
+
+    def readMany(self,
+        names:typing.Iterable[str]
+        )->typing.Generator[typing.Optional[GitObject],None,None]:
+        """
+        Read many objects, streaming back the results in order
+
+        (missing objects are returned as None)
+        """
+        for name in names:
+            yield self.read(name)
+
+    def info(self,name:str)->typing.Optional[GitObject]:
+        """
+        Get the hash, type, and size of an object
+        """
+        obj=self.read(name)
+        if obj is not None:
+            obj.data=None
+        return obj
+
+    def infoMany(self,
+        names:typing.Iterable[str]
+        )->typing.Generator[typing.Optional[GitObject],None,None]:
+        """
+        Get the hash, type, and size of many objects
+        """
+        for name in names:
+            yield self.info(name)
+
+    def exists(self,name:str)->bool:
+        """
+        Does an object exist?
+        """
+        return self.read(name) is not None
+
+    def iterCommits(self,
+        tips:typing.Iterable[str]=('HEAD',)
+        )->typing.Generator["GitCommit",None,None]:
+        """
+        Walk the history from a set of tips, newest first
+        (similar to "git log", but without running git)
+        """
+        from gitTools.gitCommit import GitCommit
+        heap:typing.List[typing.Tuple[float,str,GitCommit]]=[]
+        seen:typing.Set[str]=set()
+        def push(name:str):
+            obj=self.read(f'{name}^{{commit}}')
+            if obj is None or obj.hash in seen:
+                return
+            seen.add(obj.hash)
+            commit=GitCommit(obj.hash,localRepoPath=self.repoPath)
+            commit.assignFromObject(obj.data) # type: ignore
+            heapq.heappush(heap,(-commit.timestamp,obj.hash,commit))
+        for tip in tips:
+            push(tip)
+        while heap:
+            _,_,commit=heapq.heappop(heap)
+            yield commit
+            for parent in commit.parents:
+                push(parent)
+
+
+_objectStores:typing.Dict[str,GitObjectStore]={}
+_objectStoresLock=threading.Lock()
+
+
+def getObjectStore(localRepoPath:FilePathCompatible='.')->GitObjectStore:
+    """
+    Get the shared object store for a repo
+    """
+    from gitTools.commits import findRepoPath
+    repoPath=findRepoPath(localRepoPath)
+    if repoPath is None:
+        raise FileNotFoundError(f'"{localRepoPath}" is not a git repo')
+    repoPath=os.path.normcase(repoPath)
+    with _objectStoresLock:
+        store=_objectStores.get(repoPath)
+        if store is None:
+            store=GitObjectStore(repoPath)
+            _objectStores[repoPath]=store
+    return store
@@ -0,0 +1,215 @@
+"""
+A GitCommits that only fetches the history a page at a time
+
+For user interfaces that show a screenful of commits at once, there is
+no need to pay for loading the entire log.  The length comes from
+"git rev-list --count", and the commits themselves are fetched in
+fixed-size pages ("git log --skip --max-count") as they are asked for.
+A small LRU of pages keeps scrolling back and forth from re-running git.
+
+The tips are resolved to hashes up front, so commits arriving in the
+meantime do not shift everything along by one.
+"""
+import typing
+import collections
+from paths import FilePathCompatible
+from gitTools.gitCommit import GitCommit
+from gitTools.gitCommits import GitCommits
+from gitTools.backends import GitBackend,getBackend
+
+
+DEFAULT_PAGE_SIZE=50
+DEFAULT_CACHE_PAGES=16
+
+
+class _PagedView(typing.Sequence):
+    """
+    The commits of a PagedGitCommits, as a sequence
+    (in GitCommits order, meaning oldest first)
+    """
+
+    def __init__(self,commits:"PagedGitCommits"):
+        self.commits=commits
+
+    def __len__(self)->int:
+        return self.commits.count
+
+    def _value(self,commit:GitCommit)->typing.Any:
+        return commit
+
+    def __getitem__(self,idx): # type: ignore
+        count=self.commits.count
+        if isinstance(idx,slice):
+            return [self[i] for i in range(*idx.indices(count))]
+        if idx<0:
+            idx+=count
+        if idx<0 or idx>=count:
+            raise IndexError('index out of range')
+        return self._value(self.commits.newest(count-1-idx))
+
+    def __iter__(self)->typing.Iterator:
+        for commit in self.commits.iterOldest():
+            yield self._value(commit)
+
+
+class _PagedKeys(_PagedView):
+    """
+    The sort keys (timestamps) of a PagedGitCommits, as a sequence
+    """
+
+    def _value(self,commit:GitCommit)->typing.Any:
+        return commit.timestamp
+
+
+class PagedGitCommits(GitCommits):
+    """
+    A GitCommits that only fetches the history a page at a time
+
+    Like any GitCommits, index 0 is the oldest commit, so the most
+    recent page is at the end (eg, paged[-50:]).  page(0) also returns
+    the most recent page, as a user interface would want it.
+
+    NOTE: the order is git log's order (by commit date), which for a
+    history with rebased commits may not be strictly by author date.
+
+    Adding commits to it loads the whole history and turns it
+    into an ordinary GitCommits.
+    """
+
+    def __init__(self,
+        localRepoPath:FilePathCompatible='.',
+        revs:typing.Iterable[str]=('HEAD',),
+        params:typing.Iterable[str]=(),
+        paths:typing.Iterable[FilePathCompatible]=(),
+        pageSize:int=DEFAULT_PAGE_SIZE,
+        cachePages:int=DEFAULT_CACHE_PAGES,
+        backend:typing.Optional[GitBackend]=None):
+        """
+        :revs: where to walk the history from
+        :params: any other git log limiting parameters (eg, --author=bob)
+        :paths: only commits touching these paths
+        :pageSize: how many commits to fetch from git at once
+        :cachePages: how many pages to keep around
+        :backend: what runs git (default is the repo's getBackend())
+        """
+        GitCommits.__init__(self,repoPath=str(localRepoPath))
+        self._backend=backend
+        if pageSize<1:
+            raise ValueError('pageSize must be at least 1')
+        self.pageSize=pageSize
+        self.cachePages=max(1,cachePages)
+        self.params=list(params)
+        self.paths=[str(path) for path in paths]
+        self.pinned=self._pin(list(revs) or ['HEAD'])
+        self._count:typing.Optional[int]=None
+        self._pages:typing.OrderedDict[int,typing.List[GitCommit]]=\
+            collections.OrderedDict()
+        self._commits=_PagedView(self)
+        self._keys=_PagedKeys(self)
+        self._hashes=None
+
+    @property
+    def backend(self)->GitBackend:
+        """
+        What performs the git operations
+        """
+        if self._backend is None:
+            return getBackend(str(self.repoPath))
+        return self._backend
+
+    def _pin(self,revs:typing.List[str])->typing.List[str]:
+        """
+        Resolve the revisions to hashes (including things like
+        "a..b" and "--all") so that the history is fixed from now on
+        """
+        result=self.backend.run(['rev-parse',*revs]).check()
+        return result.out.split()
+
+    def _pathArgs(self)->typing.List[str]:
+        if not self.paths:
+            return []
+        return ['--',*self.paths]
+
+    @property
+    def count(self)->int:
+        """
+        How many commits there are in total
+        """
+        if self._count is None:
+            args=['rev-list','--count',*self.params,*self.pinned,
+                *self._pathArgs()]
+            self._count=int(self.backend.run(args).check().out.strip() or 0)
+        return self._count
+
+    @property
+    def numPages(self)->int:
+        """
+        How many pages there are in total
+        """
+        return (self.count+self.pageSize-1)//self.pageSize
+
+    def page(self,pageNo:int)->typing.List[GitCommit]:
+        """
+        Get a page of commits, page 0 being the most recent ones
+
+        (the commits are in git log order, meaning newest first)
+        """
+        if pageNo<0:
+            pageNo+=self.numPages
+        if pageNo<0 or pageNo>=self.numPages:
+            raise IndexError('page out of range')
+        page=self._pages.get(pageNo)
+        if page is not None:
+            self._pages.move_to_end(pageNo)
+            return page
+        from gitTools.commits import iterGitLog
+        params=[*self.params,
+            f'--skip={pageNo*self.pageSize}',
+            f'--max-count={self.pageSize}',
+            *self.pinned,*self._pathArgs()]
+        page=list(iterGitLog(str(self.repoPath),params,backend=self.backend))
+        self._pages[pageNo]=page
+        while len(self._pages)>self.cachePages:
+            self._pages.popitem(last=False)
+        return page
+
+    def newest(self,idx:int)->GitCommit:
+        """
+        Get a commit counting back from the most recent one (which is 0)
+        """
+        pageNo,offset=divmod(idx,self.pageSize)
+        page=self.page(pageNo)
+        if offset>=len(page):
+            raise IndexError('index out of range')
+        return page[offset]
+
+    def iterNewest(self)->typing.Iterator[GitCommit]:
+        """
+        Stream every commit, most recent first
+
+        This is a single git log rather than one per page
+        (and does not fill the page cache).
+        """
+        from gitTools.commits import iterGitLog
+        return iterGitLog(str(self.repoPath),
+            [*self.params,*self.pinned,*self._pathArgs()],
+            backend=self.backend)
+
+    def iterOldest(self)->typing.Iterator[GitCommit]:
+        """
+        Stream every commit, oldest first
+        (this is the order that iterating a GitCommits uses)
+        """
+        from gitTools.commits import iterGitLog
+        return iterGitLog(str(self.repoPath),
+            [*self.params,'--reverse',*self.pinned,*self._pathArgs()],
+            backend=self.backend)
+
+    def refresh(self)->None:
+        """
+        Forget everything that has been fetched so far
+
+        (the tips stay pinned, so this only frees memory)
+        """
+        self._pages.clear()
+        self._count=None
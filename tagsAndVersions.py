@@ -6,7 +6,10 @@ from paths import URL,FilePathCompatible
 from k_runner.osrun import osrun
 from stringTools.versions import Version,VersionCompatible,asVersion
 from gitTools.gitCommit import GitCommit
-from gitTools.commits import findRepoPath,gitLog,findRepoInfo
+from gitTools.gitRemotes import githubUrl
+from gitTools.commits import findRepoPath,findRepoInfo
+from gitTools.objectStore import getObjectStore
+from gitTools.exceptions import GitException
 
 
 def gitTags(localRepoPath:FilePathCompatible='.')->typing.List[str]:
@@ -14,6 +17,12 @@ def gitTags(localRepoPath:FilePathCompatible='.')->typing.List[str]:
     List all the tags associated with a git repo
     """
     repoPath=findRepoPath(localRepoPath)
+    try:
+        refs=getObjectStore(repoPath).listRefs('refs/tags/') # type: ignore
+        return sorted(refname[10:] for refname in refs)
+    except (NotImplementedError,OSError):
+        # unable to read the refs directly (eg, a reftable repo)
+        pass
     cmd=['git','tag']
     result=osrun(cmd,workingDirectory=repoPath)
     return result.stdouterr.split('\n')
@@ -61,7 +70,16 @@ def gitTagToCommit(tag:str,localRepoPath:str='.')->GitCommit:
     """
     Get the latest checkout commit id for a particular tag
     """
-    return gitLog(localRepoPath,moreparams=tag)[0]
+    repoPath=findRepoPath(localRepoPath)
+    if repoPath is None:
+        raise FileNotFoundError(f'"{localRepoPath}" is not a git repo')
+    obj=getObjectStore(repoPath).read(f'{tag}^{{commit}}')
+    if obj is None:
+        raise GitException(f'Unknown tag "{tag}"')
+    commit=GitCommit(obj.hash,
+        githubUrl=githubUrl(repoPath),localRepoPath=repoPath)
+    commit.assignFromObject(obj.data) # type: ignore
+    return commit
 
 
 def viewChangesBetweenVersions(
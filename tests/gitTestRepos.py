@@ -0,0 +1,159 @@
+"""
+Helpers for building small git repos to test against
+"""
+import typing
+import os
+import sys
+import stat
+import subprocess
+
+
+# commit dates count up from here, a minute apart
+FIRST_COMMIT_TIME=1600000000
+
+
+def git(repoPath:str,*args:str,**kwargs)->str:
+    """
+    Run a git command in a repo and return its stdout
+    """
+    return gitBytes(repoPath,*args,**kwargs).decode('utf-8')
+
+
+def gitBytes(repoPath:str,*args:str,**kwargs)->bytes:
+    """
+    Run a git command in a repo and return its undecoded stdout
+    """
+    return subprocess.run(['git','-C',repoPath,
+        '-c','user.name=test','-c','user.email=test@test',*args],
+        capture_output=True,check=True,**kwargs).stdout
+
+
+def initRepo(repoPath:str,branch:str='main')->str:
+    """
+    Create an empty repo
+    """
+    os.makedirs(repoPath,exist_ok=True)
+    git(repoPath,'init','-q','-b',branch)
+    git(repoPath,'config','core.autocrlf','false')
+    return repoPath
+
+
+def writeFiles(
+    repoPath:str,
+    files:typing.Mapping[str,typing.Union[None,str,bytes]]
+    )->None:
+    """
+    Write (or, for None, delete) files in the worktree
+    """
+    for name,content in files.items():
+        filename=os.path.join(repoPath,name)
+        if content is None:
+            os.remove(filename)
+            continue
+        os.makedirs(os.path.dirname(filename),exist_ok=True)
+        if isinstance(content,str):
+            content=content.encode('utf-8')
+        with open(filename,'wb') as f:
+            f.write(content)
+
+
+def _nextDate(repoPath:str)->typing.Dict[str,str]:
+    """
+    An environment that dates a new commit a minute after the last one
+    """
+    count=int(git(repoPath,'rev-list','--all','--count'))
+    date=f'{FIRST_COMMIT_TIME+count*60} +0000'
+    return dict(os.environ,GIT_AUTHOR_DATE=date,GIT_COMMITTER_DATE=date)
+
+
+def commit(
+    repoPath:str,
+    message:str,
+    files:typing.Optional[typing.Mapping[str,typing.Union[None,str,bytes]]]=None # noqa: E501 # pylint: disable=line-too-long
+    )->str:
+    """
+    Commit everything in the worktree (after writing files),
+    a minute after the previous commit
+
+    :return: the new commit's hash
+    """
+    if files:
+        writeFiles(repoPath,files)
+    git(repoPath,'add','-A')
+    git(repoPath,'commit','-q','--allow-empty','-m',message,
+        env=_nextDate(repoPath))
+    return git(repoPath,'rev-parse','HEAD').strip()
+
+
+def merge(repoPath:str,branch:str,message:str='merge')->str:
+    """
+    Merge a branch into the current one (always making a merge commit)
+
+    :return: the merge commit's hash
+    """
+    git(repoPath,'merge','-q','--no-ff','-m',message,branch,
+        env=_nextDate(repoPath))
+    return git(repoPath,'rev-parse','HEAD').strip()
+
+
+def fakeGit(directory:str,script:str)->str:
+    """
+    Make a stand-in "git" executable that runs a python script
+    (which gets the git arguments in sys.argv[1:])
+
+    :return: its filename
+    """
+    filename=os.path.join(directory,'git')
+    with open(filename,'w',encoding='utf-8') as f:
+        f.write(f'#!{sys.executable}\n{script}')
+    os.chmod(filename,os.stat(filename).st_mode|stat.S_IXUSR)
+    return filename
+
+
+def trickyDiffRepo(repoPath:str)->str:
+    """
+    A repo where the "tricky" branch (which is checked out) differs from
+    "main" in all the ways that make a diff hard to split up by file:
+    odd filenames (which git quotes), renames, deletes, binaries, mode
+    changes, empty files, CRLFs, file contents that look like diff
+    headers, several hunks per file, and one file much bigger than
+    the rest
+    """
+    initRepo(repoPath)
+    plain=[f'line {i}' for i in range(300)]
+    commit(repoPath,'base',{
+        'plain.txt':'\n'.join(plain)+'\n',
+        'old name.txt':'renamed\n'*50,
+        'gone.txt':'deleted\n',
+        'image.bin':bytes(range(256))*4,
+        'script.sh':'echo hi\n',
+        'crlf.txt':'one\r\ntwo\r\n'})
+    git(repoPath,'checkout','-q','-b','tricky')
+    for i in (5,150,290):
+        plain[i]=f'changed {i}'
+    writeFiles(repoPath,{
+        'plain.txt':'\n'.join(plain)+'\n',
+        'old name.txt':None,
+        'new name.txt':'renamed\n'*49+'and changed\n',
+        'gone.txt':None,
+        'image.bin':bytes(reversed(range(256)))*4,
+        'crlf.txt':'one\r\nthree\r\n',
+        'with space.txt':'spaced\n',
+        'a b/c b/d.txt':'nested " b/" names\n',
+        'ünïcödé.txt':'unicode\n',
+        'tab\tname.txt':'tab\n',
+        'empty.txt':'',
+        'looks like.diff':
+            'diff --git a/x b/x\n@@ -1 +1 @@\n-a\n+b\ndiff --git \n',
+        'big.txt':''.join(f'big line {i}\n' for i in range(20000))})
+    os.chmod(os.path.join(repoPath,'script.sh'),0o755)
+    commit(repoPath,'tricky')
+    return repoPath
+
+
+def chunked(data:bytes,size:int)->typing.Iterator[bytes]:
+    """
+    Split data up into chunks, as if it were streaming in
+    """
+    for start in range(0,len(data),size):
+        yield data[start:start+size]
@@ -0,0 +1,56 @@
+"""
+Tests for backends.py
+"""
+import os
+import threading
+import pytest
+from gitTools.backends import GitCliBackend
+from gitTools.exceptions import GitException
+from gitTestRepos import fakeGit
+
+
+NOISY_GIT='''import sys
+sys.stderr.write('warning: noisy\\n'*20000)
+sys.stderr.flush()
+sys.stdout.write('done\\n')
+sys.exit(int(sys.argv[1]))
+'''
+
+
+@pytest.fixture
+def noisyGit(tmp_path)->str:
+    """
+    A "git" that writes far more than a pipe buffer to stderr
+    (eg, a CRLF warning for every file in a big diff)
+    """
+    if os.name=='nt':
+        pytest.skip('needs an executable script')
+    return fakeGit(str(tmp_path),NOISY_GIT)
+
+
+def _streamInThread(backend:GitCliBackend,args):
+    """
+    Stream a command, giving up on it after a while
+    """
+    results=[]
+    def run()->None:
+        try:
+            results.append(b''.join(backend.stream(args)))
+        except GitException as e:
+            results.append(e)
+    thread=threading.Thread(target=run,daemon=True)
+    thread.start()
+    thread.join(60)
+    assert not thread.is_alive()
+    return results[0]
+
+
+def test_streamWithLotsOfStderr(tmp_path,noisyGit):
+    """
+    Lots of stderr does not stop stream() from finishing
+    """
+    backend=GitCliBackend(str(tmp_path),noisyGit)
+    assert _streamInThread(backend,['0'])==b'done\n'
+    err=_streamInThread(backend,['1'])
+    assert isinstance(err,GitException)
+    assert str(err).count('warning: noisy')==20000
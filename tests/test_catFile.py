@@ -0,0 +1,46 @@
+"""
+Tests for catFile.py
+"""
+import threading
+from gitTools.catFile import GitObjectReader
+from gitTestRepos import initRepo,commit,git
+
+
+def test_namesWithSpaces(tmp_path):
+    """
+    Missing objects whose names have spaces in them are just missing
+    """
+    repoPath=initRepo(str(tmp_path))
+    commit(repoPath,'add',{'my file.txt':'hello\n'})
+    reader=GitObjectReader(repoPath)
+    try:
+        assert reader.read('HEAD:my file.txt').data==b'hello\n'
+        assert reader.read('HEAD:no such file.txt') is None
+        assert reader.read('HEAD^:my file.txt') is None
+        assert reader.info('HEAD:a b c d.txt') is None
+    finally:
+        reader.close()
+
+
+def test_bigBatchOfLongNames(tmp_path):
+    """
+    A batch of long names (more than a pipe buffer of requests) for
+    big objects (more than a pipe buffer of replies) does not hang
+    """
+    repoPath=initRepo(str(tmp_path))
+    directory='/'.join(['a_rather_long_directory_name']*12)
+    files={f'{directory}/file{i}.txt':f'{i}\n'*40000 for i in range(4)}
+    commit(repoPath,'add',files)
+    names=[f'HEAD:{name}' for name in files]*64
+    results=[]
+    reader=GitObjectReader(repoPath)
+    thread=threading.Thread(
+        target=lambda:results.extend(reader.readMany(names)),daemon=True)
+    thread.start()
+    thread.join(60)
+    # (when it is stuck, so is closing it)
+    assert not thread.is_alive()
+    reader.close()
+    assert len(results)==len(names)
+    for name,obj in zip(names,results):
+        assert obj.data==git(repoPath,'cat-file','blob',name).encode()
@@ -0,0 +1,169 @@
+"""
+Tests for commitGraph.py, against what git itself says
+"""
+import typing
+import os
+import random
+import subprocess
+import pytest
+from gitTools.commitGraph import CommitGraph
+from gitTestRepos import FIRST_COMMIT_TIME,initRepo,git
+
+
+# how many commits in the random history
+DAG_SIZE=80
+
+
+def _commitTree(repoPath:str,parents:typing.Sequence[str],when:int)->str:
+    """
+    Make an (empty) commit with the given parents and date
+    """
+    date=f'{when} +0000'
+    env=dict(os.environ,GIT_AUTHOR_DATE=date,GIT_COMMITTER_DATE=date)
+    args=['commit-tree','-m',f'at {when}']
+    for parent in parents:
+        args.extend(('-p',parent))
+    emptyTree=git(repoPath,'hash-object','-t','tree','-w','/dev/null')
+    return git(repoPath,*args,emptyTree.strip(),env=env).strip()
+
+
+def _randomHistory(
+    repoPath:str,
+    count:int,
+    rand:random.Random,
+    hashes:typing.Optional[typing.List[str]]=None,
+    skewed:bool=False
+    )->typing.List[str]:
+    """
+    Build (or add to) a random history full of criss-cross merges
+    (so that pairs often have several merge bases)
+
+    Every commit gets a tag, so that they are all reachable.
+
+    :skewed: make some of the commit dates earlier than their parents'
+
+    :return: all of the commit hashes, oldest first
+    """
+    hashes=[] if hashes is None else list(hashes)
+    start=len(hashes)
+    for i in range(start,start+count):
+        parentCount=0 if i==0 or rand.random()<0.03 else \
+            rand.choice((1,1,1,2,2,3))
+        parents=rand.sample(hashes[-12:],min(parentCount,len(hashes[-12:])))
+        when=FIRST_COMMIT_TIME+i*60
+        if skewed and rand.random()<0.1:
+            when-=rand.randrange(60*60)
+        hashes.append(_commitTree(repoPath,parents,when))
+    git(repoPath,'update-ref','--stdin',input=''.join(
+        f'create refs/tags/c{i} {hashes[i]}\n'
+        for i in range(start,len(hashes))).encode('ascii'))
+    return hashes
+
+
+@pytest.fixture(params=['noGraphFile','graphFile','graphChainAndNewer'])
+def history(request,tmp_path)->typing.Tuple[str,typing.List[str]]:
+    """
+    A random history, with git's commit-graph file absent, covering
+    everything, or a split chain that is missing the newest commits
+
+    (the clocks are all right, since git's own walks limited by date
+    can give wrong answers when they aren't)
+    """
+    repoPath=initRepo(str(tmp_path))
+    rand=random.Random(request.param)
+    if request.param=='noGraphFile':
+        return repoPath,_randomHistory(repoPath,DAG_SIZE,rand)
+    if request.param=='graphFile':
+        hashes=_randomHistory(repoPath,DAG_SIZE,rand)
+        git(repoPath,'commit-graph','write','--reachable')
+        return repoPath,hashes
+    hashes=_randomHistory(repoPath,DAG_SIZE//2,rand)
+    git(repoPath,'commit-graph','write','--reachable','--split')
+    hashes=_randomHistory(repoPath,DAG_SIZE//4,rand,hashes)
+    git(repoPath,'commit-graph','write','--reachable','--split=no-merge')
+    assert len(os.listdir(os.path.join(repoPath,'.git','objects','info',
+        'commit-graphs')))==3 # (2 graphs and the chain file)
+    return repoPath,_randomHistory(repoPath,DAG_SIZE//4,rand,hashes)
+
+
+def _pairs(hashes:typing.List[str])->typing.List[typing.Tuple[str,str]]:
+    rand=random.Random(6)
+    return [tuple(rand.sample(hashes,2)) for _ in range(40)] # type: ignore
+
+
+def test_mergeBasesMatchGit(history):
+    repoPath,hashes=history
+    graph=CommitGraph(repoPath)
+    sawSeveral=False
+    for a,b in _pairs(hashes):
+        try:
+            expected=git(repoPath,'merge-base','--all',a,b).split()
+        except subprocess.CalledProcessError:
+            expected=[] # (no common ancestor is an error to git)
+        sawSeveral=sawSeveral or len(expected)>1
+        assert sorted(graph.mergeBases(a,b))==sorted(expected)
+        assert graph.mergeBase(a,b) in (expected or [None])
+    assert sawSeveral
+    graph.close()
+
+
+def test_aheadBehindMatchesGit(history):
+    repoPath,hashes=history
+    graph=CommitGraph(repoPath)
+    for a,b in _pairs(hashes):
+        expected=git(repoPath,'rev-list','--left-right','--count',f'{a}...{b}')
+        assert graph.aheadBehind(a,b)==tuple(int(n) for n in expected.split())
+        assert graph.isAncestor(a,b)==(expected.split()[0]=='0')
+    graph.close()
+
+
+def test_reachableMatchesGit(history):
+    repoPath,hashes=history
+    graph=CommitGraph(repoPath)
+    for a,b in _pairs(hashes)[:10]:
+        expected=git(repoPath,'rev-list',a,f'^{b}').split()
+        assert graph.reachable([a],[b])==set(expected)
+    graph.close()
+
+
+def _ancestors(parents:typing.Dict[str,typing.List[str]],tip:str)->typing.Set[str]: # noqa: E501 # pylint: disable=line-too-long
+    """
+    A commit and everything before it, the slow way
+    """
+    ret:typing.Set[str]=set()
+    todo=[tip]
+    while todo:
+        commit=todo.pop()
+        if commit not in ret:
+            ret.add(commit)
+            todo.extend(parents[commit])
+    return ret
+
+
+@pytest.mark.parametrize('graphFile',[False,True])
+def test_skewedClocks(tmp_path,graphFile):
+    """
+    Commits dated before their parents make no difference
+    (checked by brute force, rather than against git, which
+    can get them wrong)
+    """
+    repoPath=initRepo(str(tmp_path))
+    hashes=_randomHistory(repoPath,DAG_SIZE,random.Random(7),skewed=True)
+    if graphFile:
+        git(repoPath,'commit-graph','write','--reachable')
+    parents={}
+    for line in git(repoPath,'rev-list','--parents','--all').splitlines():
+        commit,*commitParents=line.split()
+        parents[commit]=commitParents
+    graph=CommitGraph(repoPath)
+    for a,b in _pairs(hashes):
+        ancestorsA=_ancestors(parents,a)
+        ancestorsB=_ancestors(parents,b)
+        assert graph.aheadBehind(a,b)== \
+            (len(ancestorsA-ancestorsB),len(ancestorsB-ancestorsA))
+        assert graph.reachable([a],[b])==ancestorsA-ancestorsB
+        common=ancestorsA&ancestorsB
+        best={c for c in common if not any(
+            c!=d and c in _ancestors(parents,d) for d in common)}
+        assert set(graph.mergeBases(a,b))==best
+    graph.close()
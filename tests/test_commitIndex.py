@@ -0,0 +1,74 @@
+"""
+Tests for commitIndex.py, against what "git rev-list" says
+"""
+import typing
+import pytest
+from gitTools.commitIndex import CommitIndex
+from gitTestRepos import initRepo,commit,git
+
+
+@pytest.fixture
+def index(tmp_path)->typing.Generator[CommitIndex,None,None]:
+    """
+    An index of a repo with a bit of history on two branches
+    """
+    repoPath=initRepo(str(tmp_path))
+    for i in range(6):
+        commit(repoPath,f'main {i}',{'a.txt':f'{i}\n'})
+    git(repoPath,'checkout','-q','-b','topic','HEAD~2')
+    for i in range(3):
+        commit(repoPath,f'topic {i}',{'b.txt':f'{i}\n'})
+    git(repoPath,'checkout','-q','main')
+    ret=CommitIndex(repoPath)
+    yield ret
+    ret.close()
+
+
+def _assertMatchesGit(index:CommitIndex,revs:typing.Tuple[str,...])->None:
+    """
+    The index gives exactly the commits (and parents) that git does
+    """
+    expected={}
+    for line in git(index.repoPath,'rev-list','--parents',*revs).splitlines():
+        hexsha,*parents=line.split()
+        expected[hexsha]=parents
+    actual={c.hash:list(c.parents) for c in index.commits(revs)}
+    assert actual==expected
+
+
+@pytest.mark.parametrize('revs',[('HEAD',),('--all',)])
+def test_rewrittenHistory(index,revs):
+    """
+    Commits that were rewritten away are no longer listed
+    """
+    repoPath=index.repoPath
+    _assertMatchesGit(index,revs)
+    git(repoPath,'reset','-q','--hard','HEAD~3')
+    for i in range(2):
+        commit(repoPath,f'rewritten {i}',{'a.txt':f'rewritten {i}\n'})
+    git(repoPath,'commit','-q','--amend','-m','amended')
+    _assertMatchesGit(index,revs)
+    git(repoPath,'rebase','-q','--onto','main','topic~3','topic')
+    git(repoPath,'checkout','-q','main')
+    _assertMatchesGit(index,revs)
+    git(repoPath,'branch','-q','-D','topic')
+    _assertMatchesGit(index,revs)
+
+
+def test_rewrittenAndPruned(index):
+    """
+    Same, when the old tips have been garbage collected
+    (so git can no longer exclude them)
+    """
+    repoPath=index.repoPath
+    revs=('--all',)
+    _assertMatchesGit(index,revs)
+    oldTips=index.indexedTips(revs)
+    git(repoPath,'branch','-q','-D','topic')
+    git(repoPath,'reset','-q','--hard','HEAD~4')
+    commit(repoPath,'rewritten',{'a.txt':'rewritten\n'})
+    git(repoPath,'reflog','expire','--expire=now','--all')
+    git(repoPath,'gc','-q','--prune=now')
+    assert not git(repoPath,'cat-file','--batch-check',
+        input='\n'.join(oldTips).encode('ascii')+b'\n').count(' commit ')
+    _assertMatchesGit(index,revs)
@@ -0,0 +1,219 @@
+"""
+Tests for commits.py
+"""
+import typing
+import os
+import time
+import random
+import subprocess
+import pytest
+from gitTools.backends import GitCliBackend,RecordingBackend
+from gitTools.commits import gitCommitsForLineRanges,gitCommitsForFunctions
+from gitTestRepos import initRepo,commit,git,fakeGit
+
+
+# a file with lots of repeated lines, as of each commit
+REPEATED_LINES_HISTORY=[
+    'b a a b a a c c a a b c b b c b c a c',
+    'b a a b a a c a a b c b b c b d a c',
+    'b a a b a a c a a b c b d c b c a',
+    'b a a b a a a a b c b d c b c a',
+    'b a a b a a a b c b d c b c',
+    'b a a c b a a b c b c d c b c',
+    'b a a c b a a b c c a d c b c',
+    'b a a a c b a a b c c a d c b c']
+
+
+def _git(repoPath:str,*args:str,**kwargs)->str:
+    return subprocess.run(['git','-C',repoPath,*args],
+        capture_output=True,text=True,check=True,**kwargs).stdout
+
+
+@pytest.fixture
+def repeatedLinesRepo(tmp_path)->str:
+    """
+    A repo where the same text keeps moving around
+    """
+    repoPath=str(tmp_path)
+    _git(repoPath,'init','-q')
+    for i,words in enumerate(REPEATED_LINES_HISTORY):
+        with open(os.path.join(repoPath,'f.txt'),'w',encoding='utf-8') as f:
+            f.write('\n'.join(words.split())+'\n')
+        date=f'{1600000000+i*60} +0000'
+        env=dict(os.environ,GIT_AUTHOR_DATE=date,GIT_COMMITTER_DATE=date)
+        _git(repoPath,'add','f.txt')
+        _git(repoPath,'-c','user.name=test','-c','user.email=test@test',
+            'commit','-q','-m',f'commit {i}',env=env)
+    return repoPath
+
+
+def _lineLog(
+    repoPath:str,
+    startLine:int,
+    endLine:int,
+    filename:str='f.txt'
+    )->typing.List[str]:
+    """
+    What git itself says for a single range
+    """
+    return _git(repoPath,'log','--format=%H',
+        f'-L{startLine},{endLine}:{filename}','-s').split()
+
+
+def test_lineRangesMatchGit(repeatedLinesRepo):
+    """
+    Overlapping, duplicate, and same-content ranges must each get
+    exactly the commits git gives for that range alone
+    """
+    ranges=[(9,9),(1,4),(3,9),(9,9),(6,8),(12,16),(2,3)]
+    filename=os.path.join(repeatedLinesRepo,'f.txt')
+    results=gitCommitsForLineRanges(repeatedLinesRepo,
+        [(filename,startLine,endLine) for startLine,endLine in ranges])
+    assert len(results)==len(ranges)
+    for (startLine,endLine),commits in zip(ranges,results):
+        assert sorted(commit.hash for commit in commits)== \
+            sorted(_lineLog(repeatedLinesRepo,startLine,endLine))
+
+
+@pytest.fixture
+def manyFilesRepo(tmp_path)->str:
+    """
+    A repo with several files, each changed here and there
+    """
+    repoPath=initRepo(str(tmp_path))
+    rand=random.Random(1)
+    files={f'f{i}.txt':[f'f{i} line {n}' for n in range(30)]
+        for i in range(5)}
+    for i in range(15):
+        for lines in rand.sample(list(files.values()),2):
+            for n in rand.sample(range(len(lines)),3):
+                lines[n]=f'changed in commit {i}'
+        commit(repoPath,f'commit {i}',
+            {name:'\n'.join(lines)+'\n' for name,lines in files.items()})
+    return repoPath
+
+
+def _assertLineRangesMatchGit(
+    repoPath:str,
+    ranges:typing.List[typing.Tuple[str,int,int]],
+    backend:RecordingBackend
+    )->None:
+    results=gitCommitsForLineRanges(repoPath,
+        [(os.path.join(repoPath,name),start,end) for name,start,end in ranges],
+        backend=backend)
+    assert len(results)==len(ranges)
+    for (name,startLine,endLine),commits in zip(ranges,results):
+        assert sorted(found.hash for found in commits)== \
+            sorted(_lineLog(repoPath,startLine,endLine,name))
+        for found in commits:
+            # (only its own file's patch)
+            assert found.logPatch.count('diff --git ')==1
+
+
+def _lineLogCount(backend:RecordingBackend)->int:
+    return sum(1 for run in backend.recording if run['args'][0]=='log')
+
+
+def test_lineRangesInManyFiles(manyFilesRepo):
+    """
+    Ranges in different files are batched into the same git log,
+    and still each get exactly the commits git gives for it alone
+    """
+    backend=RecordingBackend(GitCliBackend(manyFilesRepo))
+    ranges=[(f'f{i}.txt',start,start+4)
+        for start in (3,20) for i in range(5)]
+    _assertLineRangesMatchGit(manyFilesRepo,ranges,backend)
+    assert _lineLogCount(backend)==2
+
+
+def test_lineRangesAfterRenamesAndMerges(manyFilesRepo):
+    """
+    Same, where a batch can't be split up by filename
+    """
+    git(manyFilesRepo,'mv','f0.txt','renamed.txt')
+    commit(manyFilesRepo,'rename',{'f1.txt':'rewritten\n'*30})
+    git(manyFilesRepo,'checkout','-q','-b','side','HEAD~3')
+    commit(manyFilesRepo,'side',{'f2.txt':'side\n'*30})
+    git(manyFilesRepo,'checkout','-q','main')
+    git(manyFilesRepo,'merge','-q','-X','ours','-m','merge','side')
+    backend=RecordingBackend(GitCliBackend(manyFilesRepo))
+    ranges=[(name,start,start+4) for start in (3,20)
+        for name in ('renamed.txt','f1.txt','f2.txt','f3.txt','f4.txt')]
+    _assertLineRangesMatchGit(manyFilesRepo,ranges,backend)
+
+
+# a "git" that records its pid and then never finishes
+HANGING_GIT='''import os
+import sys
+import time
+pidFile=os.path.join(os.path.dirname(sys.argv[0]),f'{os.getpid()}.pid')
+with open(pidFile,'w'):
+    pass
+time.sleep(600)
+'''
+
+
+@pytest.fixture
+def hangingBackend(tmp_path)->GitCliBackend:
+    """
+    A backend on an empty repo whose git commands never finish
+    (they leave <pid>.pid files next to the git executable)
+    """
+    if os.name=='nt':
+        pytest.skip('needs an executable script')
+    binPath=str(tmp_path/'bin')
+    os.makedirs(binPath)
+    return GitCliBackend(initRepo(str(tmp_path/'repo')),
+        fakeGit(binPath,HANGING_GIT))
+
+
+def _runningPids(directory:str,count:int)->typing.List[int]:
+    """
+    Wait for count hanging gits to start, and return their pids
+    """
+    deadline=time.monotonic()+30
+    while time.monotonic()<deadline:
+        pids=[int(name[:-4]) for name in os.listdir(directory)
+            if name.endswith('.pid')]
+        if len(pids)>=count:
+            return pids
+        time.sleep(0.05)
+    raise AssertionError('hanging git never started')
+
+
+def _isRunning(pid:int)->bool:
+    """
+    Whether a process is still running (reaping it if it is a zombie)
+    """
+    try:
+        return os.waitpid(pid,os.WNOHANG)==(0,0)
+    except ChildProcessError:
+        return False
+
+
+def _assertKilled(pids:typing.Iterable[int])->None:
+    """
+    Wait for processes to die, failing if they take too long
+    """
+    deadline=time.monotonic()+10
+    while time.monotonic()<deadline:
+        if not any(_isRunning(pid) for pid in pids):
+            return
+        time.sleep(0.05)
+    raise AssertionError('git was left running')
+
+
+def test_cancelKillsRunningGit(hangingBackend):
+    directory=os.path.dirname(hangingBackend.gitExecutable)
+    started=time.monotonic()
+    def cancel()->bool:
+        # once both workers' gits are running
+        return len([name for name in os.listdir(directory)
+            if name.endswith('.pid')])>=2
+    results=gitCommitsForFunctions(hangingBackend.repoPath,'a.py',
+        ['f','g','h'],workers=2,cancel=cancel,backend=hangingBackend)
+    assert results=={}
+    assert time.monotonic()-started<30
+    pids=_runningPids(directory,2)
+    assert len(pids)==2 # nothing more was started after cancelling
+    _assertKilled(pids)
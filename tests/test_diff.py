@@ -0,0 +1,143 @@
+"""
+Tests for diff.py
+"""
+import typing
+import pytest
+from gitTools.diff import (
+    GitMultiDifferences,FILE_DIFF_HEADER,
+    decodeDiff,iterFileDiffs,notifyFileDiffs)
+from gitTestRepos import trickyDiffRepo,chunked,gitBytes
+
+
+@pytest.fixture(scope='module')
+def trickyDiff(tmp_path_factory)->typing.Tuple[bytes,typing.List[str]]:
+    """
+    The diff of the tricky branch, and the names of its files
+    according to git
+    """
+    repoPath=trickyDiffRepo(str(tmp_path_factory.mktemp('tricky')))
+    names=gitBytes(repoPath,'diff','--name-only','-z','main').decode('utf-8')
+    return gitBytes(repoPath,'diff','main'),names.split('\0')[:-1]
+
+
+# sizes to stream the diff in, including every size of split separator
+CHUNK_SIZES=[1,2,3,len(FILE_DIFF_HEADER),len(FILE_DIFF_HEADER)+1,13,4096]
+
+
+def test_wholeBufferBoundaries(trickyDiff):
+    """
+    The files of a complete diff are the ones git says
+    (and between them make up the whole diff)
+    """
+    data,names=trickyDiff
+    diff=GitMultiDifferences(data)
+    assert len(names)==13 and 'old name.txt' not in names # (renamed)
+    assert diff.filenames==names
+    assert b'\n'.join(bytes(diff.fileBytes(name)) for name in names)==data
+
+
+@pytest.mark.parametrize('spoolSize',[1,1024*1024*1024])
+@pytest.mark.parametrize('chunkSize',CHUNK_SIZES)
+def test_streamedBoundaries(trickyDiff,chunkSize,spoolSize):
+    """
+    Streaming a diff in (into a temporary file or memory)
+    finds the same files as reading it all at once
+    """
+    data,names=trickyDiff
+    whole=GitMultiDifferences(data)
+    streamed=GitMultiDifferences(chunked(data,chunkSize),spoolSize=spoolSize)
+    try:
+        assert streamed.filenames==names
+        assert bytes(streamed.raw)==data
+        for name in names:
+            assert streamed.fileBytes(name)==whole.fileBytes(name)
+    finally:
+        streamed.close()
+
+
+def _splitLines(data:bytes)->typing.List[bytes]:
+    """
+    Lines without their line endings (only "\\n" ones, so any "\\r" stays)
+    """
+    if data.endswith(b'\n'):
+        data=data[:-1]
+    return data.split(b'\n')
+
+
+def _hunkCount(fileData:bytes)->int:
+    return sum(1 for line in _splitLines(fileData) if line.startswith(b'@@ '))
+
+
+def test_hunksAndLines(trickyDiff):
+    """
+    The memoryview hunks and lines of a diff read into memory or
+    mmapped from a temporary file are the same, and match the text
+    """
+    data,names=trickyDiff
+    whole=GitMultiDifferences(data)
+    mapped=GitMultiDifferences(chunked(data,4096),spoolSize=1)
+    try:
+        assert [bytes(line) for line in mapped.lines()]==_splitLines(data)
+        for name in names:
+            fileData=bytes(whole.fileBytes(name))
+            hunks=[bytes(hunk) for hunk in whole.hunks(name)]
+            assert len(hunks)==_hunkCount(fileData)
+            if hunks:
+                assert fileData.endswith(b''.join(hunks))
+            assert [bytes(hunk) for hunk in mapped.hunks(name)]==hunks
+            assert [bytes(line) for line in whole.lines(name)]== \
+                [bytes(line) for line in mapped.lines(name)]== \
+                _splitLines(fileData)
+        assert _hunkCount(bytes(whole.fileBytes('plain.txt')))==3
+    finally:
+        mapped.close()
+
+
+def _wholeFileTexts(data:bytes)->typing.List[str]:
+    """
+    The text of each file, from the diff read all at once
+    """
+    whole=GitMultiDifferences(data)
+    return [decodeDiff(whole.fileBytes(name)) for name in whole.filenames]
+
+
+@pytest.mark.parametrize('chunkSize',CHUNK_SIZES)
+def test_iterFileDiffsBoundaries(trickyDiff,chunkSize):
+    """
+    Streaming a file at a time gives the same files
+    as reading the whole diff
+    """
+    data,_=trickyDiff
+    texts=[fileDiff._data # pylint: disable=W0212
+        for fileDiff in iterFileDiffs(chunked(data,chunkSize))]
+    assert texts==_wholeFileTexts(data)
+
+
+@pytest.mark.parametrize('chunkSize',CHUNK_SIZES)
+def test_notifyFileDiffsBoundaries(trickyDiff,chunkSize):
+    """
+    A diff passes through untouched, with each file announced
+    as soon as the start of the next one has been read
+    """
+    data,_=trickyDiff
+    pulled=0
+    def source()->typing.Iterator[bytes]:
+        nonlocal pulled
+        for chunk in chunked(data,chunkSize):
+            pulled+=len(chunk)
+            yield chunk
+    notified:typing.List[typing.Tuple[str,int]]=[]
+    def onFile(fileDiff)->None:
+        notified.append((fileDiff._data,pulled)) # pylint: disable=W0212
+    assert b''.join(notifyFileDiffs(source(),onFile))==data
+    assert [text for text,_ in notified]==_wholeFileTexts(data)
+    separator=b'\n'+FILE_DIFF_HEADER
+    nextFiles=[]
+    idx=data.find(separator)
+    while idx>=0:
+        nextFiles.append(idx+len(separator))
+        idx=data.find(separator,idx+1)
+    assert len(nextFiles)==len(notified)-1
+    for (_,at),nextFile in zip(notified,nextFiles):
+        assert nextFile<=at<nextFile+chunkSize
+    assert notified[-1][1]==len(data)
@@ -0,0 +1,105 @@
+"""
+Tests for diffLimits.py
+"""
+import typing
+import pytest
+from gitTools.diff import GitMultiDifferences,FILE_DIFF_HEADER
+from gitTools.diffLimits import (
+    DiffLimits,limitedDiff,_capFiles,
+    SKIP_BINARY,SKIP_FILE_SIZE,SKIP_TOTAL_SIZE)
+from gitTestRepos import trickyDiffRepo,chunked,gitBytes
+
+
+# sizes to stream the diff in, including every size of split separator
+CHUNK_SIZES=[1,2,3,len(FILE_DIFF_HEADER),len(FILE_DIFF_HEADER)+1,13,4096]
+# smaller than some of the tricky branch's file diffs
+MAX_FILE_BYTES=400
+
+
+@pytest.fixture(scope='module')
+def trickyRepo(tmp_path_factory)->str:
+    """
+    A repo whose tricky branch has a diff that is hard to split up
+    """
+    return trickyDiffRepo(str(tmp_path_factory.mktemp('tricky')))
+
+
+def _fileBytes(diff:GitMultiDifferences)->typing.Dict[str,bytes]:
+    """
+    {filename:diff} (without the newline that only some of them end with)
+    of the files that were not skipped
+    """
+    return {name:bytes(diff.fileBytes(name)).rstrip(b'\n')
+        for name in diff.filenames if name not in diff.skipped}
+
+
+def _cap(
+    data:bytes,
+    chunkSize:int,
+    maxFileBytes:typing.Optional[int],
+    maxTotalBytes:typing.Optional[int]
+    )->typing.Tuple[typing.Dict[str,bytes],typing.List[typing.Tuple[str,str,int]],typing.Set[str]]: # noqa: E501 # pylint: disable=line-too-long
+    """
+    Stream a diff through _capFiles
+
+    :return: (what was kept, what was skipped, what was seen)
+    """
+    skipped:typing.List[typing.Tuple[str,str,int]]=[]
+    seen:typing.Set[str]=set()
+    kept=b''.join(_capFiles(chunked(data,chunkSize),maxFileBytes,
+        maxTotalBytes,lambda *args:skipped.append(args),seen))
+    return _fileBytes(GitMultiDifferences(kept)),skipped,seen
+
+
+@pytest.mark.parametrize('chunkSize',CHUNK_SIZES)
+def test_capFilesBoundaries(trickyRepo,chunkSize):
+    """
+    However the diff streams in, the files over the size limit are
+    left out (with their full sizes) and the rest are passed
+    through untouched
+    """
+    data=gitBytes(trickyRepo,'diff','main')
+    whole=GitMultiDifferences(data)
+    names=whole.filenames
+    sizes={name:len(whole.fileBytes(name))+(name!=names[-1])
+        for name in names}
+    kept,skipped,seen=_cap(data,chunkSize,MAX_FILE_BYTES,None)
+    assert seen==set(names)
+    assert skipped==[(name,SKIP_FILE_SIZE,sizes[name])
+        for name in names if sizes[name]>MAX_FILE_BYTES]
+    assert 'big.txt' in [name for name,_,_ in skipped]
+    wholeFiles=_fileBytes(whole)
+    assert kept=={name:wholeFiles[name]
+        for name in names if sizes[name]<=MAX_FILE_BYTES}
+
+
+@pytest.mark.parametrize('chunkSize',CHUNK_SIZES)
+def test_capTotalBoundaries(trickyRepo,chunkSize):
+    """
+    Same for a total size limit, which stops the diff part way through
+    """
+    data=gitBytes(trickyRepo,'diff','main')
+    kept,skipped,seen=_cap(data,chunkSize,MAX_FILE_BYTES,1000)
+    assert (kept,skipped,seen)==_cap(data,len(data),MAX_FILE_BYTES,1000)
+    assert sum(len(d)+1 for d in kept.values())<=1000
+    assert skipped[-1][1]==SKIP_TOTAL_SIZE
+    assert len(seen)<len(GitMultiDifferences(data).filenames)
+
+
+def test_limitedDiffMatchesGit(trickyRepo):
+    """
+    A limited diff has every file git says changed, with the binary and
+    big ones as stubs and the rest just as they are in the full diff
+    """
+    full=_fileBytes(GitMultiDifferences(gitBytes(trickyRepo,'diff','main')))
+    diff=limitedDiff(trickyRepo,['diff'],['main'],
+        DiffLimits(maxFileBytes=MAX_FILE_BYTES))
+    assert sorted(diff.filenames)==sorted(full)
+    assert diff.skipped['image.bin'].reason==SKIP_BINARY
+    big=diff.skipped['big.txt']
+    assert (big.reason,big.added,big.removed)==(SKIP_FILE_SIZE,20000,0)
+    assert big.diffSize>MAX_FILE_BYTES
+    limited=_fileBytes(diff)
+    assert sorted([*limited,*diff.skipped])==sorted(full)
+    for name,data in limited.items():
+        assert data==full[name]
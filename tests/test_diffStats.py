@@ -0,0 +1,94 @@
+"""
+Tests for diffStats.py
+"""
+import typing
+import pytest
+from gitTools.diff import GitMultiDifferences
+from gitTools.diffStats import DiffStatsTable,diffLineCounts
+from gitTestRepos import trickyDiffRepo,chunked,gitBytes
+
+
+DIFF_A=b"""diff --git a/a.txt b/a.txt
+index 0000001..0000002 100644
+--- a/a.txt
++++ b/a.txt
+@@ -1,2 +1,2 @@
+-one
++ONE
+ two
+"""
+DIFF_B=b"""diff --git a/b.txt b/b.txt
+index 0000003..0000004 100644
+--- a/b.txt
++++ b/b.txt
+@@ -1 +1,3 @@
+ three
++four
++five
+"""
+
+
+def test_sameNamedDiffsAreSummed():
+    """
+    Diffs with the same name (here, none) are totalled
+    together by byDiff(), not overwritten
+    """
+    table=DiffStatsTable.fromDiffs(
+        [GitMultiDifferences(DIFF_A),GitMultiDifferences(DIFF_B)])
+    totals=table.totals()
+    assert (totals.added,totals.removed,totals.files)==(3,1,2)
+    byDiff=table.byDiff()
+    assert list(byDiff)==['']
+    assert (byDiff[''].added,byDiff[''].removed,byDiff[''].hunks,
+        byDiff[''].files)==(3,1,2,2)
+
+
+def _gitNumstat(
+    repoPath:str
+    )->typing.Dict[str,typing.Optional[typing.Tuple[int,int]]]:
+    """
+    What git says was {filename:(added,removed)} (None for a binary)
+    """
+    ret:typing.Dict[str,typing.Optional[typing.Tuple[int,int]]]={}
+    fields=gitBytes(repoPath,'diff','--numstat','-z','main').split(b'\0')
+    i=0
+    while i<len(fields)-1:
+        added,removed,name=fields[i].split(b'\t',2)
+        i+=1
+        if not name:
+            # a rename, followed by its old and new names
+            name=fields[i+1]
+            i+=2
+        ret[name.decode('utf-8')]=None if added==b'-' else \
+            (int(added),int(removed))
+    return ret
+
+
+@pytest.mark.parametrize('streamed',[False,True])
+def test_countsMatchGit(tmp_path,streamed):
+    """
+    The line counts of every file (read whole, or streamed into
+    an mmapped temporary file) are what git --numstat says
+    """
+    repoPath=trickyDiffRepo(str(tmp_path))
+    expected=_gitNumstat(repoPath)
+    data=gitBytes(repoPath,'diff','main')
+    if streamed:
+        diff=GitMultiDifferences(chunked(data,1000),spoolSize=1)
+    else:
+        diff=GitMultiDifferences(data)
+    counts=diffLineCounts(diff)
+    assert set(counts)==set(expected)
+    for filename,(added,removed,_,binary) in counts.items():
+        if expected[filename] is None:
+            assert binary
+        else:
+            assert not binary
+            assert (added,removed)==expected[filename]
+    table=DiffStatsTable()
+    table.add(diff)
+    totals=table.totals()
+    assert (totals.added,totals.removed)==(
+        sum(c[0] for c in expected.values() if c is not None),
+        sum(c[1] for c in expected.values() if c is not None))
+    diff.close()
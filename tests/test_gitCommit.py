@@ -0,0 +1,54 @@
+"""
+Tests for gitCommit.py
+"""
+import pytest
+from gitTools.gitCommit import GitCommit
+from gitTestRepos import initRepo,commit,merge,git
+
+
+@pytest.fixture
+def mergeRepo(tmp_path)->str:
+    """
+    A repo whose HEAD is a merge that only brings in "b"
+    (while "c" was added on the first-parent side)
+    """
+    repoPath=initRepo(str(tmp_path))
+    commit(repoPath,'add a',{'a.txt':'a\n'})
+    git(repoPath,'checkout','-q','-b','side')
+    commit(repoPath,'add b',{'b.txt':'b\n'})
+    git(repoPath,'checkout','-q','main')
+    commit(repoPath,'add c',{'c.txt':'c\n'})
+    merge(repoPath,'side')
+    return repoPath
+
+
+def test_mergeDiffIsFirstParent(mergeRepo):
+    """
+    A merge's diff is against its first parent only
+    """
+    head=git(mergeRepo,'rev-parse','HEAD').strip()
+    diff=GitCommit(head,localRepoPath=mergeRepo).diff
+    assert diff.filenames==['b.txt']
+
+
+def test_mergeLimitedDiffIsFirstParent(mergeRepo):
+    """
+    Same for a limitedDiff (whose file summary must not list
+    a file once per parent)
+    """
+    from gitTools.diffLimits import DiffLimits
+    head=git(mergeRepo,'rev-parse','HEAD').strip()
+    diff=GitCommit(head,localRepoPath=mergeRepo).limitedDiff(DiffLimits())
+    assert diff.filenames==['b.txt']
+
+
+def test_fileGithubUrl(mergeRepo):
+    """
+    A file diff links to the file as of its commit
+    """
+    head=git(mergeRepo,'rev-parse','HEAD').strip()
+    gitCommit=GitCommit(head,githubUrl='https://github.com/someone/repo',
+        localRepoPath=mergeRepo)
+    fileDiff=gitCommit.diff.fileDiff('b.txt')
+    assert str(fileDiff.githubUrl)== \
+        f'https://github.com/someone/repo/blob/{head}/b.txt'
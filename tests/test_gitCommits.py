@@ -0,0 +1,31 @@
+"""
+Tests for gitCommits.py
+"""
+import typing
+from gitTools.gitCommits import _ListSlice
+
+
+class _CountingList(list):
+    """
+    A list that counts how many items are looked at
+    """
+
+    def __init__(self,items:typing.Iterable):
+        """ """
+        super().__init__(items)
+        self.looked=0
+
+    def __getitem__(self,idx): # type: ignore
+        self.looked+=1
+        return super().__getitem__(idx)
+
+    def __iter__(self)->typing.Iterator:
+        for i in range(len(self)):
+            yield self[i]
+
+
+def test_sliceOnlyLooksAtItsOwnItems():
+    items=_CountingList(range(100000))
+    window=_ListSlice(items,99990,100000)[2:8]
+    assert list(window)==list(range(99992,99998))
+    assert items.looked==6
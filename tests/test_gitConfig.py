@@ -0,0 +1,86 @@
+"""
+Tests for gitConfig.py, against what "git config --list" says
+"""
+import typing
+import os
+import subprocess
+import pytest
+from gitTools.gitConfig import GitConfig
+from gitTestRepos import initRepo,git,writeFiles
+
+
+@pytest.fixture
+def configRepo(tmp_path,monkeypatch)->str:
+    """
+    A repo (with its own global config) whose config files
+    include each other in various ways
+    """
+    home=str(tmp_path/'home')
+    monkeypatch.setenv('HOME',home)
+    monkeypatch.setenv('GIT_CONFIG_NOSYSTEM','1')
+    monkeypatch.setenv('GIT_CONFIG_GLOBAL',os.path.join(home,'global'))
+    repoPath=initRepo(str(tmp_path/'Repo'))
+    writeFiles(home,{
+        'global':
+            '[user]\n\tname = Global Name\n'
+            '[include]\n\tpath = included/one\n'
+            '[includeIf "gitdir:~/"]\n\tpath = notUnderHome\n'
+            '[includeIf "gitdir:**/Repo/"]\n\tpath = ~/byGitDir\n',
+        'included/one':
+            '[core]\n\tpager = less\n'
+            '[include]\n\tpath = two\n',
+        'included/two':
+            '[alias]\n\tst = "status \\"-s\\"" ; comment\n'
+            '[multi]\n\tvalue = 1\n',
+        'notUnderHome':'[wrong]\n\tincluded = true\n',
+        'byGitDir':'[multi]\n\tvalue = 2\n\tflag\n'})
+    writeFiles(os.path.join(repoPath,'.git'),{
+        'onMain':'[Branch "Main"]\n\tWhere = main\n',
+        'onFeature':'[branch "feature"]\n\twhere = feature\n',
+        'caseless':'[multi]\n\tvalue = 3\n',
+        'caseful':'[wrong]\n\tcaseful = true\n'})
+    with open(os.path.join(repoPath,'.git','config'),'a',
+        encoding='utf-8') as f:
+        gitDir=os.path.join(repoPath,'.git').replace(os.sep,'/')
+        f.write(
+            '[includeIf "onbranch:main"]\n\tpath = onMain\n'
+            '[includeIf "onbranch:feature/"]\n\tpath = onFeature\n'
+            f'[includeIf "gitdir/i:{gitDir.upper()}"]\n\tpath = caseless\n'
+            f'[includeIf "gitdir:{gitDir.upper()}"]\n\tpath = caseful\n'
+            '[user]\n\tname = Local Name\n\temail = "a@b ; c"\n')
+    return repoPath
+
+
+def _gitConfigList(repoPath:str)->typing.List[typing.Tuple[str,typing.Optional[str]]]: # noqa: E501 # pylint: disable=line-too-long
+    """
+    What git says, as (key,value) with value None for a bare boolean
+
+    (not using git() which adds config of its own on the command line)
+    """
+    ret=[]
+    out=subprocess.run(['git','-C',repoPath,'config','--list','-z'],
+        capture_output=True,text=True,check=True).stdout
+    for entry in out.split('\0')[:-1]:
+        key,newline,value=entry.partition('\n')
+        ret.append((key,value if newline else None))
+    return ret
+
+
+def test_configMatchesGit(configRepo):
+    config=GitConfig(configRepo)
+    expected=_gitConfigList(configRepo)
+    assert ('multi.value','3') in expected
+    assert not any(key.startswith('wrong.') for key,_ in expected)
+    assert config.entries==expected
+    assert config.asDict()=={k:'' if v is None else v for k,v in expected}
+    assert config.getAll('multi.value')==['1','2','3']
+    assert config.get('user.name')=='Local Name'
+
+
+def test_onbranchFollowsCheckout(configRepo):
+    config=GitConfig(configRepo)
+    assert config.get('branch.Main.where')=='main'
+    git(configRepo,'checkout','-q','-b','feature/x')
+    expected=_gitConfigList(configRepo)
+    assert ('branch.feature.where','feature') in expected
+    assert config.entries==expected
@@ -0,0 +1,58 @@
+"""
+Tests for gitLogQuery.py
+"""
+import pytest
+from gitTools.gitLogQuery import GitLogQuery
+from gitTestRepos import initRepo,commit,git
+
+
+@pytest.fixture
+def fiveCommitRepo(tmp_path)->str:
+    """
+    A repo with five commits, one after the other
+    """
+    repoPath=initRepo(str(tmp_path))
+    for i in range(5):
+        commit(repoPath,f'commit {i}',{'f.txt':f'{i}\n'})
+    return repoPath
+
+
+def _hashes(commits)->list:
+    return [commit.hash for commit in commits]
+
+
+def test_reverseFirstIsOldest(fiveCommitRepo):
+    """
+    first() gives what iterating would give first
+    """
+    log=git(fiveCommitRepo,'log','--format=%H').split()
+    query=GitLogQuery(fiveCommitRepo)
+    assert query.first().hash==log[0]
+    assert query.reverse().first().hash==log[-1]
+    assert query.limit(0).first() is None
+    # (limit applies before reverse, the same as in git)
+    assert query.reverse().limit(2).first().hash==log[1]
+
+
+def test_reverseLimit(fiveCommitRepo):
+    """
+    limit() and skip() pick commits newest first, whichever way they
+    come back, the same as git log
+    """
+    query=GitLogQuery(fiveCommitRepo)
+    assert _hashes(query.reverse().limit(2))== \
+        git(fiveCommitRepo,'log','--format=%H','--reverse','-n2').split()
+    assert _hashes(query.reverse().skip(1).limit(2))== \
+        git(fiveCommitRepo,'log','--format=%H','--reverse',
+            '--skip=1','-n2').split()
+
+
+def test_reverseSetsTheOrder(fiveCommitRepo):
+    """
+    reverse() sets the order rather than toggling it
+    """
+    query=GitLogQuery(fiveCommitRepo)
+    oldestFirst=git(fiveCommitRepo,'log','--format=%H','--reverse').split()
+    assert _hashes(query.reverse())==oldestFirst
+    assert _hashes(query.reverse().reverse())==oldestFirst
+    assert _hashes(query.reverse().reverse(False))==oldestFirst[::-1]
@@ -0,0 +1,67 @@
+"""
+Tests for gitRepo.py
+"""
+import typing
+import pytest
+from gitTools.gitRepo import GitRepo
+from gitTools.diff import MultifileDiff,GitDifferences,decodeDiff
+from gitTools.diffLimits import DiffLimits
+from gitTestRepos import trickyDiffRepo,git
+
+
+@pytest.fixture(scope='module')
+def trickyRepo(tmp_path_factory)->GitRepo:
+    """
+    A repo whose tricky branch has a diff that is hard to split up
+    """
+    repoPath=trickyDiffRepo(str(tmp_path_factory.mktemp('tricky')))
+    git(repoPath,'remote','add','origin','https://github.com/someone/repo')
+    return GitRepo(repoPath)
+
+
+def _texts(diff:MultifileDiff)->typing.Dict[str,str]:
+    """
+    {filename:text} of every file in a diff
+    """
+    return {name:decodeDiff(diff.fileBytes(name)) for name in diff.filenames}
+
+
+def _datas(fileDiffs:typing.Iterable[GitDifferences])->typing.List[str]:
+    """
+    The text of each of a number of file diffs
+    """
+    return [fileDiff._data for fileDiff in fileDiffs] # pylint: disable=W0212
+
+
+def test_streamedDifferencesFromBranch(trickyRepo):
+    """
+    Streaming the differences from a branch, a file at a time or with
+    a callback, gives the same files as getting the whole diff
+    """
+    whole=trickyRepo.differencesFromBranch('main')
+    names=git(str(trickyRepo.repoPath),'diff','--name-only','-z','main')
+    assert whole.filenames==names.split('\0')[:-1]
+    expected=_texts(whole)
+    notified=[]
+    streamed=trickyRepo.differencesFromBranch('main',onFile=notified.append)
+    assert _texts(streamed)==expected
+    assert _datas(notified)==list(expected.values())
+    assert _datas(trickyRepo.iterDifferencesFromBranch('main'))== \
+        list(expected.values())
+
+
+def test_limitedDifferencesFromBranch(trickyRepo):
+    """
+    Same when files are left out, which still get announced (as stubs)
+    """
+    expected=_texts(trickyRepo.differencesFromBranch('main'))
+    notified=[]
+    limited=trickyRepo.differencesFromBranch('main',
+        DiffLimits(maxFileBytes=400),onFile=notified.append)
+    assert sorted(limited.filenames)==sorted(expected)
+    assert limited.skipped
+    assert len(notified)==len(expected)
+    for name in limited.filenames:
+        if name not in limited.skipped:
+            assert decodeDiff(limited.fileBytes(name)).rstrip('\n')== \
+                expected[name].rstrip('\n')
@@ -0,0 +1,102 @@
+"""
+Tests for objectStore.py, against what "git cat-file" says
+"""
+import typing
+import os
+import glob
+import pytest
+from gitTools.objectStore import GitObjectStore,_PackFile,OFS_DELTA,REF_DELTA
+from gitTestRepos import initRepo,commit,git,gitBytes
+
+
+@pytest.fixture
+def historyRepo(tmp_path,monkeypatch)->str:
+    """
+    A repo with a file that changes a little in each commit (so that
+    packing it makes delta chains), plus an annotated tag
+
+    (and any object store on it must not fall back on git)
+    """
+    monkeypatch.setattr(GitObjectStore,'fallback',property(
+        lambda self:pytest.fail('fell back on git cat-file')))
+    repoPath=initRepo(str(tmp_path))
+    lines=[f'line {i}' for i in range(200)]
+    for i in range(10):
+        lines[i*7]=f'changed in commit {i}'
+        commit(repoPath,f'commit {i}',{
+            'f.txt':'\n'.join(lines)+'\n',
+            'sub/g.txt':f'{i}\n'})
+    git(repoPath,'tag','-a','-m','a tag','v1')
+    return repoPath
+
+
+def _gitObjects(repoPath:str)->typing.Dict[str,typing.Tuple[str,bytes]]:
+    """
+    Every object in the repo, as {hash:(type,data)}
+    """
+    ret={}
+    data=gitBytes(repoPath,'cat-file','--batch-all-objects','--batch')
+    pos=0
+    while pos<len(data):
+        eol=data.index(b'\n',pos)
+        hexsha,objType,size=data[pos:eol].decode('ascii').split(' ')
+        pos=eol+1+int(size)
+        ret[hexsha]=(objType,data[eol+1:pos])
+        pos+=1
+    return ret
+
+
+def _packedTypes(repoPath:str)->typing.Set[int]:
+    """
+    The raw types of everything in the repo's packs
+    """
+    ret=set()
+    packDir=os.path.join(repoPath,'.git','objects','pack')
+    for idxFilename in glob.glob(os.path.join(packDir,'*.idx')):
+        pack=_PackFile(idxFilename)
+        try:
+            ret.update(pack.header(pack._offset(i))[0]
+                for i in range(pack.count))
+        finally:
+            pack.close()
+    return ret
+
+
+def _assertMatchesGit(repoPath:str)->None:
+    expected=_gitObjects(repoPath)
+    assert len(expected)>30
+    store=GitObjectStore(repoPath)
+    try:
+        for hexsha,(objType,data) in expected.items():
+            obj=store.read(hexsha)
+            assert obj is not None
+            assert (obj.hash,obj.type,obj.size)==(hexsha,objType,len(data))
+            assert obj.data==data
+    finally:
+        store.close()
+
+
+def test_looseObjects(historyRepo):
+    assert not _packedTypes(historyRepo)
+    _assertMatchesGit(historyRepo)
+
+
+def test_ofsDeltas(historyRepo):
+    git(historyRepo,'repack','-adfq')
+    types=_packedTypes(historyRepo)
+    assert OFS_DELTA in types and REF_DELTA not in types
+    _assertMatchesGit(historyRepo)
+
+
+def test_refDeltas(historyRepo):
+    git(historyRepo,'-c','repack.useDeltaBaseOffset=false','repack','-adfq')
+    types=_packedTypes(historyRepo)
+    assert REF_DELTA in types and OFS_DELTA not in types
+    _assertMatchesGit(historyRepo)
+
+
+def test_packedAndLoose(historyRepo):
+    git(historyRepo,'repack','-adq')
+    commit(historyRepo,'loose commit',{'f.txt':'replaced\n'})
+    assert _packedTypes(historyRepo)
+    _assertMatchesGit(historyRepo)